@@ -0,0 +1,174 @@
+"""Compares the precompiled FlatDetailExtractor with evaluating one XPath
+string per field, as parse_flat did before, on the recorded detail pages.
+
+Both parse the page into a fresh tree in every iteration. The items
+built from both are checked to be equal before timing.
+
+Run from the project directory:
+
+    python -m benchmarks.bench_parse_flat
+"""
+import re
+import time
+from pathlib import Path
+from typing import Callable
+
+from itemloaders.processors import TakeFirst
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from wg_gesucht.extractors import FlatDetailExtractor
+from wg_gesucht.items import FlatItem
+from wg_gesucht.loaders import FlatItemLoader
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+FIXTURES_DIR = Path(__file__).parent.parent / "tests" / "fixtures"
+DETAIL_PAGES = ["detail_page.html", "detail_page_chf.html"]
+ITERATIONS = 2000
+
+
+def parse_flat_per_field_xpath(response) -> FlatItem:
+    """parse_flat before the FlatDetailExtractor, kept as reference."""
+    flat_loader = FlatItemLoader(item=FlatItem(), response=response)
+    flat_loader.add_xpath("id", "//div/i/@data-ad_id")
+    flat_loader.add_value("url", response.request.url)
+    flat_loader.add_xpath("title", "//title/text()")
+    basic_facts = flat_loader.nested_xpath(
+        '//div[@id="basic_facts_wrapper"]/div[@id="rent_wrapper"]'
+    )
+    basic_facts.add_xpath(
+        "rooms",
+        './/div[@class="basic_facts_bottom_part"]/label[@class="amount"]/text()',
+    )
+    basic_facts.add_xpath(
+        "size", './/div[@class="basic_facts_top_part"]/label[@class="amount"]/text()'
+    )
+    flat_loader.add_xpath(
+        "rent_costs", '//div[@id="rent"]/label[@class="graph_amount"]/text()'
+    )
+    flat_loader.add_xpath(
+        "utilities_costs",
+        '//div[@id="utilities_costs"]/label[@class="graph_amount"]/text()',
+    )
+    flat_loader.add_xpath(
+        "additional_flat_costs",
+        '//div[@id="misc_costs"]/label[@class="graph_amount"]/text()',
+    )
+    provision = '//div[@class="provision-equipment"]'
+    description = '/label[@class="description"]/text()'
+    assert "kaution" in flat_loader.get_xpath(
+        f"{provision}[1]{description}", TakeFirst(), str.lower
+    )
+    assert "ablösevereinbarung" in flat_loader.get_xpath(
+        f"{provision}[2]{description}", TakeFirst(), str.lower
+    )
+    amount = '/label[@class="amount"]/text()'
+    flat_loader.add_xpath("deposit", f"{provision}[1]{amount}")
+    flat_loader.add_xpath("other_costs", f"{provision}[2]{amount}")
+    address_strings = response.xpath('//a[@href="#mapContainer"]/text()').getall()
+    flat_loader.add_value("street", address_strings[0])
+    postal_code, city_name = re.split(r"(?<=\d)\s", address_strings[1], maxsplit=1)
+    flat_loader.add_value("postal_code", postal_code)
+    flat_loader.add_value("city_name", city_name)
+    flat_loader.add_value(
+        "move_in_date", response.xpath('//div[@class="col-sm-3"]/p/b/text()').get()
+    )
+    return flat_loader.load_item()
+
+
+def extract_per_field_xpath(response) -> dict[str, list[str]]:
+    """Raw values as read by parse_flat_per_field_xpath."""
+    basic_facts = response.xpath(
+        '//div[@id="basic_facts_wrapper"]/div[@id="rent_wrapper"]'
+    )
+    provision = '//div[@class="provision-equipment"]'
+    return {
+        "id": response.xpath("//div/i/@data-ad_id").getall(),
+        "title": response.xpath("//title/text()").getall(),
+        "rooms": basic_facts.xpath(
+            './/div[@class="basic_facts_bottom_part"]/label[@class="amount"]/text()'
+        ).getall(),
+        "size": basic_facts.xpath(
+            './/div[@class="basic_facts_top_part"]/label[@class="amount"]/text()'
+        ).getall(),
+        "rent_costs": response.xpath(
+            '//div[@id="rent"]/label[@class="graph_amount"]/text()'
+        ).getall(),
+        "utilities_costs": response.xpath(
+            '//div[@id="utilities_costs"]/label[@class="graph_amount"]/text()'
+        ).getall(),
+        "additional_flat_costs": response.xpath(
+            '//div[@id="misc_costs"]/label[@class="graph_amount"]/text()'
+        ).getall(),
+        "deposit_description": response.xpath(
+            f'{provision}[1]/label[@class="description"]/text()'
+        ).get(),
+        "other_costs_description": response.xpath(
+            f'{provision}[2]/label[@class="description"]/text()'
+        ).get(),
+        "deposit": response.xpath(
+            f'{provision}[1]/label[@class="amount"]/text()'
+        ).getall(),
+        "other_costs": response.xpath(
+            f'{provision}[2]/label[@class="amount"]/text()'
+        ).getall(),
+        "address": response.xpath('//a[@href="#mapContainer"]/text()').getall(),
+        "move_in_date": response.xpath('//div[@class="col-sm-3"]/p/b/text()').getall(),
+    }
+
+
+def load_responses() -> list[HtmlResponse]:
+    url = "https://www.wg-gesucht.de/wohnungen-in-Koeln.1.html"
+    return [
+        HtmlResponse(
+            url=url,
+            body=(FIXTURES_DIR / file_name).read_bytes(),
+            encoding="utf-8",
+            request=Request(url),
+        )
+        for file_name in DETAIL_PAGES
+    ]
+
+
+def time_parser(parse: Callable[[HtmlResponse], object]) -> float:
+    """Returns: Parsed pages per second. Every page is parsed from scratch."""
+    responses = load_responses()
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for response in responses:
+            # a fresh response, so the lxml tree is built in every iteration
+            parse(response.replace())
+    return ITERATIONS * len(responses) / (time.perf_counter() - start)
+
+
+def main():
+    spider = WgGesuchtSpider()
+    search_settings = SearchSettings(city_name="Köln")
+
+    for response in load_responses():
+        legacy = dict(parse_flat_per_field_xpath(response))
+        current = dict(next(spider.parse_flat(response, search_settings)))
+        current.pop("meta")
+        assert legacy == current, f"Output differs for {response.url}"
+
+    legacy_rate = time_parser(extract_per_field_xpath)
+    current_rate = time_parser(
+        lambda response: FlatDetailExtractor.extract(response.selector.root)
+    )
+    print("value extraction incl. tree construction")
+    print(f"  per field xpath:      {legacy_rate:8.0f} pages/s")
+    print(f"  FlatDetailExtractor:  {current_rate:8.0f} pages/s")
+    print(f"  speedup:              {current_rate / legacy_rate:8.2f}x")
+
+    legacy_rate = time_parser(parse_flat_per_field_xpath)
+    current_rate = time_parser(
+        lambda response: next(spider.parse_flat(response, search_settings))
+    )
+    print("parse_flat incl. FlatItemLoader")
+    print(f"  per field xpath:      {legacy_rate:8.0f} pages/s")
+    print(f"  FlatDetailExtractor:  {current_rate:8.0f} pages/s")
+    print(f"  speedup:              {current_rate / legacy_rate:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Peak memory of parsing detail pages under high concurrency.
+
+The corpus is built from the recorded detail pages in tests/fixtures, padded
+with scripts, styles and ad cards to the size of live pages. Responses are
+held like in the scraper slot of scrapy: up to --concurrency at a time and,
+with the cap, no more bytes than SCRAPER_SLOT_MAX_ACTIVE_SIZE. Every variant
+runs in a fresh interpreter, so its peak RSS is its own:
+
+    python -m benchmarks.memory --pages 2000 --concurrency 64
+"""
+import argparse
+import contextlib
+import resource
+import subprocess
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Iterator, Optional
+from unittest import mock
+
+PROJECT_DIR = Path(__file__).parent.parent
+FIXTURES_DIR = PROJECT_DIR / "tests" / "fixtures"
+
+# name, strip pages, release trees, cap bytes in flight
+VARIANTS: list[tuple[str, bool, bool, bool]] = [
+    ("full pages", False, False, False),
+    ("release trees", False, True, False),
+    ("release trees + active size cap", False, True, True),
+    ("strip pages + release + cap", True, True, True),
+]
+
+
+def padded_page(body: bytes, size: int, flat_id: int) -> bytes:
+    """Returns: The page with unused elements appended up to about size bytes,
+    as found on live pages, and a unique flat id."""
+    filler: bytes = (
+        b"<script>window.dataLayer.push({'event': 'view', 'ad': 'x'});</script>\n"
+        b"<style>.wgg_card .mdi { margin: 0 4px; padding: 2px; }</style>\n"
+        b'<div class="wgg_card offer_list_item"><div class="card_body">'
+        b'<a href="/wohnungen-in-Koeln.1.html">Anzeige</a></div></div>\n'
+    )
+    padding: bytes = filler * max((size - len(body)) // len(filler), 0)
+    body = body.replace(b"10139965", str(flat_id).encode())
+    return body.replace(b"</body>", padding + b"</body>")
+
+
+def corpus(pages: int, page_size: int) -> Iterator[bytes]:
+    """Yields the pages one by one, each a new bytes object
+    like a downloaded body."""
+    templates: list[bytes] = [
+        path.read_bytes() for path in sorted(FIXTURES_DIR.glob("detail_page*.html"))
+    ]
+    for index in range(pages):
+        template: bytes = templates[index % len(templates)]
+        yield padded_page(template, page_size, 20000000 + index)
+
+
+def max_rss_kib() -> int:
+    """Returns: Peak resident memory of this process in KiB (on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_variant(
+    pages: int,
+    page_size: int,
+    concurrency: int,
+    max_active_size: Optional[int],
+    strip: bool,
+    release: bool,
+) -> str:
+    """Parses the corpus, called in the fresh interpreter of a variant.
+
+    Returns: Peak RSS before and while parsing, pages/s and the peak
+    bytes in flight, separated by spaces.
+    """
+    from scrapy import Request
+    from scrapy.http import HtmlResponse
+    from wg_gesucht.pages import strip_page
+    from wg_gesucht.search_settings import SearchSettings
+    from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+    spider = WgGesuchtSpider()
+    search_settings = SearchSettings(city_name="Köln")
+    in_flight: deque[tuple[HtmlResponse, object]] = deque()
+    active_size: int = 0
+    peak_active_size: int = 0
+    start_rss: int = max_rss_kib()
+    start = time.perf_counter()
+
+    keep_trees = mock.patch(
+        "wg_gesucht.spiders.wg_gesucht.release_parsed_page", lambda response: None
+    )
+    with contextlib.nullcontext() if release else keep_trees:
+        for index, body in enumerate(corpus(pages, page_size)):
+            if strip:
+                body = strip_page(body)
+            url = f"https://www.wg-gesucht.de/wohnungen-in-Koeln.{index}.html"
+            response = HtmlResponse(
+                url=url, body=body, encoding="utf-8", request=Request(url)
+            )
+            # held with its item until the pipeline is done, like in scrapy
+            in_flight.append(
+                (response, next(spider.parse_flat(response, search_settings)))
+            )
+            active_size += len(body)
+            peak_active_size = max(peak_active_size, active_size)
+            while len(in_flight) >= concurrency or (
+                max_active_size and active_size > max_active_size
+            ):
+                active_size -= len(in_flight.popleft()[0].body)
+
+    rate: float = pages / (time.perf_counter() - start)
+    return f"{start_rss} {max_rss_kib()} {rate:.0f} {peak_active_size}"
+
+
+def main(args: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, default=2000, help="size of the corpus")
+    parser.add_argument(
+        "--page-kib", type=int, default=150, help="size of a page (default: 150)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="responses held at most"
+    )
+    parser.add_argument(
+        "--max-active-size",
+        type=int,
+        default=None,
+        help="bytes in flight of the capped variant"
+        " (default: SCRAPER_SLOT_MAX_ACTIVE_SIZE of the settings)",
+    )
+    parser.add_argument("--variant", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args(args)
+
+    if options.max_active_size is None:
+        from wg_gesucht import settings
+
+        options.max_active_size = settings.SCRAPER_SLOT_MAX_ACTIVE_SIZE
+
+    if options.variant is not None:
+        _, strip, release, capped = VARIANTS[options.variant]
+        print(
+            run_variant(
+                pages=options.pages,
+                page_size=options.page_kib * 1024,
+                concurrency=options.concurrency,
+                max_active_size=options.max_active_size if capped else None,
+                strip=strip,
+                release=release,
+            )
+        )
+        return 0
+
+    print(
+        f"{options.pages} pages of {options.page_kib} KiB,"
+        f" concurrency {options.concurrency}"
+    )
+    print(
+        f"{'variant':<36} {'peak RSS MiB':>12} {'parsing MiB':>12}"
+        f" {'pages/s':>8} {'in flight KiB':>14}"
+    )
+    for index, (name, *_) in enumerate(VARIANTS):
+        output: str = subprocess.run(
+            [sys.executable, "-m", "benchmarks.memory", *(args or sys.argv[1:])]
+            + ["--variant", str(index)],
+            cwd=PROJECT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        start_rss, peak_rss, rate, active_size = map(
+            float, output.strip().splitlines()[-1].split()
+        )
+        parsing_rss: float = peak_rss - start_rss
+        print(
+            f"{name:<36} {peak_rss / 1024:>12.1f} {parsing_rss / 1024:>12.1f}"
+            f" {rate:>8.0f} {active_size / 1024:>14.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
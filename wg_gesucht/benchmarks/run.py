@@ -0,0 +1,310 @@
+"""Offline benchmarks of the hot paths on the recorded pages in tests/fixtures.
+
+Reports items/s and the peak memory allocated per benchmark. Results can be
+saved as json and compared to an earlier run to catch regressions:
+
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json --tolerance 0.2
+
+Exits with 1 if a benchmark got slower than the tolerance allows.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+from unittest import mock
+
+import mongomock
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from wg_gesucht.extractors import FlatDetailExtractor
+from wg_gesucht.items import FlatItem
+from wg_gesucht.loaders import FlatItemLoader
+from wg_gesucht.metrics import CallbackTimingMiddleware, CrawlMetrics
+from wg_gesucht.pipelines import WgGesuchtPipeline
+from wg_gesucht.records import FlatRecord
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+FIXTURES_DIR = Path(__file__).parent.parent / "tests" / "fixtures"
+SEARCH_SETTINGS = SearchSettings(city_name="Köln")
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    items_per_second: float
+    peak_memory_kib: float
+
+
+@dataclass
+class Benchmark:
+    """Callable processing a fixed amount of items per run."""
+
+    name: str
+    run: Callable[[], object]
+    items_per_run: int
+
+
+def load_response(file_name: str, url: str, **request_kwargs) -> HtmlResponse:
+    return HtmlResponse(
+        url=url,
+        body=(FIXTURES_DIR / file_name).read_bytes(),
+        encoding="utf-8",
+        request=Request(url=url, **request_kwargs),
+    )
+
+
+def fresh(responses: list[HtmlResponse]) -> Iterable[HtmlResponse]:
+    """Copies of the responses, so every run parses the pages again."""
+    return (response.replace() for response in responses)
+
+
+def city_response_benchmarks(spider: WgGesuchtSpider) -> list[Benchmark]:
+    response = load_response(
+        "get_cities.json", "https://www.wg-gesucht.de/ajax/getCities.php?query=K"
+    )
+    return [
+        Benchmark(
+            name="parse_city_response",
+            run=lambda: list(spider.parse_city_response(response, SEARCH_SETTINGS)),
+            items_per_run=1,
+        )
+    ]
+
+
+def results_page_benchmarks(spider: WgGesuchtSpider) -> list[Benchmark]:
+    responses = [
+        load_response(
+            "results_page.html",
+            "https://www.wg-gesucht.de/"
+            "1-zimmer-wohnungen-und-wohnungen-in-Koeln.73.1+2.1.0.html",
+        )
+    ]
+    cards = len(list(spider.parse_flat_detail_links(responses[0], SEARCH_SETTINGS)))
+    return [
+        Benchmark(
+            name="parse_flat_detail_links",
+            run=lambda: [
+                list(spider.parse_flat_detail_links(response, SEARCH_SETTINGS))
+                for response in fresh(responses)
+            ],
+            items_per_run=cards * len(responses),
+        )
+    ]
+
+
+def detail_page_responses() -> list[HtmlResponse]:
+    return [
+        load_response(path.name, f"https://www.wg-gesucht.de/{path.stem}.html")
+        for path in sorted(FIXTURES_DIR.glob("detail_page*.html"))
+    ]
+
+
+def detail_page_benchmarks(spider: WgGesuchtSpider) -> list[Benchmark]:
+    responses = detail_page_responses()
+    # metrics are meant to stay on, their overhead shows in the timed variant
+    timing = CallbackTimingMiddleware(CrawlMetrics(crawler=None))
+    return [
+        Benchmark(
+            name="parse_flat",
+            run=lambda: [
+                next(spider.parse_flat(response, SEARCH_SETTINGS))
+                for response in fresh(responses)
+            ],
+            items_per_run=len(responses),
+        ),
+        Benchmark(
+            name="parse_flat[timed]",
+            run=lambda: [
+                list(
+                    timing.process_spider_output(
+                        response, spider.parse_flat(response, SEARCH_SETTINGS), spider
+                    )
+                )
+                for response in fresh(responses)
+            ],
+            items_per_run=len(responses),
+        ),
+    ]
+
+
+def processor_benchmarks() -> list[Benchmark]:
+    """One benchmark per input processor of the FlatItemLoader,
+    fed with the raw values of the recorded detail pages."""
+    raw_values: dict[str, list[list[str]]] = {}
+    for response in detail_page_responses():
+        values = FlatDetailExtractor.extract(response.selector.root)
+        street, postal_code_and_city = values["address"][:2]
+        postal_code, city_name = postal_code_and_city.strip().split(" ", 1)
+        values.update(street=[street], postal_code=[postal_code], city_name=[city_name])
+        for field, value in values.items():
+            raw_values.setdefault(field, []).append(value)
+
+    loader = FlatItemLoader(item=FlatItem())
+    benchmarks: list[Benchmark] = []
+    for field in FlatItem.fields:
+        processor = loader.get_input_processor(field)
+        field_values: list[list[str]] = raw_values.get(field, [])
+        if not field_values or processor is loader.default_input_processor:
+            continue
+        benchmarks.append(
+            Benchmark(
+                name=f"FlatItemLoader.{field}_in",
+                run=lambda processor=processor, field_values=field_values: [
+                    processor(value) for value in field_values
+                ],
+                items_per_run=len(field_values),
+            )
+        )
+    return benchmarks
+
+
+def record_benchmarks(spider: WgGesuchtSpider) -> list[Benchmark]:
+    """Conversion of items to the records buffered by the pipeline.
+    The peak memory shows what a full buffer of 500 flats holds."""
+    items: list[FlatItem] = [
+        next(spider.parse_flat(response, SEARCH_SETTINGS))
+        for response in detail_page_responses()
+    ]
+    return [
+        Benchmark(
+            name="FlatRecord.from_item[buffer=500]",
+            run=lambda: [
+                FlatRecord.from_item(item) for _ in range(250) for item in items
+            ],
+            items_per_run=250 * len(items),
+        )
+    ]
+
+
+def pipeline_benchmarks(spider: WgGesuchtSpider) -> list[Benchmark]:
+    """process_item against an in-process MongoDB stand-in.
+    Every run writes new flats, half of them are duplicates."""
+    items: list[FlatItem] = [
+        next(spider.parse_flat(response, SEARCH_SETTINGS))
+        for response in detail_page_responses()
+    ]
+    benchmarks: list[Benchmark] = []
+    for batch_size in (1, 50):
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017", "benchmark", batch_size=batch_size
+        )
+        counter = iter(range(sys.maxsize))
+
+        def run(pipeline=pipeline, counter=counter):
+            for _ in range(50):
+                flat_id = str(next(counter) // 2)
+                for item in items:
+                    pipeline.process_item(
+                        FlatItem(item, id=f"{item['id']}-{flat_id}"), spider
+                    )
+            pipeline.flush()
+
+        benchmarks.append(
+            Benchmark(
+                name=f"WgGesuchtPipeline.process_item[batch_size={batch_size}]",
+                run=run,
+                items_per_run=50 * len(items),
+            )
+        )
+    return benchmarks
+
+
+def measure(benchmark: Benchmark, min_seconds: float) -> BenchmarkResult:
+    benchmark.run()  # warm up
+
+    runs = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_seconds:
+        benchmark.run()
+        runs += 1
+
+    # separate run, tracing allocations slows down the code
+    tracemalloc.start()
+    benchmark.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return BenchmarkResult(
+        name=benchmark.name,
+        items_per_second=runs * benchmark.items_per_run / elapsed,
+        peak_memory_kib=peak / 1024,
+    )
+
+
+def compare(
+    results: list[BenchmarkResult], baseline_path: str, tolerance: float
+) -> bool:
+    """Prints the change to the baseline.
+
+    Returns: False if a benchmark is slower than the tolerance allows.
+    """
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline: dict[str, dict] = {
+            result["name"]: result for result in json.load(baseline_file)
+        }
+
+    passed = True
+    for result in results:
+        if result.name not in baseline:
+            continue
+        change = result.items_per_second / baseline[result.name]["items_per_second"]
+        regressed = change < 1 - tolerance
+        passed = passed and not regressed
+        print(
+            f"{result.name:<55} {change - 1:+8.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return passed
+
+
+def main(args: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="per benchmark")
+    parser.add_argument("--filter", default="", help="only names containing this")
+    parser.add_argument("--save", help="write the results as json to this path")
+    parser.add_argument("--compare", help="json results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    options = parser.parse_args(args)
+
+    spider = WgGesuchtSpider()
+    with mock.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient):
+        benchmarks: list[Benchmark] = [
+            *city_response_benchmarks(spider),
+            *results_page_benchmarks(spider),
+            *detail_page_benchmarks(spider),
+            *processor_benchmarks(),
+            *record_benchmarks(spider),
+            *pipeline_benchmarks(spider),
+        ]
+        results: list[BenchmarkResult] = [
+            measure(benchmark, options.seconds)
+            for benchmark in benchmarks
+            if options.filter in benchmark.name
+        ]
+
+    print(f"{'benchmark':<55} {'items/s':>12} {'peak KiB':>10}")
+    for result in results:
+        print(
+            f"{result.name:<55} {result.items_per_second:>12.0f}"
+            f" {result.peak_memory_kib:>10.1f}"
+        )
+
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as results_file:
+            json.dump([asdict(result) for result in results], results_file, indent=2)
+
+    if options.compare:
+        print()
+        if not compare(results, options.compare, options.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Startup cost of the project, for short scheduled runs.
+
+Every measurement runs in a fresh interpreter, so imports are cold:
+
+    python -m benchmarks.startup --runs 5
+
+Also counts the database commands the pipeline sends before the first flat,
+which each cost a round trip to the database.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+from unittest import mock
+
+import mongomock
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+# name and python code run in a fresh interpreter
+IMPORTS: list[tuple[str, str]] = [
+    ("python", "pass"),
+    ("import settings", "import wg_gesucht.settings"),
+    ("import spider", "import wg_gesucht.spiders.wg_gesucht"),
+    ("import pipelines", "import wg_gesucht.pipelines"),
+]
+COMMANDS: list[tuple[str, list[str]]] = [
+    ("scrapy list", [sys.executable, "-m", "scrapy.cmdline", "list"]),
+    ("scrapy daemon -h", [sys.executable, "-m", "scrapy.cmdline", "daemon", "-h"]),
+]
+
+
+def best_wall_time(command: list[str], runs: int) -> float:
+    """Returns: Fastest wall time of the command in milliseconds."""
+    times: list[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=PROJECT_DIR,
+            env={**os.environ, "PYTHONWARNINGS": "ignore"},
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def count_start_commands(ensure_indexes: bool, prepared: bool) -> int:
+    """Returns: Database commands sent by the pipeline before the first flat."""
+    from wg_gesucht.pipelines import WgGesuchtPipeline
+
+    calls: list[str] = []
+
+    def counting(name: str, method):
+        def wrapper(self, *args, **kwargs):
+            calls.append(name)
+            return method(self, *args, **kwargs)
+
+        return wrapper
+
+    with mock.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient):
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017", "benchmark", ensure_indexes=False
+        )
+    if prepared:
+        pipeline.bootstrap_database()
+
+    pipeline._ensure_indexes = ensure_indexes
+    with mock.patch.multiple(
+        mongomock.Collection,
+        index_information=counting(
+            "listIndexes", mongomock.Collection.index_information
+        ),
+        create_indexes=counting("createIndexes", mongomock.Collection.create_indexes),
+    ), mock.patch.object(
+        mongomock.Database, "command", counting("ping", mongomock.Database.command)
+    ):
+        pipeline._prepare_database()
+    return len(calls)
+
+
+def main(args: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="best of this many")
+    options = parser.parse_args(args)
+
+    print(f"{'startup':<40} {'ms':>10}")
+    for name, code in IMPORTS:
+        wall_time = best_wall_time([sys.executable, "-c", code], options.runs)
+        print(f"{name:<40} {wall_time:>10.0f}")
+    for name, command in COMMANDS:
+        print(f"{name:<40} {best_wall_time(command, options.runs):>10.0f}")
+
+    print()
+    print(f"{'pipeline start':<40} {'db commands':>12}")
+    for name, ensure_indexes, prepared in [
+        ("new database", True, False),
+        ("indexes exist", True, True),
+        ("DB_ENSURE_INDEXES = False", False, True),
+    ]:
+        commands = count_start_commands(ensure_indexes, prepared)
+        print(f"{name:<40} {commands:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def load_response():
+    """Returns a function building a response from a recorded page."""
+
+    def _load_response(file_name: str, url: str, **request_kwargs) -> HtmlResponse:
+        return HtmlResponse(
+            url=url,
+            body=(FIXTURES_DIR / file_name).read_bytes(),
+            encoding="utf-8",
+            request=Request(url=url, **request_kwargs),
+        )
+
+    return _load_response
@@ -0,0 +1,166 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+from wg_gesucht.archive import (
+    ResponseArchive,
+    parse_flat_records,
+    read_archive,
+    replay_archive,
+    to_response,
+)
+from wg_gesucht.items import FlatItem
+from wg_gesucht.middlewares import ResponseArchiveMiddleware
+from wg_gesucht.pipelines import WgGesuchtPipeline
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+DETAIL_URL = "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html"
+RECORDED_AT = datetime(2023, 6, 10, 7, 32)
+
+
+@pytest.fixture
+def detail_response(load_response):
+    spider = WgGesuchtSpider()
+    return load_response(
+        "detail_page.html",
+        DETAIL_URL,
+        callback=spider.parse_flat,
+        cb_kwargs={"search_settings": SearchSettings(city_name="Köln")},
+    )
+
+
+@pytest.fixture
+def archive_path(tmp_path, detail_response, load_response):
+    archive = ResponseArchive(tmp_path / "responses.jsonl.gz")
+    archive.record(detail_response, recorded_at=RECORDED_AT)
+    archive.record(load_response("results_page.html", "https://www.wg-gesucht.de/"))
+    archive.close()
+    return archive.path
+
+
+class TestResponseArchive:
+    def test_roundtrip(self, archive_path, detail_response):
+        records = list(read_archive([archive_path]))
+
+        assert len(records) == 2
+        assert records[0]["callback"] == "parse_flat"
+        assert records[0]["search_city_name"] == "Köln"
+        response = to_response(records[0])
+        assert response.url == DETAIL_URL
+        assert response.body == detail_response.body
+
+    def test_appends(self, archive_path, detail_response):
+        archive = ResponseArchive(archive_path)
+        archive.record(detail_response)
+        archive.close()
+
+        assert len(list(read_archive([archive_path.parent]))) == 3
+
+    def test_reads_up_to_cut_off(self, archive_path):
+        data = archive_path.read_bytes()
+        archive_path.write_bytes(data[: len(data) - 20])
+
+        assert len(list(read_archive([archive_path]))) <= 1
+
+    def test_middleware(self, tmp_path, detail_response):
+        crawler = get_crawler(
+            settings_dict={"ARCHIVE_ENABLED": True, "ARCHIVE_DIR": str(tmp_path)}
+        )
+        middleware = ResponseArchiveMiddleware.from_crawler(crawler)
+
+        assert (
+            middleware.process_response(detail_response.request, detail_response, None)
+            is detail_response
+        )
+        middleware.spider_closed(None)
+
+        assert [record["url"] for record in read_archive([tmp_path])] == [DETAIL_URL]
+        assert crawler.stats.get_value("archive/responses") == 1
+
+    def test_middleware_disabled_by_default(self):
+        with pytest.raises(NotConfigured):
+            ResponseArchiveMiddleware.from_crawler(get_crawler())
+
+
+class TestReplay:
+    def test_parse_flat_records(self, archive_path):
+        flats = parse_flat_records(list(read_archive([archive_path]))[:1])
+
+        assert flats[0]["id"] == "10139965"
+        assert flats[0]["meta"] == {
+            "found_at": RECORDED_AT,
+            "search_city_name": "Köln",
+        }
+
+    def test_replay_into_pipeline(self, archive_path, mocker):
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        pipeline = WgGesuchtPipeline("mongodb://localhost:27017", "test_db")
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            count = replay_archive(
+                [archive_path],
+                executor,
+                lambda flat: pipeline.process_item(FlatItem(flat), None),
+            )
+
+        assert count == 1
+        assert pipeline.inserted_count == 1
+        stored = pipeline._collection.find_one({"id": "10139965"})
+        assert stored["meta"]["found_at"] == RECORDED_AT
+
+    @pytest.mark.parametrize("keep_newer_stored", [True, False])
+    def test_replay_keeps_newer_stored_flats(
+        self, archive_path, mocker, keep_newer_stored
+    ):
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017",
+            "test_db",
+            keep_newer_stored=keep_newer_stored,
+        )
+        pipeline._collection.insert_one(
+            {
+                "id": "10139965",
+                "title": "Newer",
+                "meta": {"written_at": RECORDED_AT + timedelta(days=1)},
+            }
+        )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            replay_archive(
+                [archive_path],
+                executor,
+                lambda flat: pipeline.process_item(FlatItem(flat), None),
+            )
+
+        stored = pipeline._collection.find_one({"id": "10139965"})
+        if keep_newer_stored:
+            assert pipeline.updated_count == 0
+            assert stored["title"] == "Newer"
+            assert "changes" not in stored["meta"]
+        else:
+            assert pipeline.updated_count == 1
+            assert stored["title"] != "Newer"
+
+    def test_replay_keeps_record_order(self, archive_path, detail_response):
+        archive = ResponseArchive(archive_path)
+        for _ in range(4):
+            archive.record(detail_response)
+        archive.close()
+        flats = []
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            replay_archive(
+                [archive_path],
+                executor,
+                flats.append,
+                batch_size=1,
+                max_pending_batches=2,
+            )
+
+        assert len(flats) == 5
+        assert flats[0]["meta"]["found_at"] == RECORDED_AT
@@ -0,0 +1,30 @@
+from wg_gesucht.city_id_cache import CityIdCache
+
+
+class TestCityIdCache:
+    def test_get_missing(self, tmp_path):
+        cache = CityIdCache(path=tmp_path / "city_ids.json", ttl=60)
+        assert cache.get("Berlin") is None
+
+    def test_set_is_persisted(self, tmp_path):
+        path = tmp_path / "cache" / "city_ids.json"
+        CityIdCache(path=path, ttl=60).set("Köln", "73")
+
+        cache = CityIdCache(path=path, ttl=60)
+        assert cache.get("Köln") == "73"
+        assert cache.get(" köln ") == "73"
+
+    def test_get_expired(self, tmp_path, mocker):
+        cache = CityIdCache(path=tmp_path / "city_ids.json", ttl=60)
+        mocker.patch("wg_gesucht.city_id_cache.time.time", return_value=1000)
+        cache.set("Köln", "73")
+
+        mocker.patch("wg_gesucht.city_id_cache.time.time", return_value=1061)
+        assert cache.get("Köln") is None
+
+    def test_unreadable_file_is_ignored(self, tmp_path):
+        path = tmp_path / "city_ids.json"
+        path.write_text("{not json")
+
+        cache = CityIdCache(path=path, ttl=60)
+        assert cache.get("Köln") is None
@@ -1,7 +1,19 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import mongomock
 import pytest
 from pymongo.errors import ConfigurationError, ServerSelectionTimeoutError, WriteError
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.misc import load_object
+from scrapy.utils.test import get_crawler
+from wg_gesucht.db_settings import DatabaseSettings
 from wg_gesucht.items import FlatItem
-from wg_gesucht.pipelines import WgGesuchtPipeline
+from wg_gesucht.pipelines import AsyncWgGesuchtPipeline, WgGesuchtPipeline
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.seen_flats import SeenFlatIds
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
 
 
 @pytest.fixture
@@ -19,6 +31,21 @@ def db_pipeline() -> WgGesuchtPipeline:
     pipeline._client.close()
 
 
+@pytest.fixture
+def batch_pipeline(mocker) -> WgGesuchtPipeline:
+    """Pipeline in buffered mode backed by an in-process MongoDB stand-in."""
+    mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+    pipeline = WgGesuchtPipeline(
+        "mongodb://localhost:27017",
+        "test_db",
+        "test_collection",
+        batch_size=3,
+        flush_interval=60,
+    )
+    yield pipeline
+    pipeline._client.close()
+
+
 def test_init_with_valid_connection():
     """Mongo Instance has to be running for this"""
     pipeline = WgGesuchtPipeline(
@@ -97,3 +124,357 @@ def test_persistence_error(db_pipeline: WgGesuchtPipeline, mocker):
         db_pipeline.process_item(item, None)
 
     assert db_pipeline._collection.count_documents({}) == 0
+
+
+def test_insert_error_is_logged(batch_pipeline: WgGesuchtPipeline, mocker, caplog):
+    """Asserts that the error of a failed insert is in the log."""
+    mocker.patch.object(
+        batch_pipeline._collection,
+        "insert_one",
+        side_effect=WriteError(error="disk full", code=14031),
+    )
+
+    batch_pipeline.process_item(FlatItem(id="1"), None)
+    batch_pipeline.flush()
+
+    assert (
+        "Encountered unexpected error while persisting flat: disk full" in caplog.text
+    )
+    assert batch_pipeline.inserted_count == 0
+
+
+def test_batch_buffers_until_full(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that items are only written once the batch is full."""
+    for flat_id in ["1", "2"]:
+        batch_pipeline.process_item(FlatItem(id=flat_id), None)
+    assert batch_pipeline._collection.count_documents({}) == 0
+
+    batch_pipeline.process_item(FlatItem(id="3"), None)
+    assert batch_pipeline._collection.count_documents({}) == 3
+    assert batch_pipeline.inserted_count == 3
+
+
+def test_batch_counts_duplicates(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that duplicates inside a batch are counted and do not
+    stop the other inserts of the batch."""
+    batch_pipeline._collection.insert_one({"id": "1"})
+
+    for flat_id in ["1", "2", "2"]:
+        batch_pipeline.process_item(FlatItem(id=flat_id), None)
+
+    assert batch_pipeline._collection.count_documents({}) == 2
+    assert batch_pipeline.inserted_count == 1
+    assert batch_pipeline.duplicate_count == 2
+
+
+def test_batch_flushed_after_interval(batch_pipeline: WgGesuchtPipeline, mocker):
+    """Asserts that a partial batch is written once the interval passed."""
+    batch_pipeline.process_item(FlatItem(id="1"), None)
+    assert batch_pipeline._collection.count_documents({}) == 0
+
+    mocker.patch(
+        "wg_gesucht.pipelines.time.monotonic",
+        return_value=batch_pipeline._last_flush + 61,
+    )
+    batch_pipeline.process_item(FlatItem(id="2"), None)
+    assert batch_pipeline._collection.count_documents({}) == 2
+
+
+def test_batch_flushed_on_close(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that remaining buffered items are written on close."""
+    batch_pipeline.process_item(FlatItem(id="1"), None)
+    batch_pipeline.close_spider(None)
+
+    assert batch_pipeline._collection.count_documents({}) == 1
+
+
+def test_open_spider_loads_seen_flat_ids(batch_pipeline: WgGesuchtPipeline, mocker):
+    """Asserts that the stored flat ids are handed to the spider."""
+    batch_pipeline._collection.insert_many([{"id": "1"}, {"id": "2"}])
+    spider = mocker.Mock(settings=Settings({"SKIP_SEEN_FLATS": True}))
+
+    batch_pipeline.open_spider(spider)
+    batch_pipeline._flush_task.stop()
+
+    assert len(spider.seen_flat_ids) == 2
+    assert "1" in spider.seen_flat_ids
+
+
+def test_changed_flat_is_updated(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that a stored flat is updated if its content changed."""
+    batch_pipeline.process_item(
+        FlatItem(id="1", title="Old", rent_costs={"value": 500.0, "currency": "EUR"}),
+        None,
+    )
+    batch_pipeline.flush()
+    stored_hash = batch_pipeline._collection.find_one({"id": "1"})["meta"][
+        "content_hash"
+    ]
+
+    batch_pipeline.process_item(FlatItem(id="1", title="New"), None)
+    batch_pipeline.flush()
+
+    stored = batch_pipeline._collection.find_one({"id": "1"})
+    assert batch_pipeline._collection.count_documents({}) == 1
+    assert batch_pipeline.updated_count == 1
+    assert stored["title"] == "New"
+    assert "rent_costs" not in stored
+    assert stored["meta"]["content_hash"] != stored_hash
+    assert stored["meta"]["changes"][0]["fields"] == ["rent_costs", "title"]
+    assert stored["meta"]["written_at"] == stored["meta"]["changes"][0]["at"]
+
+
+def test_unchanged_flat_is_not_written(batch_pipeline: WgGesuchtPipeline, mocker):
+    """Asserts that an unchanged flat is counted as duplicate
+    and only its last sighting is written."""
+    batch_pipeline.process_item(FlatItem(id="1", title="Same"), None)
+    batch_pipeline.flush()
+    first_seen_at = batch_pipeline._collection.find_one({"id": "1"})["meta"][
+        "last_seen_at"
+    ]
+    bulk_write = mocker.spy(batch_pipeline._collection, "bulk_write")
+    insert_one = mocker.spy(batch_pipeline._collection, "insert_one")
+    later = first_seen_at + timedelta(days=1)
+    mocker.patch("wg_gesucht.pipelines.datetime", utcnow=lambda: later)
+
+    batch_pipeline.process_item(FlatItem(id="1", title="Same"), None)
+    batch_pipeline.flush()
+
+    bulk_write.assert_not_called()
+    insert_one.assert_not_called()
+    assert batch_pipeline.duplicate_count == 1
+    assert batch_pipeline.updated_count == 0
+    stored = batch_pipeline._collection.find_one({"id": "1"})
+    assert stored["meta"]["last_seen_at"] == later
+    assert "changes" not in stored["meta"]
+
+
+def test_batch_with_new_and_changed_flats(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that inserts and updates of one batch are written together."""
+    batch_pipeline.process_item(FlatItem(id="1", title="Old"), None)
+    batch_pipeline.flush()
+
+    for item in [
+        FlatItem(id="1", title="New"),
+        FlatItem(id="2", title="Other"),
+        FlatItem(id="2", title="Other"),
+    ]:
+        batch_pipeline.process_item(item, None)
+
+    assert batch_pipeline._collection.count_documents({}) == 2
+    assert batch_pipeline.inserted_count == 2
+    assert batch_pipeline.updated_count == 1
+    assert batch_pipeline.duplicate_count == 1
+
+
+def test_inserted_flats_per_city_in_stats(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that new flats are counted per search city in the crawl stats."""
+    batch_pipeline._stats = MemoryStatsCollector(get_crawler())
+    batch_pipeline._collection.insert_one({"id": "3"})
+
+    for flat_id, city_name in [("1", "Köln"), ("2", "Berlin"), ("3", "Köln")]:
+        batch_pipeline.process_item(
+            FlatItem(id=flat_id, meta={"search_city_name": city_name}), None
+        )
+
+    assert batch_pipeline._stats.get_value("flats/inserted") == 2
+    assert batch_pipeline._stats.get_value("flats/inserted/Köln") == 1
+    assert batch_pipeline._stats.get_value("flats/inserted/Berlin") == 1
+
+
+def test_bootstrap_creates_missing_indexes_only(batch_pipeline: WgGesuchtPipeline):
+    """Asserts that existing indexes are not created again."""
+    batch_pipeline._collection.drop_indexes()
+
+    assert batch_pipeline.bootstrap_database() == [
+        "flat_id",
+        "flat_written_at",
+        "flat_city_newest",
+        "flat_city_rent",
+        "flat_location",
+    ]
+    assert batch_pipeline.bootstrap_database() == []
+
+
+def test_init_without_ensure_indexes(mocker):
+    """Asserts that the database is not touched on init if indexes are not ensured."""
+    client = mocker.patch("wg_gesucht.pipelines.MongoClient")
+
+    WgGesuchtPipeline("mongodb://localhost:27017", "test_db", ensure_indexes=False)
+
+    client.return_value.admin.command.assert_not_called()
+
+
+@pytest.fixture
+def reused_pipelines(mocker):
+    """Creates pipelines that share their client, like in the daemon command."""
+    mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+    mocker.patch.object(WgGesuchtPipeline, "_shared_clients", {})
+    mocker.patch.object(WgGesuchtPipeline, "_prepared_collections", set())
+    mocker.patch.object(WgGesuchtPipeline, "_shared_seen_flat_ids", {})
+    mocker.patch.object(WgGesuchtPipeline, "_shared_seen_flat_ids_loaded_at", {})
+
+    def create() -> WgGesuchtPipeline:
+        return WgGesuchtPipeline(
+            "mongodb://localhost:27017", "test_db", reuse_client=True
+        )
+
+    return create
+
+
+def test_reused_client_prepares_database_once(reused_pipelines, mocker):
+    """Asserts that later pipelines skip the ping and the index creation."""
+    first = reused_pipelines()
+    ping = mocker.spy(first._client.admin, "command")
+
+    second = reused_pipelines()
+
+    assert second._client is first._client
+    ping.assert_not_called()
+
+
+def test_reused_seen_flat_ids_are_kept(reused_pipelines, mocker):
+    """Asserts that stored flat ids are loaded once and new flats are added."""
+    spider = mocker.Mock(settings=Settings({"SKIP_SEEN_FLATS": True}))
+    first = reused_pipelines()
+    first._collection.insert_one({"id": "1"})
+    first._load_seen_flat_ids(spider)
+    first.process_item(FlatItem(id="2"), spider)
+
+    from_collection = mocker.spy(SeenFlatIds, "from_collection")
+    reused_pipelines()._load_seen_flat_ids(spider)
+
+    from_collection.assert_not_called()
+    assert "1" in spider.seen_flat_ids
+    assert "2" in spider.seen_flat_ids
+
+
+def test_reused_seen_flat_ids_are_reloaded_after_recheck_age(reused_pipelines, mocker):
+    """Asserts that shared ids are loaded again after SEEN_FLATS_RECHECK_HOURS,
+    without the flats not scraped since."""
+    spider = mocker.Mock(
+        settings=Settings({"SKIP_SEEN_FLATS": True, "SEEN_FLATS_RECHECK_HOURS": 24})
+    )
+    first = reused_pipelines()
+    first._collection.insert_one(
+        {"id": "1", "meta": {"last_seen_at": datetime.utcnow()}}
+    )
+    first._load_seen_flat_ids(spider)
+    later = datetime.utcnow() + timedelta(days=2)
+    mocker.patch("wg_gesucht.pipelines.datetime", utcnow=lambda: later)
+
+    reused_pipelines()._load_seen_flat_ids(spider)
+
+    assert "1" not in spider.seen_flat_ids
+
+
+def test_changed_flat_is_tracked_with_project_settings(mocker, load_response):
+    """Asserts that with the default settings a stored flat not scraped
+    within SEEN_FLATS_RECHECK_HOURS is requested again and its change
+    is recorded, while recently scraped flats are still skipped."""
+    mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+    settings = Settings()
+    settings.setmodule("wg_gesucht.settings")
+    search_settings = SearchSettings(city_name="Köln")
+    settings.update(
+        {
+            "SEARCH_PROFILES": [search_settings],
+            "CITY_ID_CACHE_PATH": "",
+            "DB_SETTINGS": DatabaseSettings("mongodb://localhost:27017", "test_db"),
+            # the test runs the coroutines itself, without a reactor
+            "TWISTED_REACTOR": None,
+        }
+    )
+    crawler = get_crawler(WgGesuchtSpider, settings.copy_to_dict())
+    spider = WgGesuchtSpider.from_crawler(crawler)
+    (pipeline_path,) = settings.getdict("ITEM_PIPELINES")
+    pipeline = load_object(pipeline_path).from_crawler(crawler)
+    now = datetime.utcnow()
+    pipeline._collection.insert_many(
+        [
+            {
+                "id": "10139965",
+                "title": "Old title",
+                "meta": {"found_at": now - timedelta(days=3)},
+            },
+            {"id": "10139921", "meta": {"last_seen_at": now}},
+        ]
+    )
+    detail_url = "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html"
+
+    async def run():
+        await pipeline._open_spider(spider)
+        requests = list(
+            spider.parse_flat_detail_links(
+                load_response(
+                    "results_page.html",
+                    "https://www.wg-gesucht.de/"
+                    "1-zimmer-wohnungen-und-wohnungen-in-Koeln.73.1+2.1.0.html",
+                ),
+                search_settings=search_settings,
+            )
+        )
+        assert detail_url in [request.url for request in requests]
+        assert not any("10139921" in request.url for request in requests)
+        for item in spider.parse_flat(
+            load_response("detail_page.html", detail_url),
+            search_settings=search_settings,
+        ):
+            await pipeline.process_item(item, spider)
+        await pipeline._close_spider()
+
+    asyncio.run(run())
+
+    stored = pipeline._collection.find_one({"id": "10139965"})
+    assert pipeline.updated_count == 1
+    assert stored["title"] != "Old title"
+    assert "title" in stored["meta"]["changes"][0]["fields"]
+
+
+@pytest.fixture
+def async_pipeline(mocker) -> AsyncWgGesuchtPipeline:
+    mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+    pipeline = AsyncWgGesuchtPipeline(
+        "mongodb://localhost:27017",
+        "test_db",
+        "test_collection",
+        batch_size=2,
+        flush_interval=60,
+        max_in_flight_writes=2,
+    )
+    yield pipeline
+    pipeline._client.close()
+
+
+def test_async_init_does_not_touch_database(mocker):
+    """Asserts that constructing the async pipeline does not block on a ping."""
+    client = mocker.patch("wg_gesucht.pipelines.MongoClient")
+
+    AsyncWgGesuchtPipeline("mongodb://localhost:27017", "test_db")
+
+    client.return_value.admin.command.assert_not_called()
+
+
+def test_async_open_spider_prepares_database(
+    async_pipeline: AsyncWgGesuchtPipeline, mocker
+):
+    """Asserts that the unique index is created on open and writes are batched."""
+    spider = mocker.Mock(settings=Settings({"SKIP_SEEN_FLATS": False}))
+
+    async def run():
+        await async_pipeline._open_spider(spider)
+        async_pipeline._stop_flush_task()
+        await asyncio.gather(
+            *(
+                async_pipeline.process_item(FlatItem(id=flat_id), spider)
+                for flat_id in ["1", "2", "2", "3"]
+            )
+        )
+        await async_pipeline._close_spider()
+
+    asyncio.run(run())
+
+    assert "flat_id" in async_pipeline._collection.index_information()
+    assert async_pipeline._collection.count_documents({}) == 3
+    assert async_pipeline.inserted_count == 3
+    assert async_pipeline.duplicate_count == 1
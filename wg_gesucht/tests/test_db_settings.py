@@ -1,5 +1,5 @@
 import pytest
-from wg_gesucht.db_settings import DatabaseSettings
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
 
 
 class TestDatabaseSettings:
@@ -53,3 +53,15 @@ class TestDatabaseSettings:
 
         assert settings.db_name == "wg_gesucht"
         assert settings.connection_uri == "mongodb://localhost:27017"
+
+    def test_load_from_env(self):
+        settings: DatabaseSettings = load_db_settings_from_env(
+            {"DB_NAME": "wg_gesucht", "DB_URI": "mongodb://localhost:27017"}
+        )
+
+        assert settings.db_name == "wg_gesucht"
+        assert settings.connection_uri == "mongodb://localhost:27017"
+
+    def test_load_from_env_missing(self):
+        with pytest.raises(ValueError):
+            load_db_settings_from_env({"DB_NAME": "wg_gesucht"})
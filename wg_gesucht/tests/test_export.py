@@ -0,0 +1,185 @@
+import json
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from wg_gesucht.export import (
+    EXPORT_COLUMNS,
+    ExportWatermark,
+    JsonLinesWriter,
+    build_writer,
+    export_flats,
+    flatten_flat,
+    iter_flat_chunks,
+)
+
+FOUND_AT = datetime(2023, 6, 10, 7, 32)
+WRITTEN_AT = datetime(2023, 6, 11, 8, 0)
+FLAT = {
+    "id": "10139965",
+    "url": "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html",
+    "title": "Schöne wohnung",
+    "rooms": 3,
+    "size": {"amount": 88, "unit": "m2"},
+    "rent_costs": {"value": 900.0, "currency": "EUR"},
+    "postal_code": "51069",
+    "city_name": "Köln dellbrück",
+    "meta": {"found_at": FOUND_AT, "search_city_name": "Köln"},
+}
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.flats
+    collection.insert_many(
+        [
+            {
+                **FLAT,
+                "id": str(i),
+                # flat 0 is written last, with the oldest found_at
+                "meta": {
+                    "found_at": FOUND_AT + timedelta(minutes=i),
+                    "written_at": WRITTEN_AT + timedelta(minutes=(i - 1) % 5),
+                },
+            }
+            for i in range(5)
+        ]
+    )
+    return collection
+
+
+def read_jsonl(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestFlattenFlat:
+    def test_nested_values_in_typed_columns(self):
+        row = flatten_flat(FLAT)
+
+        assert list(row) == list(EXPORT_COLUMNS)
+        assert row["size_amount"] == 88.0
+        assert isinstance(row["size_amount"], float)
+        assert row["size_unit"] == "m2"
+        assert row["rent_costs_value"] == 900.0
+        assert row["rent_costs_currency"] == "EUR"
+        assert row["found_at"] == FOUND_AT
+        assert row["search_city_name"] == "Köln"
+
+    def test_missing_values(self):
+        row = flatten_flat({"id": "1"})
+
+        assert row["id"] == "1"
+        assert row["deposit_value"] is None
+        assert row["found_at"] is None
+
+
+class TestExport:
+    def test_chunks(self, collection):
+        chunks = list(iter_flat_chunks(collection, chunk_size=2))
+
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert [row["id"] for chunk in chunks for row in chunk] == list("12340")
+
+    def test_jsonl(self, collection, tmp_path):
+        path = tmp_path / "flats.jsonl"
+
+        summary = export_flats(collection, JsonLinesWriter(path), chunk_size=2)
+
+        rows = read_jsonl(path)
+        assert summary.count == len(rows) == 5
+        assert summary.watermark == WRITTEN_AT + timedelta(minutes=4)
+        assert rows[-1]["found_at"] == "2023-06-10T07:32:00"
+        assert rows[0]["city_name"] == "Köln dellbrück"
+        assert not (tmp_path / "flats.jsonl.tmp").exists()
+
+    def test_incremental(self, collection, tmp_path):
+        watermark = ExportWatermark(tmp_path / "watermark.json")
+        watermark.save(WRITTEN_AT + timedelta(minutes=2))
+
+        summary = export_flats(
+            collection, JsonLinesWriter(tmp_path / "flats.jsonl"), watermark.load()
+        )
+
+        assert [row["id"] for row in read_jsonl(tmp_path / "flats.jsonl")] == [
+            "4",
+            "0",
+        ]
+        assert summary.watermark == WRITTEN_AT + timedelta(minutes=4)
+
+    def test_until_leaves_recent_writes(self, collection, tmp_path):
+        """Asserts that flats written after until are left to the next export,
+        and flats without write time are in the full export."""
+        collection.insert_one({**FLAT, "id": "5", "meta": {"found_at": FOUND_AT}})
+
+        summary = export_flats(
+            collection,
+            JsonLinesWriter(tmp_path / "flats.jsonl"),
+            until=WRITTEN_AT + timedelta(minutes=2),
+        )
+
+        assert [row["id"] for row in read_jsonl(tmp_path / "flats.jsonl")] == [
+            "5",
+            "1",
+            "2",
+            "3",
+        ]
+        assert summary.watermark == WRITTEN_AT + timedelta(minutes=2)
+        incremental = export_flats(
+            collection, JsonLinesWriter(tmp_path / "next.jsonl"), summary.watermark
+        )
+        assert [row["id"] for row in read_jsonl(tmp_path / "next.jsonl")] == [
+            "4",
+            "0",
+        ]
+        assert incremental.watermark == WRITTEN_AT + timedelta(minutes=4)
+
+    def test_nothing_new_keeps_watermark(self, collection, tmp_path):
+        since = WRITTEN_AT + timedelta(minutes=4)
+
+        summary = export_flats(
+            collection, JsonLinesWriter(tmp_path / "flats.jsonl"), since
+        )
+
+        assert summary.count == 0
+        assert summary.watermark == since
+
+    def test_watermark_missing(self, tmp_path):
+        assert ExportWatermark(tmp_path / "watermark.json").load() is None
+
+    def test_failure_removes_temporary_file(self, collection, tmp_path, mocker):
+        path = tmp_path / "flats.jsonl"
+        path.write_text("previous export\n")
+        mocker.patch(
+            "wg_gesucht.export.flatten_flat", side_effect=RuntimeError("broken")
+        )
+
+        with pytest.raises(RuntimeError):
+            export_flats(collection, JsonLinesWriter(path))
+
+        assert not (tmp_path / "flats.jsonl.tmp").exists()
+        assert path.read_text() == "previous export\n"
+
+    @pytest.mark.parametrize("file_name", ["flats.parquet", "flats.arrow"])
+    def test_columnar(self, collection, tmp_path, file_name):
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        path = tmp_path / file_name
+
+        export_flats(collection, build_writer(path), chunk_size=2)
+
+        if file_name.endswith(".parquet"):
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(str(path)).read_all()
+        assert table.num_rows == 5
+        assert table.schema.field("size_amount").type == pyarrow.float64()
+        assert table.schema.field("found_at").type == pyarrow.timestamp("ms")
+        assert sorted(table.to_pylist(), key=lambda row: row["id"]) == [
+            flatten_flat(flat) for flat in collection.find().sort("id")
+        ]
+
+    def test_unknown_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            build_writer(tmp_path / "flats.csv")
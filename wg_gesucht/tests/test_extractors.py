@@ -0,0 +1,52 @@
+import pytest
+from parsel import Selector
+from tests.conftest import FIXTURES_DIR
+from wg_gesucht.extractors import FlatDetailExtractor
+
+
+def extract(html: str) -> dict[str, list[str]]:
+    return FlatDetailExtractor.extract(Selector(text=html).root)
+
+
+def test_extract_detail_page():
+    values = extract((FIXTURES_DIR / "detail_page.html").read_text())
+
+    assert values["id"] == ["10139965"]
+    assert values["rent_costs"] == ["900€"]
+    assert values["additional_flat_costs"] == ["n.a."]
+    assert values["deposit"] == ["1700€"]
+    assert values["other_costs"] == ["2000€"]
+    assert [line.strip() for line in values["address"]] == [
+        "Grafenmühlenweg 145",
+        "51069 Köln Dellbrück",
+    ]
+    assert values["move_in_date"] == ["01.09.2023"]
+    assert all(type(value) is str for value in values["title"])
+
+
+def test_only_first_two_provision_boxes():
+    values = extract(
+        "<div>"
+        '<div class="provision-equipment"><label class="amount">1€</label>'
+        '<label class="description">Kaution</label></div>'
+        '<div class="provision-equipment"><label class="amount">2€</label>'
+        '<label class="description">Ablösevereinbarung</label></div>'
+        '<div class="provision-equipment"><label class="amount">3€</label>'
+        '<label class="description">Sonstiges</label></div>'
+        "</div>"
+    )
+
+    assert values["deposit"] == ["1€"]
+    assert values["other_costs"] == ["2€"]
+
+
+def test_unexpected_provision_boxes():
+    with pytest.raises(AssertionError):
+        extract(
+            "<div>"
+            '<div class="provision-equipment"><label class="amount">2€</label>'
+            '<label class="description">Ablösevereinbarung</label></div>'
+            '<div class="provision-equipment"><label class="amount">1€</label>'
+            '<label class="description">Kaution</label></div>'
+            "</div>"
+        )
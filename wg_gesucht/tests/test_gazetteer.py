@@ -0,0 +1,156 @@
+import zipfile
+
+import mongomock
+import pytest
+from wg_gesucht.gazetteer import (
+    PostalCodeGazetteer,
+    centroids_from_geonames,
+    geo_point,
+    locate_stored_flats,
+    read_geonames_lines,
+    write_gazetteer,
+)
+from wg_gesucht.items import FlatItem
+from wg_gesucht.pipelines import WgGesuchtPipeline, flat_content_hash
+from wg_gesucht.queries import EARTH_RADIUS_KM, FlatQuery
+from wg_gesucht.records import FlatRecord
+
+GEONAMES_LINES = [
+    "DE\t51069\tKöln\tNordrhein-Westfalen\tNW\t\t00\tKöln\t05315\t50.9667\t7.0667\t4\n",
+    "DE\t51069\tKöln Dellbrück\tNordrhein-Westfalen\tNW\t\t00\tKöln\t05315\t50.9733"
+    "\t7.0733\t4\n",
+    "DE\t01067\tDresden\tSachsen\tSN\t\t00\tDresden\t14612\t51.0581\t13.7304\t4\n",
+    "AT\t1010\tWien\tWien\t09\t\t900\tWien\t90001\t48.2077\t16.3705\t4\n",
+    "DE\t99999\tbroken\n",
+]
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    path = tmp_path / "postal_codes.bin"
+    write_gazetteer(path, centroids_from_geonames(GEONAMES_LINES))
+    return path
+
+
+@pytest.fixture
+def gazetteer(table_path):
+    with PostalCodeGazetteer(table_path) as gazetteer:
+        yield gazetteer
+
+
+class TestPostalCodeGazetteer:
+    def test_centroid(self, gazetteer, table_path):
+        assert len(gazetteer) == 2
+        assert gazetteer.centroid("51069") == pytest.approx((7.07, 50.97))
+        assert gazetteer.centroid("01067") == pytest.approx((13.7304, 51.0581))
+        assert table_path.stat().st_size == 16 + 2 * 12
+
+    @pytest.mark.parametrize("postal_code", [None, "", "1067", "10115", "5106a"])
+    def test_unknown_postal_code(self, gazetteer, postal_code):
+        assert gazetteer.centroid(postal_code) is None
+
+    def test_open_if_exists(self, tmp_path, table_path):
+        assert PostalCodeGazetteer.open_if_exists(None) is None
+        assert PostalCodeGazetteer.open_if_exists(tmp_path / "missing.bin") is None
+        (tmp_path / "broken.bin").write_bytes(table_path.read_bytes()[:-4])
+        assert PostalCodeGazetteer.open_if_exists(tmp_path / "broken.bin") is None
+
+    def test_read_zipped_geonames(self, tmp_path):
+        path = tmp_path / "DE.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("DE.txt", "".join(GEONAMES_LINES))
+            archive.writestr("readme.txt", "GeoNames postal codes")
+
+        assert list(read_geonames_lines(path)) == GEONAMES_LINES
+
+    def test_locate_stored_flats(self, gazetteer):
+        collection = mongomock.MongoClient().db.flats
+        collection.insert_many(
+            [
+                {"id": "1", "postal_code": "51069"},
+                {"id": "2", "postal_code": "10115"},
+                {"id": "3", "postal_code": "01067", "location": geo_point(0, 0)},
+            ]
+        )
+
+        assert locate_stored_flats(collection, gazetteer) == 1
+        location = collection.find_one({"id": "1"})["location"]
+        assert location["type"] == "Point"
+        assert location["coordinates"] == pytest.approx([7.07, 50.97])
+
+
+class TestLocatedFlats:
+    def test_pipeline_adds_location(self, mocker, table_path):
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017", "test_db", gazetteer_path=str(table_path)
+        )
+
+        item = pipeline.process_item(FlatItem(id="1", postal_code="51069"), None)
+        pipeline.process_item(FlatItem(id="2", postal_code="10115"), None)
+        pipeline.close_spider(None)
+
+        assert item["location"]["coordinates"] == pytest.approx([7.07, 50.97])
+        stored = pipeline._collection.find_one({"id": "1"})
+        assert stored["location"] == item["location"]
+        assert "location" not in pipeline._collection.find_one({"id": "2"})
+        assert "flat_location" in pipeline._collection.index_information()
+
+    def test_update_without_location_keeps_it(self, mocker, table_path):
+        """Asserts that a flat updated without lookup, e.g. on a replay
+        without postal code table, keeps its stored location."""
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017", "test_db", gazetteer_path=str(table_path)
+        )
+        pipeline.process_item(FlatItem(id="1", postal_code="51069", title="a"), None)
+        pipeline._close_gazetteer()
+
+        pipeline.process_item(FlatItem(id="1", postal_code="51069", title="b"), None)
+
+        stored = pipeline._collection.find_one({"id": "1"})
+        assert stored["title"] == "b"
+        assert stored["location"]["coordinates"] == pytest.approx([7.07, 50.97])
+        assert stored["meta"]["changes"][0]["fields"] == ["title"]
+
+    def test_location_is_not_content(self):
+        flat = {"id": "1", "postal_code": "51069"}
+        located = FlatRecord.from_item({**flat, "location": geo_point(7.07, 50.97)})
+
+        assert located.to_document()["location"] == geo_point(7.07, 50.97)
+        assert flat_content_hash(located.to_document()) == flat_content_hash(flat)
+
+
+class TestRadiusQuery:
+    def test_filter(self):
+        query = FlatQuery(near=(7.07, 50.97), radius_km=3)
+
+        assert query.to_filter() == {
+            "location": {
+                "$geoWithin": {"$centerSphere": [[7.07, 50.97], 3 / EARTH_RADIUS_KM]}
+            }
+        }
+
+    def test_from_args(self, gazetteer):
+        coordinates = FlatQuery.from_args({"near": "6.96,50.94", "radius_km": "3"})
+        postal_code = FlatQuery.from_args(
+            {"near": "51069", "radius_km": "2.5"}, gazetteer=gazetteer
+        )
+
+        assert coordinates.near == (6.96, 50.94)
+        assert postal_code.near == pytest.approx((7.07, 50.97))
+        assert postal_code.radius_km == 2.5
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            {"near": "6.96,50.94"},
+            {"radius_km": "3"},
+            {"near": "6.96,150", "radius_km": "3"},
+            {"near": "6.96,50.94", "radius_km": "500"},
+            {"near": "10115", "radius_km": "3"},
+        ],
+    )
+    def test_invalid_args(self, args, gazetteer):
+        with pytest.raises(ValueError):
+            FlatQuery.from_args(args, gazetteer=gazetteer)
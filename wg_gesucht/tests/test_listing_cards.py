@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from scrapy import Selector
+from wg_gesucht.listing_cards import (
+    ListingCard,
+    parse_card_info_str,
+    parse_online_since_str,
+)
+
+
+class TestParseOnlineSinceStr:
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("Online: 30 Sekunden", timedelta(seconds=30)),
+            ("Online: 1 Minute", timedelta(minutes=1)),
+            ("Online: 19 Minuten", timedelta(minutes=19)),
+            ("Online: 3 Stunden", timedelta(hours=3)),
+            ("Online: 1 Tag", timedelta(days=1)),
+            ("Online: 5 Tage", timedelta(days=5)),
+        ],
+    )
+    def test_durations(self, value, expected):
+        assert parse_online_since_str(value) == expected
+
+    def test_date(self):
+        now = datetime(2023, 6, 12, 12)
+        assert parse_online_since_str("Online: 10.06.2023", now=now) == timedelta(
+            days=2, hours=12
+        )
+
+    @pytest.mark.parametrize("value", [None, "", "Online:", "Online: bald"])
+    def test_unknown(self, value):
+        assert parse_online_since_str(value) is None
+
+
+class TestListingCard:
+    def test_from_selector(self):
+        card = Selector(
+            text=(
+                '<div class="wgg_card offer_list_item" data-id=" 42 ">'
+                "<div><div><div><div><h3>"
+                '<a href="/wohnungen-in-Koeln.42.html">Flat</a>'
+                "</h3></div></div></div></div>"
+                "<span>Online: 2 Stunden</span></div>"
+            )
+        ).xpath("//div[@data-id]")[0]
+
+        assert ListingCard.from_selector(card) == ListingCard(
+            flat_id="42",
+            detail_link="/wohnungen-in-Koeln.42.html",
+            online_since=timedelta(hours=2),
+        )
+
+    def test_flat_id_from_detail_link(self):
+        card = Selector(
+            text=(
+                '<div class="wgg_card offer_list_item">'
+                "<div><div><div><div><h3>"
+                '<a href="/wohnungen-in-Koeln.10139965.html">Flat</a>'
+                "</h3></div></div></div></div></div>"
+            )
+        ).xpath("//body/div")[0]
+
+        assert ListingCard.from_selector(card).flat_id == "10139965"
+
+    def test_values_shown_on_card(self, load_response):
+        response = load_response("results_page.html", "https://www.wg-gesucht.de/")
+
+        card = ListingCard.from_selector(response.xpath("//div[@data-id]")[0])
+
+        assert card.rent == {"value": 1150.0, "currency": "EUR"}
+        assert card.size == 88.0
+        assert card.rooms == 3.0
+        assert card.district == "Köln Dellbrück"
+
+
+class TestParseCardInfoStr:
+    def test_rooms_and_district(self):
+        assert parse_card_info_str(
+            "2,5-Zimmer-Wohnung | Köln Ehrenfeld | Venloer Str. 12"
+        ) == (2.5, "Köln Ehrenfeld")
+
+    @pytest.mark.parametrize("value", [None, "", "Wohnung"])
+    def test_missing(self, value):
+        assert parse_card_info_str(value) == (None, None)
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.web.test.requesthelper import DummyRequest
+from wg_gesucht.metrics import (
+    CallbackTimingMiddleware,
+    CrawlMetrics,
+    LatencyHistogram,
+    MetricsResource,
+)
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    return get_crawler(
+        WgGesuchtSpider,
+        {
+            "EXTENSIONS": {"wg_gesucht.metrics.CrawlMetrics": 500},
+            "METRICS_ENABLED": True,
+            "METRICS_DUMP_PATH": str(tmp_path / "metrics.json"),
+        },
+    )
+
+
+@pytest.fixture
+def metrics(crawler) -> CrawlMetrics:
+    return CrawlMetrics.of_crawler(crawler)
+
+
+def create_response(callback) -> HtmlResponse:
+    url = "https://www.wg-gesucht.de/"
+    return HtmlResponse(url=url, body=b"", request=Request(url, callback=callback))
+
+
+class TestLatencyHistogram:
+    def test_observe(self):
+        histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+        for seconds in [0.005, 0.05, 0.05, 0.5, 5]:
+            histogram.observe(seconds)
+
+        assert histogram.counts == [1, 2, 1, 1]
+        assert histogram.count == 5
+        assert histogram.sum == pytest.approx(5.605)
+
+    def test_quantiles(self):
+        histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+        for seconds in [0.005] * 50 + [0.05] * 40 + [0.5] * 10:
+            histogram.observe(seconds)
+
+        assert histogram.quantile(0.5) == 0.01
+        assert histogram.quantile(0.9) == 0.1
+        assert histogram.quantile(0.99) == 1.0
+        assert LatencyHistogram().quantile(0.5) is None
+
+
+class TestCallbackTimingMiddleware:
+    def test_records_callback_latency(self, crawler, metrics):
+        spider = WgGesuchtSpider.from_crawler(crawler)
+        middleware = CallbackTimingMiddleware.from_crawler(crawler)
+        response = create_response(spider.parse_flat)
+
+        output = list(middleware.process_spider_output(response, iter([1, 2]), spider))
+
+        assert output == [1, 2]
+        assert metrics.latencies["callback/parse_flat"].count == 1
+
+    def test_counts_failures(self, crawler, metrics):
+        spider = WgGesuchtSpider.from_crawler(crawler)
+        middleware = CallbackTimingMiddleware.from_crawler(crawler)
+
+        def failing():
+            yield 1
+            raise ValueError("broken page")
+
+        output = middleware.process_spider_output(
+            create_response(spider.parse_flat), failing(), spider
+        )
+
+        with pytest.raises(ValueError):
+            list(output)
+        assert crawler.stats.get_value("parse_failures/parse_flat") == 1
+        assert metrics.latencies["callback/parse_flat"].count == 1
+
+    def test_disabled_without_extension(self):
+        with pytest.raises(NotConfigured):
+            CallbackTimingMiddleware.from_crawler(get_crawler(WgGesuchtSpider))
+
+
+class TestCrawlMetrics:
+    def test_snapshot_reads_stats(self, crawler, metrics):
+        crawler.stats.set_value("item_scraped_count", 3)
+        crawler.stats.set_value("flats/skipped_seen", 4)
+        crawler.stats.set_value("flats/duplicates", 1)
+        crawler.stats.set_value("downloader/response_bytes", 2048)
+        spider = WgGesuchtSpider.from_crawler(crawler)
+        middleware = CallbackTimingMiddleware.from_crawler(crawler)
+
+        def failing():
+            raise ValueError("broken page")
+            yield
+
+        for callback in [
+            spider.parse_flat,
+            spider.parse_flat,
+            spider.parse_city_response,
+        ]:
+            with pytest.raises(ValueError):
+                list(
+                    middleware.process_spider_output(
+                        create_response(callback), failing(), spider
+                    )
+                )
+
+        snapshot = metrics.snapshot()
+
+        assert snapshot["items"] == 3
+        assert snapshot["duplicates_skipped"] == 5
+        assert snapshot["bytes_downloaded"] == 2048
+        assert snapshot["parse_failures"] == 3
+
+    def test_endpoint_serves_prometheus_format(self, metrics):
+        metrics.histogram("pipeline/write").observe(0.003)
+
+        body = MetricsResource(metrics).render_GET(DummyRequest([b"metrics"]))
+
+        lines = body.decode().splitlines()
+        assert "wg_gesucht_items 0" in lines
+        assert (
+            'wg_gesucht_latency_seconds_bucket{name="pipeline/write",le="0.004"} 1'
+            in lines
+        )
+        assert 'wg_gesucht_latency_seconds_count{name="pipeline/write"} 1' in lines
+
+    def test_dump_on_close(self, crawler, metrics, tmp_path):
+        spider = WgGesuchtSpider.from_crawler(crawler)
+        metrics.spider_opened(spider)
+        metrics.histogram("callback/parse_flat").observe(0.02)
+
+        metrics.spider_closed(spider)
+
+        with open(tmp_path / "metrics.json", encoding="utf-8") as dump_file:
+            dump = json.load(dump_file)
+        assert dump["latencies"]["callback/parse_flat"]["count"] == 1
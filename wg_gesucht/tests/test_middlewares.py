@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from wg_gesucht.middlewares import ConditionalRequestCacheMiddleware
+
+PAGE_BODY = "<html><body><h1>Wohnung in Köln</h1></body></html>".encode()
+ETAG = '"flat-10139965-v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves one page with an ETag and answers revalidations with 304."""
+
+    requests_seen: list[dict] = []
+
+    def do_GET(self):
+        StubHandler.requests_seen.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(PAGE_BODY)))
+        self.end_headers()
+        self.wfile.write(PAGE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def middleware(tmp_path) -> ConditionalRequestCacheMiddleware:
+    crawler = get_crawler(
+        settings_dict={
+            "CONDITIONAL_CACHE_ENABLED": True,
+            "CONDITIONAL_CACHE_DIR": str(tmp_path),
+        }
+    )
+    return ConditionalRequestCacheMiddleware.from_crawler(crawler)
+
+
+def download(middleware: ConditionalRequestCacheMiddleware, request: Request):
+    """Sends the request through the middleware and the stub server."""
+    assert middleware.process_request(request, None) is None
+    http_request = urllib.request.Request(
+        request.url, headers=request.headers.to_unicode_dict()
+    )
+    try:
+        with urllib.request.urlopen(http_request) as http_response:
+            status, headers, body = (
+                http_response.status,
+                dict(http_response.headers),
+                http_response.read(),
+            )
+    except urllib.error.HTTPError as e:
+        status, headers, body = e.code, dict(e.headers), b""
+
+    response = HtmlResponse(
+        url=request.url, status=status, headers=headers, body=body, request=request
+    )
+    return middleware.process_response(request, response, None)
+
+
+def test_first_request_is_not_conditional(middleware, stub_server):
+    response = download(middleware, Request(f"{stub_server}/flat.html"))
+
+    assert response.status == 200
+    assert "If-None-Match" not in StubHandler.requests_seen[0]
+
+
+def test_unchanged_page_is_served_from_store(middleware, stub_server):
+    download(middleware, Request(f"{stub_server}/flat.html"))
+    response = download(middleware, Request(f"{stub_server}/flat.html"))
+
+    assert StubHandler.requests_seen[1]["If-None-Match"] == ETAG
+    assert response.status == 200
+    assert "cached" in response.flags
+    assert response.body == PAGE_BODY
+    assert response.xpath("//h1/text()").get() == "Wohnung in Köln"
+
+
+def test_dont_cache_requests_are_not_conditional(middleware, stub_server):
+    download(middleware, Request(f"{stub_server}/flat.html"))
+    response = download(
+        middleware, Request(f"{stub_server}/flat.html", meta={"dont_cache": True})
+    )
+
+    assert "If-None-Match" not in StubHandler.requests_seen[1]
+    assert "cached" not in response.flags
+
+
+def test_disabled_by_default():
+    with pytest.raises(NotConfigured):
+        ConditionalRequestCacheMiddleware.from_crawler(get_crawler())
+
+
+def age_stored_pages(cache_dir, seconds: float):
+    """Moves the time the stored pages were written back by seconds."""
+    for path in cache_dir.glob("*/*"):
+        if path.suffix == ".json":
+            metadata = json.loads(path.read_text())
+            metadata["stored_at"] -= seconds
+            path.write_text(json.dumps(metadata))
+        modified_at = path.stat().st_mtime - seconds
+        os.utime(path, (modified_at, modified_at))
+
+
+def test_expired_pages_are_downloaded_and_pruned(tmp_path, stub_server):
+    crawler = get_crawler(
+        settings_dict={
+            "CONDITIONAL_CACHE_ENABLED": True,
+            "CONDITIONAL_CACHE_DIR": str(tmp_path),
+            "CONDITIONAL_CACHE_MAX_AGE": 60,
+        }
+    )
+    middleware = ConditionalRequestCacheMiddleware.from_crawler(crawler)
+    download(middleware, Request(f"{stub_server}/flat.html"))
+    age_stored_pages(tmp_path, 61)
+
+    response = download(middleware, Request(f"{stub_server}/flat.html"))
+
+    assert "If-None-Match" not in StubHandler.requests_seen[1]
+    assert "cached" not in response.flags
+
+    age_stored_pages(tmp_path, 61)
+    middleware.spider_closed(None)
+
+    assert not list(tmp_path.glob("*/*"))
+    assert crawler.stats.get_value("conditional_cache/pruned") == 2
+
+
+def test_revalidated_pages_do_not_expire(tmp_path, stub_server):
+    crawler = get_crawler(
+        settings_dict={
+            "CONDITIONAL_CACHE_ENABLED": True,
+            "CONDITIONAL_CACHE_DIR": str(tmp_path),
+            "CONDITIONAL_CACHE_MAX_AGE": 60,
+        }
+    )
+    middleware = ConditionalRequestCacheMiddleware.from_crawler(crawler)
+    download(middleware, Request(f"{stub_server}/flat.html"))
+    age_stored_pages(tmp_path, 40)
+    assert "cached" in download(middleware, Request(f"{stub_server}/flat.html")).flags
+
+    age_stored_pages(tmp_path, 40)
+    response = download(middleware, Request(f"{stub_server}/flat.html"))
+    middleware.spider_closed(None)
+
+    assert StubHandler.requests_seen[2]["If-None-Match"] == ETAG
+    assert "cached" in response.flags
+    assert len(list(tmp_path.glob("*/*"))) == 2
+
+
+def test_not_modified_without_stored_page_is_refetched(
+    middleware, tmp_path, stub_server
+):
+    download(middleware, Request(f"{stub_server}/flat.html"))
+    request = Request(f"{stub_server}/flat.html")
+    middleware.process_request(request, None)
+    for path in tmp_path.glob("*/*"):
+        path.unlink()
+    not_modified = HtmlResponse(url=request.url, status=304, request=request)
+
+    refetch_request = middleware.process_response(request, not_modified, None)
+
+    assert isinstance(refetch_request, Request)
+    assert b"If-None-Match" not in refetch_request.headers
+    response = download(middleware, refetch_request)
+    assert "If-None-Match" not in StubHandler.requests_seen[1]
+    assert response.status == 200
+    assert response.body == PAGE_BODY
+    assert len(list(tmp_path.glob("*/*"))) == 2
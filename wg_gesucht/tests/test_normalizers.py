@@ -0,0 +1,88 @@
+import pytest
+from wg_gesucht.items import FlatItem
+from wg_gesucht.loaders import FlatItemLoader
+from wg_gesucht.normalizers import (
+    FIELD_NORMALIZERS,
+    normalize_flat,
+    normalize_values,
+    parse_cost_str,
+    remove_whitespace_and_returns,
+)
+
+RAW_VALUES = {
+    "id": [" 10139965 "],
+    "url": "https://www.wg-gesucht.de/wohnungen-in-Koeln.10139965.html",
+    "title": ["\r\n  SCHÖNE   3-Zimmer\nWohnung  "],
+    "rooms": ["", "\n 2,5 "],
+    "size": ["88m²"],
+    "rent_costs": ["n.a."],
+    "utilities_costs": ["250€"],
+    "additional_flat_costs": ["120 CHF"],
+    "deposit": ["1700,50 €"],
+    "other_costs": ["frei"],
+    "street": "grafenmühlenweg   145",
+    "postal_code": " 51069",
+    "city_name": "köln  Dellbrück",
+    "move_in_date": "1.9.2023",
+    "meta": {"search_city_name": "Köln"},
+}
+
+
+def load_with_item_loader(raw_values: dict) -> dict:
+    loader = FlatItemLoader(item=FlatItem())
+    for field, value in raw_values.items():
+        loader.add_value(field, value)
+    return dict(loader.load_item())
+
+
+def test_same_values_as_item_loader():
+    assert normalize_flat(RAW_VALUES) == load_with_item_loader(RAW_VALUES)
+
+
+def test_normalized_values():
+    flat = normalize_flat(RAW_VALUES)
+
+    assert flat["title"] == "Schöne 3-zimmer wohnung"
+    assert flat["rooms"] == 2.5
+    assert flat["utilities_costs"] == {"value": 250.0, "currency": "EUR"}
+    assert flat["additional_flat_costs"] == {"value": 120.0, "currency": "CHF"}
+    assert flat["city_name"] == "Köln dellbrück"
+    assert flat["move_in_date"] == "01.09.2023"
+    assert "rent_costs" not in flat
+    assert "other_costs" not in flat
+
+
+def test_cached_dicts_are_not_shared():
+    first = FIELD_NORMALIZERS["rent_costs"]("900€")
+    first["value"] = 0
+
+    assert FIELD_NORMALIZERS["rent_costs"]("900€") == {
+        "value": 900.0,
+        "currency": "EUR",
+    }
+
+
+def test_invalid_date_is_not_cached():
+    with pytest.raises(ValueError):
+        FIELD_NORMALIZERS["move_in_date"]("31.02.2023")
+    with pytest.raises(ValueError):
+        FIELD_NORMALIZERS["move_in_date"]("31.02.2023")
+
+
+def test_normalize_values_drops_empty_results():
+    assert normalize_values("rent_costs", ["n.a.", "900€", None, "1000 CHF"]) == [
+        {"value": 900.0, "currency": "EUR"},
+        {"value": 1000.0, "currency": "CHF"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("900€", {"value": 900.0, "currency": "EUR"}), ("900", None), ("", None)],
+)
+def test_parse_cost_str(value, expected):
+    assert parse_cost_str(value) == expected
+
+
+def test_remove_whitespace_and_returns():
+    assert remove_whitespace_and_returns(" a\r\n  b ") == "a b"
@@ -0,0 +1,210 @@
+import io
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import mongomock
+import pytest
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer, task
+from wg_gesucht.items import FlatItem
+from wg_gesucht.metrics import CrawlMetrics
+from wg_gesucht.notifications import (
+    FileSink,
+    FlatNotifier,
+    NotificationSink,
+    StdoutSink,
+    WebhookSink,
+    build_sink,
+)
+from wg_gesucht.pipelines import WgGesuchtPipeline
+from wg_gesucht.signals import flats_inserted
+
+FOUND_AT = datetime(2023, 6, 10, 7, 32)
+FLAT = {
+    "id": "10139965",
+    "url": "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html",
+    "title": "Schöne wohnung",
+    "rooms": 3.0,
+    "size": {"amount": 88.0, "unit": "m2"},
+    "rent_costs": {"value": 900.0, "currency": "EUR"},
+    "meta": {"found_at": FOUND_AT, "search_city_name": "Köln"},
+}
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Records posted messages, answers with the next queued status code."""
+
+    messages: list[dict] = []
+    status_codes: list[int] = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        status = WebhookHandler.status_codes.pop(0) if self.status_codes else 204
+        if status < 400:
+            WebhookHandler.messages.append(json.loads(body))
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook_url():
+    WebhookHandler.messages = []
+    WebhookHandler.status_codes = []
+    server = HTTPServer(("127.0.0.1", 0), WebhookHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/hook"
+    server.shutdown()
+    server.server_close()
+
+
+class RecordingSink(NotificationSink):
+    def __init__(self, failures: int = 0):
+        self.messages: list[dict] = []
+        self._failures = failures
+
+    def send(self, message):
+        if self._failures:
+            self._failures -= 1
+            raise ConnectionError("webhook down")
+        self.messages.append(message)
+
+
+def create_notifier(sink: NotificationSink, clock: task.Clock, **kwargs):
+    return FlatNotifier(
+        sink,
+        coalesce_window=5,
+        retry_delay=1,
+        clock=clock,
+        # delivers right away instead of in a thread
+        run_in_thread=defer.maybeDeferred,
+        **kwargs,
+    )
+
+
+class TestFlatNotifier:
+    def test_coalesces_flats_within_window(self):
+        clock, sink = task.Clock(), RecordingSink()
+        notifier = create_notifier(sink, clock)
+
+        notifier.flats_inserted([FLAT])
+        clock.advance(3)
+        notifier.flats_inserted([{**FLAT, "id": "2"}])
+        assert sink.messages == []
+
+        clock.advance(2)
+        assert len(sink.messages) == 1
+        assert sink.messages[0]["count"] == 2
+        assert "meta" not in sink.messages[0]["flats"][0]
+
+    def test_retries_are_bounded(self):
+        clock, sink = task.Clock(), RecordingSink(failures=10)
+        stats = get_crawler().stats
+        notifier = create_notifier(sink, clock, max_retries=2, stats=stats)
+
+        notifier.flats_inserted([FLAT])
+        clock.advance(5)
+        clock.advance(1)
+        clock.advance(2)
+        clock.advance(100)
+
+        assert sink.messages == []
+        assert stats.get_value("notifications/retries") == 2
+        assert stats.get_value("notifications/failed") == 1
+
+    def test_retry_succeeds(self):
+        clock, sink = task.Clock(), RecordingSink(failures=1)
+        notifier = create_notifier(sink, clock)
+
+        notifier.flats_inserted([FLAT])
+        clock.advance(5)
+        assert sink.messages == []
+        clock.advance(1)
+
+        assert len(sink.messages) == 1
+
+    def test_records_latency(self):
+        clock, sink = task.Clock(), RecordingSink()
+        metrics = CrawlMetrics(crawler=None)
+        notifier = create_notifier(
+            sink,
+            clock,
+            metrics=metrics,
+            now=lambda: FOUND_AT + timedelta(seconds=6),
+        )
+
+        notifier.flats_inserted([FLAT])
+        clock.advance(5)
+
+        histogram = metrics.latencies["notification/latency"]
+        assert histogram.count == 1
+        assert histogram.sum == 6
+
+    def test_close_sends_pending_flats(self):
+        clock, sink = task.Clock(), RecordingSink()
+        notifier = create_notifier(sink, clock)
+
+        notifier.flats_inserted([FLAT])
+        notifier.spider_closed()
+
+        assert len(sink.messages) == 1
+        assert not clock.getDelayedCalls()
+
+    def test_only_inserted_flats_are_notified(self, mocker):
+        """Asserts that the pipeline signals new flats, but no duplicates."""
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        crawler = get_crawler()
+        received: list[dict] = []
+        crawler.signals.connect(
+            lambda flats: received.extend(flats), signal=flats_inserted, weak=False
+        )
+        pipeline = WgGesuchtPipeline("mongodb://localhost:27017", "test_db")
+        pipeline._signals = crawler.signals
+
+        pipeline.process_item(FlatItem(id="1"), None)
+        pipeline.process_item(FlatItem(id="1"), None)
+
+        assert [flat["id"] for flat in received] == ["1"]
+
+
+class TestSinks:
+    def test_webhook(self, webhook_url):
+        WebhookSink(webhook_url).send({"count": 1, "flats": [{"id": "1"}]})
+
+        assert WebhookHandler.messages == [{"count": 1, "flats": [{"id": "1"}]}]
+
+    def test_webhook_error_status_raises(self, webhook_url):
+        WebhookHandler.status_codes = [503]
+
+        with pytest.raises(OSError):
+            WebhookSink(webhook_url).send({"count": 0, "flats": []})
+
+    def test_stdout(self):
+        stream = io.StringIO()
+
+        StdoutSink(stream).send({"count": 1, "flats": [FLAT]})
+
+        assert stream.getvalue() == (
+            "New flat: Schöne wohnung | 3.0 rooms | 88 m² | 900 EUR | "
+            + FLAT["url"]
+            + "\n"
+        )
+
+    def test_file(self, tmp_path):
+        sink = FileSink(tmp_path / "notifications.jsonl")
+
+        sink.send({"count": 1, "flats": [{"id": "1"}]})
+        sink.send({"count": 1, "flats": [{"id": "2"}]})
+
+        lines = (tmp_path / "notifications.jsonl").read_text().splitlines()
+        assert [json.loads(line)["flats"][0]["id"] for line in lines] == ["1", "2"]
+
+    def test_build_sink(self, tmp_path):
+        assert isinstance(build_sink("stdout"), StdoutSink)
+        assert isinstance(build_sink("https://example.org/hook"), WebhookSink)
+        assert isinstance(build_sink(f"file:{tmp_path}/flats.jsonl"), FileSink)
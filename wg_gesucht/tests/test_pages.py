@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+from wg_gesucht.middlewares import StripPageMiddleware
+from wg_gesucht.pages import release_parsed_page, strip_page
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+DETAIL_URL = "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html"
+
+
+class TestStripPage:
+    def test_removes_unused_elements(self):
+        body = (FIXTURES_DIR / "detail_page.html").read_bytes()
+
+        stripped = strip_page(body)
+
+        assert b"<script" not in stripped
+        assert b"<style" not in stripped
+        assert b"Anzeige" not in stripped
+        assert b'data-ad_id="10139965"' in stripped
+        assert stripped.rstrip().endswith(b"</html>")
+
+    def test_nested_and_unclosed_ad_cards(self):
+        body = (
+            b"<body><div id='flat'>a</div>"
+            b'<div class="wgg_card offer_list_item"><div>'
+            b'<div class="wgg_card offer_list_item">x</div></div></div>'
+            b"<p>b</p><!-- c --><div class='offer_list_item x wgg_card'>"
+        )
+
+        assert strip_page(body) == b"<body><div id='flat'>a</div><p>b</p>"
+
+    def test_keeps_content_cards(self):
+        """Asserts that only cards of list items are removed, as the
+        content of a flat can be in a wgg_card too."""
+        body = (
+            b'<div class="wgg_card"><div id="rent">900</div></div>'
+            b'<div class="offer_list_item">y</div>'
+        )
+
+        assert strip_page(body) == body
+
+    @pytest.mark.parametrize("file_name", ["detail_page.html", "detail_page_chf.html"])
+    def test_same_flat(self, load_response, file_name):
+        spider = WgGesuchtSpider()
+        search_settings = SearchSettings(city_name="Köln")
+        response = load_response(file_name, DETAIL_URL)
+
+        flat = dict(next(spider.parse_flat(response, search_settings)))
+        stripped_flat = dict(
+            next(
+                spider.parse_flat(
+                    response.replace(body=strip_page(response.body)), search_settings
+                )
+            )
+        )
+
+        flat["meta"].pop("found_at")
+        stripped_flat["meta"].pop("found_at")
+        assert stripped_flat == flat
+
+
+def test_parse_flat_releases_tree(load_response):
+    response = load_response("detail_page.html", DETAIL_URL)
+
+    next(WgGesuchtSpider().parse_flat(response, SearchSettings(city_name="Köln")))
+
+    assert response._cached_selector is None
+    assert response._cached_ubody is None
+    # built again on access
+    release_parsed_page(response)
+    assert response.css("title")
+
+
+def test_release_only_on_checked_scrapy(load_response, monkeypatch):
+    monkeypatch.setattr("wg_gesucht.pages._RELEASE_SUPPORTED", False)
+    response = load_response("detail_page.html", DETAIL_URL)
+    response.css("title")
+
+    release_parsed_page(response)
+
+    assert response._cached_selector is not None
+
+
+class TestStripPageMiddleware:
+    def test_strips_marked_requests(self, load_response):
+        crawler = get_crawler(settings_dict={"STRIP_PAGES_ENABLED": True})
+        middleware = StripPageMiddleware.from_crawler(crawler)
+        marked = load_response(
+            "detail_page.html", DETAIL_URL, meta={"strip_page": True}
+        )
+        unmarked = load_response("detail_page.html", DETAIL_URL)
+
+        stripped = middleware.process_response(marked.request, marked, None)
+
+        assert len(stripped.body) < len(marked.body)
+        assert middleware.process_response(unmarked.request, unmarked, None) is unmarked
+        assert crawler.stats.get_value("strip_page/pages") == 1
+        assert crawler.stats.get_value("strip_page/removed_bytes") == len(
+            marked.body
+        ) - len(stripped.body)
+
+    def test_disabled_by_default(self):
+        with pytest.raises(NotConfigured):
+            StripPageMiddleware.from_crawler(get_crawler())
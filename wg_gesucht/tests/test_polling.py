@@ -0,0 +1,85 @@
+import pytest
+from wg_gesucht.polling import AdaptivePollingSchedule
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+def create_schedule(clock: FakeClock, **kwargs) -> AdaptivePollingSchedule:
+    return AdaptivePollingSchedule(
+        city_names=["Köln", "Berlin"],
+        min_interval=60,
+        max_interval=3600,
+        clock=clock,
+        **kwargs,
+    )
+
+
+def test_all_cities_due_on_start(clock):
+    schedule = create_schedule(clock)
+
+    assert schedule.due_cities() == ["Köln", "Berlin"]
+    assert schedule.seconds_until_next_run() == 0
+
+
+def test_first_run_uses_min_interval(clock):
+    schedule = create_schedule(clock)
+    schedule.record_run("Köln", new_flats=20)
+
+    assert schedule.due_cities() == ["Berlin"]
+    clock.now = 60
+    assert "Köln" in schedule.due_cities()
+
+
+def test_busy_city_is_polled_more_often(clock):
+    schedule = create_schedule(clock, smoothing=1)
+    for city_name in ["Köln", "Berlin"]:
+        schedule.record_run(city_name, new_flats=0)
+
+    clock.now = 600
+    schedule.record_run("Köln", new_flats=5)  # 30 per hour
+    schedule.record_run("Berlin", new_flats=1)  # 6 per hour
+
+    assert schedule.cities["Köln"].interval == 120
+    assert schedule.cities["Berlin"].interval == 600
+
+
+def test_interval_is_clamped(clock):
+    schedule = create_schedule(clock, smoothing=1)
+    schedule.record_run("Köln", new_flats=0)
+    schedule.record_run("Berlin", new_flats=0)
+
+    clock.now = 60
+    schedule.record_run("Köln", new_flats=100)
+    schedule.record_run("Berlin", new_flats=0)
+
+    assert schedule.cities["Köln"].interval == 60
+    assert schedule.cities["Berlin"].interval == 3600
+    assert schedule.seconds_until_next_run() == 60
+
+
+def test_rate_is_smoothed(clock):
+    schedule = create_schedule(clock, smoothing=0.5)
+    schedule.record_run("Köln", new_flats=0)
+    clock.now = 3600
+    schedule.record_run("Köln", new_flats=4)
+    clock.now = 7200
+    schedule.record_run("Köln", new_flats=0)
+
+    assert schedule.cities["Köln"].new_flats_per_hour == 2
+    assert schedule.cities["Köln"].interval == 1800
+
+
+def test_invalid_intervals():
+    with pytest.raises(ValueError):
+        AdaptivePollingSchedule(["Köln"], min_interval=600, max_interval=60)
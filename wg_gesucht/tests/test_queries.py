@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from twisted.web.test.requesthelper import DummyRequest
+from wg_gesucht.queries import FlatQuery, FlatQueryResource, FlatQueryService
+
+FOUND_AT = datetime(2023, 6, 10, 7, 32)
+
+
+def create_flat(flat_id: str, rent: float, rooms: float, city="Köln", minutes=0):
+    return {
+        "id": flat_id,
+        "url": f"https://www.wg-gesucht.de/{flat_id}.html",
+        "rooms": rooms,
+        "rent_costs": {"value": rent, "currency": "EUR"},
+        "postal_code": "51069",
+        "meta": {
+            "found_at": FOUND_AT + timedelta(minutes=minutes),
+            "search_city_name": city,
+        },
+    }
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.flats
+    collection.insert_many(
+        [
+            create_flat("1", 500, 1, minutes=1),
+            create_flat("2", 900, 3, minutes=2),
+            create_flat("3", 700, 2, minutes=3),
+            create_flat("4", 600, 2, city="Berlin", minutes=4),
+        ]
+    )
+    return collection
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def service(collection, clock):
+    return FlatQueryService(collection, cache_ttl=30, clock=clock)
+
+
+def ids(flats: list[dict]) -> list[str]:
+    return [flat["id"] for flat in flats]
+
+
+class TestFlatQuery:
+    def test_filter_and_sort(self, service):
+        query = FlatQuery(city_name="Köln", max_rent=800, min_rooms=1.5)
+        assert ids(service.find(query)) == ["3"]
+
+        assert ids(service.find(FlatQuery(city_name="Köln"))) == ["3", "2", "1"]
+        assert ids(service.find(FlatQuery(sort="rent", limit=2))) == ["1", "4"]
+
+    def test_only_requested_fields(self, service):
+        flats = service.find(FlatQuery(city_name="Berlin", fields=("id", "rooms")))
+
+        assert flats == [{"id": "4", "rooms": 2}]
+
+    def test_from_args(self):
+        query = FlatQuery.from_args(
+            {"city": "Köln", "max_rent": "900", "limit": "10", "fields": "id,url"}
+        )
+
+        assert query == FlatQuery(
+            city_name="Köln", max_rent=900.0, limit=10, fields=("id", "url")
+        )
+
+    @pytest.mark.parametrize(
+        "args", [{"sort": "cheapest"}, {"limit": "1000"}, {"fields": "id,_id"}]
+    )
+    def test_invalid_args(self, args):
+        with pytest.raises(ValueError):
+            FlatQuery.from_args(args)
+
+
+class TestCache:
+    def test_cached_until_ttl(self, service, collection, clock):
+        query = FlatQuery(city_name="Köln")
+        service.find(query)
+        collection.insert_one(create_flat("5", 400, 1, minutes=5))
+
+        assert "5" not in ids(service.find(query))
+        clock.now = 31
+        assert "5" in ids(service.find(query))
+
+    def test_inserted_flats_invalidate_their_city(self, service, collection):
+        cologne, berlin, anywhere = (
+            FlatQuery(city_name="Köln"),
+            FlatQuery(city_name="Berlin"),
+            FlatQuery(),
+        )
+        for query in [cologne, berlin, anywhere]:
+            service.find(query)
+
+        service.flats_inserted([create_flat("5", 400, 1)])
+
+        assert service.cached(cologne) is None
+        assert service.cached(anywhere) is None
+        assert service.cached(berlin) is not None
+
+    def test_read_before_insert_is_not_cached(self, service):
+        query = FlatQuery(city_name="Köln")
+        generation = service.generation
+        flats = service.query_database(query)
+
+        service.flats_inserted([create_flat("5", 400, 1)])
+        service.store(query, flats, generation)
+
+        assert service.cached(query) is None
+
+
+class TestFlatQueryResource:
+    def test_cached_result(self, service):
+        service.find(FlatQuery(city_name="Berlin", fields=("id",)))
+        request = DummyRequest([b"flats"])
+        request.args = {b"city": [b"Berlin"], b"fields": [b"id"]}
+
+        body = FlatQueryResource(service).render_GET(request)
+
+        assert json.loads(body) == {"count": 1, "flats": [{"id": "4"}]}
+
+    def test_invalid_query(self, service):
+        request = DummyRequest([b"flats"])
+        request.args = {b"limit": [b"0"]}
+
+        body = FlatQueryResource(service).render_GET(request)
+
+        assert request.responseCode == 400
+        assert "limit" in json.loads(body)["error"]
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+from itemadapter import ItemAdapter
+from wg_gesucht.items import FlatItem
+from wg_gesucht.records import Cost, Currency, FlatRecord, Size, SizeUnit
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+DETAIL_URL = "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html"
+
+
+@pytest.mark.parametrize("file_name", ["detail_page.html", "detail_page_chf.html"])
+def test_document_equals_item_dict(load_response, file_name):
+    """Asserts that the record of a scraped flat converts
+    to the same document as the item itself."""
+    response = load_response(file_name, DETAIL_URL)
+    item = next(
+        WgGesuchtSpider().parse_flat(response, SearchSettings(city_name="Köln"))
+    )
+
+    assert FlatRecord.from_item(item).to_document() == ItemAdapter(item).asdict()
+
+
+def test_costs_and_size_are_compact():
+    record = FlatRecord.from_item(
+        FlatItem(
+            id="1",
+            size={"amount": 20.0, "unit": "m2"},
+            rent_costs={"value": 500.0, "currency": "EUR"},
+            meta={"found_at": datetime(2023, 6, 1), "search_city_name": "Köln"},
+        )
+    )
+
+    assert record.rent_costs == Cost(500.0, Currency.EUR)
+    assert record.size == Size(20.0, SizeUnit.SQUARE_METERS)
+    assert record.deposit is None
+    assert record.found_at == datetime(2023, 6, 1)
+    assert not hasattr(record, "__dict__")
+
+
+def test_document_leaves_out_missing_values():
+    document = FlatRecord.from_item(FlatItem(id="1", title="Flat")).to_document()
+
+    assert document == {"id": "1", "title": "Flat"}
+    assert type(next(iter(document.values()))) is str
+
+
+def test_other_meta_values_are_kept():
+    document = FlatRecord.from_item(
+        FlatItem(id="1", meta={"source": "replay"})
+    ).to_document()
+
+    assert document["meta"] == {"source": "replay"}
+
+
+def test_unknown_field():
+    with pytest.raises(TypeError):
+        FlatRecord(id="1", garden=True)
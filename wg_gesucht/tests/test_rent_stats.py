@@ -0,0 +1,161 @@
+import mongomock
+import pytest
+from scrapy.settings import Settings
+from wg_gesucht.commands.bootstrap_db import Command
+from wg_gesucht.db_settings import DatabaseSettings
+from wg_gesucht.items import FlatItem
+from wg_gesucht.pipelines import WgGesuchtPipeline
+from wg_gesucht.rent_stats import (
+    RentHistogram,
+    compute_rent_histograms,
+    read_rent_stats,
+    recompute_rent_stats,
+    rent_per_sqm,
+    rent_stats_updates,
+)
+
+
+def create_flat(flat_id: str, rent: float, size: float, postal_code="51069") -> dict:
+    return {
+        "id": flat_id,
+        "size": {"amount": size, "unit": "m2"},
+        "rent_costs": {"value": rent, "currency": "EUR"},
+        "postal_code": postal_code,
+        "meta": {"search_city_name": "Köln"},
+    }
+
+
+FLATS = [
+    create_flat("1", 500, 50),
+    create_flat("2", 600, 50),
+    create_flat("3", 700, 50),
+    create_flat("4", 1500, 100, postal_code="50667"),
+    # without size, not counted
+    {**create_flat("5", 500, 50), "size": None},
+]
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+class TestRentHistogram:
+    def test_rent_per_sqm(self):
+        assert rent_per_sqm(FLATS[0]) == (("Köln", "51069", "EUR"), 10.0)
+        assert rent_per_sqm(FLATS[4]) is None
+        assert rent_per_sqm({**FLATS[0], "size": {"amount": 0, "unit": "m2"}}) is None
+
+    def test_percentile(self):
+        histogram = RentHistogram()
+        for value in [10.0, 12.0, 14.0]:
+            histogram.add(value)
+
+        assert histogram.percentile(0.5) == pytest.approx(11.75)
+        assert histogram.percentile(0) == 9.5
+        assert RentHistogram().percentile(0.5) is None
+
+    def test_above_highest_bound(self):
+        histogram = RentHistogram()
+        histogram.add(100.0)
+
+        assert histogram.percentile(0.5) == 60.0
+
+    def test_merge(self):
+        first, second = RentHistogram(), RentHistogram()
+        first.add(10.0)
+        second.add(14.0)
+
+        first.merge(second)
+
+        assert first.count == 2
+        assert first.sum == 24.0
+
+    def test_document_roundtrip(self):
+        histogram = RentHistogram()
+        histogram.add(10.0)
+
+        restored = RentHistogram.from_document(histogram.to_document())
+
+        assert restored.counts == histogram.counts
+        assert restored.sum == 10.0
+
+
+class TestRentStats:
+    def test_updates_merge_into_stored_stats(self, database):
+        database.rent_stats.bulk_write(rent_stats_updates(FLATS[:2]))
+        database.rent_stats.bulk_write(rent_stats_updates(FLATS[2:]))
+
+        stats = read_rent_stats(database.rent_stats, "Köln")
+
+        assert [(row["postal_code"], row["count"]) for row in stats] == [
+            ("50667", 1),
+            ("51069", 3),
+        ]
+        assert stats[1]["mean"] == 12.0
+        assert 11.5 <= stats[1]["p50"] <= 12.0
+
+    def test_one_update_per_postal_code(self):
+        assert len(rent_stats_updates(FLATS)) == 2
+
+    def test_recompute(self, database):
+        database.flats.insert_many([dict(flat) for flat in FLATS])
+        database.rent_stats.insert_one(
+            {"city_name": "Berlin", "postal_code": "10115", "currency": "EUR"}
+        )
+        database.rent_stats.bulk_write(rent_stats_updates(FLATS[:1]))
+
+        assert recompute_rent_stats(database.flats, database.rent_stats) == 2
+
+        assert read_rent_stats(database.rent_stats, "Berlin") == []
+        stats = read_rent_stats(database.rent_stats, "Köln", "51069")
+        assert stats[0]["count"] == 3
+
+    def test_numpy_recompute_matches(self, monkeypatch):
+        pytest.importorskip("numpy")
+        flats = FLATS + [
+            # on a bucket bound and above the highest bound
+            create_flat("6", 1050, 100),
+            create_flat("7", 10000, 10, postal_code="50667"),
+            create_flat("8", 499.99, 50.5, postal_code="10115"),
+        ]
+        histograms = compute_rent_histograms(flats)
+
+        monkeypatch.setitem(__import__("sys").modules, "numpy", None)
+        expected = compute_rent_histograms(flats)
+
+        assert histograms.keys() == expected.keys()
+        for key, histogram in histograms.items():
+            assert histogram.counts == expected[key].counts
+            assert histogram.count == expected[key].count
+            assert histogram.sum == pytest.approx(expected[key].sum)
+
+    def test_pipeline_counts_new_flats_only(self, mocker):
+        mocker.patch("wg_gesucht.pipelines.MongoClient", mongomock.MongoClient)
+        pipeline = WgGesuchtPipeline(
+            "mongodb://localhost:27017",
+            "test_db",
+            rent_stats_collection_name="rent_stats",
+        )
+
+        pipeline.process_item(FlatItem(create_flat("1", 500, 50)), None)
+        pipeline.process_item(FlatItem(create_flat("1", 500, 50)), None)
+
+        stats = read_rent_stats(pipeline._rent_stats, "Köln")
+        assert stats[0]["count"] == 1
+        assert "rent_stats_key" in pipeline._rent_stats.index_information()
+
+    def test_bootstrap_command_creates_rent_stats_index(self, mocker):
+        client = mongomock.MongoClient()
+        mocker.patch("wg_gesucht.pipelines.MongoClient", return_value=client)
+        command = Command()
+        command.settings = Settings(
+            {
+                "DB_SETTINGS": DatabaseSettings("mongodb://localhost:27017", "test_db"),
+                "RENT_STATS_COLLECTION": "rent_stats",
+            }
+        )
+
+        command.run([], None)
+
+        assert "rent_stats_key" in client.test_db.rent_stats.index_information()
@@ -1,5 +1,9 @@
+import json
+
+import bson
 import pytest
-from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.listing_cards import ListingCard
+from wg_gesucht.search_settings import SearchSettings, load_search_profiles
 
 
 class TestSearchSettingsInit:
@@ -79,3 +83,147 @@ class TestSearchSettingsInit:
         assert settings.only_permanent_contracts is True
         assert settings.max_rent is None
         assert settings.min_rooms is None
+
+
+class TestSearchSettingsDocument:
+    def test_bson_round_trip(self):
+        settings = SearchSettings(
+            city_name="Köln",
+            only_permanent_contracts="true",
+            max_rent="900",
+            min_rooms="2.5",
+            min_size="40",
+            max_rent_per_sqm="14.5",
+            districts="Ehrenfeld, Sülz",
+        )
+
+        document = bson.decode(bson.encode(settings.to_document()))
+
+        assert SearchSettings.from_document(document) == settings
+
+    def test_defaults_round_trip(self):
+        settings = SearchSettings(city_name="Berlin")
+
+        document = bson.decode(bson.encode(settings.to_document()))
+
+        assert SearchSettings.from_document(document) == settings
+
+
+def create_card(rent=None, size=None, rooms=None, district=None) -> ListingCard:
+    return ListingCard(
+        flat_id="1",
+        detail_link="/1.html",
+        online_since=None,
+        rent={"value": rent, "currency": "EUR"} if rent else None,
+        size=size,
+        rooms=rooms,
+        district=district,
+    )
+
+
+class TestCardFilters:
+    @pytest.mark.parametrize(
+        "name, value", [("min_size", "abc"), ("max_rent_per_sqm", "-5")]
+    )
+    def test_invalid_number(self, name, value):
+        with pytest.raises(ValueError):
+            SearchSettings(city_name="Berlin", **{name: value})
+
+    def test_min_size(self):
+        settings = SearchSettings(city_name="Köln", min_size="50")
+
+        assert settings.matches_card(create_card(size=54.0))
+        assert not settings.matches_card(create_card(size=31.0))
+
+    def test_min_rooms(self):
+        settings = SearchSettings(city_name="Köln", min_rooms="2.5")
+
+        assert settings.matches_card(create_card(rooms=3.0))
+        assert settings.matches_card(create_card(rooms=2.5))
+        assert not settings.matches_card(create_card(rooms=2.0))
+
+    def test_max_rent_per_sqm(self):
+        settings = SearchSettings(city_name="Köln", max_rent_per_sqm="14.5")
+
+        assert settings.matches_card(create_card(rent=780, size=54.0))
+        assert not settings.matches_card(create_card(rent=620, size=31.0))
+
+    def test_districts(self):
+        settings = SearchSettings(city_name="Köln", districts="Ehrenfeld, sülz")
+
+        assert settings.matches_card(create_card(district="Köln Sülz"))
+        assert not settings.matches_card(create_card(district="Köln Dellbrück"))
+
+    def test_missing_card_values_match(self):
+        settings = SearchSettings(
+            city_name="Köln",
+            min_rooms="3",
+            min_size="50",
+            max_rent_per_sqm="10",
+            districts="Sülz",
+        )
+
+        assert settings.matches_card(create_card())
+
+
+class TestLoadSearchProfiles:
+    def test_single_profile_from_env(self):
+        profiles = load_search_profiles({"CITY_NAME": "Berlin", "MAX_RENT": "900"})
+        assert len(profiles) == 1
+        assert profiles[0].city_name == "Berlin"
+        assert profiles[0].max_rent == 900
+
+    def test_numbered_profiles_from_env(self):
+        profiles = load_search_profiles(
+            {
+                "CITY_NAME_2": "Köln",
+                "MIN_ROOMS_2": "2.5",
+                "CITY_NAME_1": "Berlin",
+                "ONLY_PERMANENT_CONTRACTS_1": "true",
+                "CITY_NAME_10": "Hamburg",
+            }
+        )
+        assert [profile.city_name for profile in profiles] == [
+            "Berlin",
+            "Köln",
+            "Hamburg",
+        ]
+        assert profiles[0].only_permanent_contracts is True
+        assert profiles[1].min_rooms == 2.5
+
+    def test_missing_city_name(self):
+        with pytest.raises(ValueError):
+            load_search_profiles({})
+
+    def test_profiles_from_file(self, tmp_path):
+        path = tmp_path / "profiles.json"
+        path.write_text(
+            json.dumps(
+                [
+                    {"city_name": "Berlin", "max_rent": 1200, "min_rooms": 2.5},
+                    {
+                        "city_name": "Köln",
+                        "only_permanent_contracts": True,
+                        "min_size": 40,
+                        "districts": ["Ehrenfeld", "Sülz"],
+                    },
+                ]
+            )
+        )
+
+        profiles = load_search_profiles(
+            {"SEARCH_PROFILES_FILE": str(path), "CITY_NAME": "Ignored"}
+        )
+
+        assert [profile.city_name for profile in profiles] == ["Berlin", "Köln"]
+        assert profiles[0].max_rent == 1200
+        assert profiles[1].only_permanent_contracts is True
+        assert profiles[1].min_size == 40.0
+        assert profiles[1].districts == ["ehrenfeld", "sülz"]
+
+    def test_invalid_profiles_file(self, tmp_path):
+        path = tmp_path / "profiles.json"
+        path.write_text(json.dumps({"city_name": "Berlin"}))
+
+        with pytest.raises(ValueError):
+            load_search_profiles({"SEARCH_PROFILES_FILE": str(path)})
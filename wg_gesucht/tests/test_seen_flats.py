@@ -0,0 +1,45 @@
+from wg_gesucht.seen_flats import BloomFilter, SeenFlatIds
+
+
+class TestSeenFlatIds:
+    def test_contains_numeric_and_string_ids(self):
+        seen = SeenFlatIds(["10139965", " 123 ", "abc"])
+        assert "10139965" in seen
+        assert 123 in seen
+        assert "abc" in seen
+        assert "10139970" not in seen
+
+    def test_len_ignores_duplicates(self):
+        seen = SeenFlatIds(["1", "1", 1])
+        assert len(seen) == 1
+
+    def test_uses_bloom_filter_above_threshold(self):
+        seen = SeenFlatIds(["1", "2"], expected_amount=10, bloom_threshold=5)
+        assert isinstance(seen._ids, BloomFilter)
+        assert "1" in seen
+        assert 2 in seen
+
+    def test_from_collection(self, mocker):
+        collection = mocker.Mock()
+        collection.find.return_value = [{"id": "1"}, {"id": "2"}, {}]
+        collection.estimated_document_count.return_value = 3
+
+        seen = SeenFlatIds.from_collection(collection)
+
+        assert len(seen) == 2
+        assert "2" in seen
+
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        for i in range(1000):
+            bloom.add(str(i))
+        assert all(str(i) in bloom for i in range(1000))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(str(i))
+        false_positives = sum(str(i) in bloom for i in range(1000, 11000))
+        assert false_positives < 300
@@ -0,0 +1,306 @@
+from datetime import timedelta
+
+from scrapy.utils.test import get_crawler
+from wg_gesucht.city_id_cache import CityIdCache
+from wg_gesucht.listing_cards import ListingCard
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.seen_flats import SeenFlatIds
+from wg_gesucht.spiders.wg_gesucht import (
+    SEARCH_REQUEST_PRIORITY,
+    WgGesuchtSpider,
+    detail_request_priority,
+)
+
+RESULTS_URL = (
+    "https://www.wg-gesucht.de/"
+    "1-zimmer-wohnungen-und-wohnungen-in-Koeln.73.1+2.1.0.html"
+)
+
+SEARCH_SETTINGS = SearchSettings(city_name="Köln")
+
+
+def create_spider(**settings) -> WgGesuchtSpider:
+    crawler = get_crawler(
+        WgGesuchtSpider,
+        {"SEARCH_PROFILES": [SEARCH_SETTINGS], "CITY_ID_CACHE_PATH": "", **settings},
+    )
+    return WgGesuchtSpider.from_crawler(crawler)
+
+
+class TestSearchProfiles:
+    def test_one_request_per_profile(self):
+        profiles = [
+            SearchSettings(city_name="Köln"),
+            SearchSettings(city_name="Köln", max_rent="900"),
+            SearchSettings(city_name="Berlin"),
+        ]
+        spider = create_spider(SEARCH_PROFILES=profiles)
+
+        requests = list(spider.start_requests())
+
+        assert len(requests) == 3
+        assert [request.cb_kwargs["search_settings"] for request in requests] == (
+            profiles
+        )
+        assert all(request.dont_filter for request in requests)
+
+    def test_profiles_loaded_from_env(self, monkeypatch):
+        monkeypatch.setenv("CITY_NAME", "Berlin")
+        spider = create_spider(SEARCH_PROFILES=[])
+
+        requests = list(spider.start_requests())
+
+        assert requests[0].cb_kwargs["search_settings"].city_name == "Berlin"
+
+    def test_profiles_given_to_spider(self):
+        profile = SearchSettings(city_name="Berlin")
+        crawler = get_crawler(
+            WgGesuchtSpider,
+            {"SEARCH_PROFILES": [SEARCH_SETTINGS], "CITY_ID_CACHE_PATH": ""},
+        )
+        spider = WgGesuchtSpider.from_crawler(crawler, search_profiles=[profile])
+
+        requests = list(spider.start_requests())
+
+        assert [request.cb_kwargs["search_settings"] for request in requests] == [
+            profile
+        ]
+
+    def test_profile_is_passed_to_detail_requests(self, load_response):
+        spider = WgGesuchtSpider()
+        response = load_response("results_page.html", RESULTS_URL)
+
+        requests = list(
+            spider.parse_flat_detail_links(response, search_settings=SEARCH_SETTINGS)
+        )
+
+        assert all(
+            request.cb_kwargs == {"search_settings": SEARCH_SETTINGS}
+            for request in requests
+        )
+
+
+class TestCityIdLookup:
+    def test_requests_city_id_on_cache_miss(self, tmp_path):
+        spider = create_spider(CITY_ID_CACHE_PATH=str(tmp_path / "city_ids.json"))
+
+        requests = list(spider.start_requests())
+
+        assert len(requests) == 1
+        assert "ajax/getCities.php" in requests[0].url
+        assert "query=K%C3%B6ln" in requests[0].url
+
+    def test_uses_cached_city_id(self, tmp_path):
+        path = tmp_path / "city_ids.json"
+        CityIdCache(path=path, ttl=60).set("Köln", "73")
+        spider = create_spider(CITY_ID_CACHE_PATH=str(path), CITY_ID_CACHE_TTL=60)
+
+        requests = list(spider.start_requests())
+
+        assert len(requests) == 1
+        assert "wohnungen-in-Koeln.73.1+2.1.0.html" in requests[0].url
+        assert requests[0].callback == spider.parse_flat_detail_links
+
+    def test_caches_looked_up_city_id(self, tmp_path, load_response):
+        path = tmp_path / "city_ids.json"
+        spider = create_spider(CITY_ID_CACHE_PATH=str(path))
+        city_request = next(spider.start_requests())
+        response = load_response("get_cities.json", city_request.url)
+
+        requests = list(spider.parse_city_response(response, **city_request.cb_kwargs))
+
+        assert "wohnungen-in-Koeln.73.1+2.1.0.html" in requests[0].url
+        assert CityIdCache(path=path, ttl=60).get("Köln") == "73"
+
+
+class TestParseFlatDetailLinks:
+    def test_follows_all_flats(self, load_response):
+        spider = WgGesuchtSpider()
+        response = load_response("results_page.html", RESULTS_URL)
+
+        requests = list(
+            spider.parse_flat_detail_links(response, search_settings=SEARCH_SETTINGS)
+        )
+
+        assert [request.url for request in requests] == [
+            "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html",
+            "https://www.wg-gesucht.de/wohnungen-in-Koeln-Ehrenfeld.10139970.html",
+            "https://www.wg-gesucht.de/1-zimmer-wohnungen-in-Koeln-Suelz.10139921.html",
+        ]
+
+    def test_skips_seen_flats(self, load_response):
+        spider = WgGesuchtSpider()
+        spider.seen_flat_ids = SeenFlatIds(["10139965", "10139921"])
+        response = load_response("results_page.html", RESULTS_URL)
+
+        requests = list(
+            spider.parse_flat_detail_links(response, search_settings=SEARCH_SETTINGS)
+        )
+
+        assert [request.url for request in requests] == [
+            "https://www.wg-gesucht.de/wohnungen-in-Koeln-Ehrenfeld.10139970.html",
+        ]
+
+    def test_skips_cards_not_matching_filters(self, load_response):
+        spider = create_spider()
+        response = load_response("results_page.html", RESULTS_URL)
+        search_settings = SearchSettings(city_name="Köln", min_size="50")
+
+        requests = list(
+            spider.parse_flat_detail_links(response, search_settings=search_settings)
+        )
+
+        assert [request.url.rsplit(".", 2)[-2] for request in requests] == [
+            "10139965",
+            "10139970",
+        ]
+        assert spider.crawler.stats.get_value("flats/skipped_filtered") == 1
+
+
+class TestRequestPriority:
+    def test_newer_flats_first(self, load_response):
+        spider = WgGesuchtSpider()
+        response = load_response("results_page.html", RESULTS_URL)
+
+        requests = list(
+            spider.parse_flat_detail_links(response, search_settings=SEARCH_SETTINGS)
+        )
+
+        priorities = [request.priority for request in requests]
+        assert priorities == sorted(priorities, reverse=True)
+        assert all(priority < SEARCH_REQUEST_PRIORITY for priority in priorities)
+
+    def test_age_before_position(self):
+        def card(online_since):
+            return ListingCard(flat_id="1", detail_link="", online_since=online_since)
+
+        assert detail_request_priority(
+            card(timedelta(minutes=5)), rank=20
+        ) > detail_request_priority(card(timedelta(hours=2)), rank=0)
+        assert detail_request_priority(card(None), rank=0) < detail_request_priority(
+            card(timedelta(hours=12)), rank=10
+        )
+        assert detail_request_priority(
+            card(timedelta(minutes=5)), rank=0
+        ) > detail_request_priority(card(timedelta(minutes=5)), rank=1)
+
+    def test_next_page_after_oldest_flat(self, load_response):
+        spider = create_spider()
+        spider._max_pages = 2
+        response = load_response("results_page.html", RESULTS_URL)
+
+        *details, next_page = spider.parse_flat_detail_links(
+            response, search_settings=SEARCH_SETTINGS, city_id="73"
+        )
+
+        assert next_page.priority == min(r.priority for r in details) - 1
+
+    def test_search_requests_first(self):
+        requests = list(create_spider().start_requests())
+
+        assert requests[0].priority == SEARCH_REQUEST_PRIORITY
+
+
+class TestPagination:
+    def parse_page(self, spider, load_response, page=0):
+        response = load_response("results_page.html", RESULTS_URL)
+        return list(
+            spider.parse_flat_detail_links(
+                response, search_settings=SEARCH_SETTINGS, city_id="73", page=page
+            )
+        )
+
+    def test_only_first_page_by_default(self, load_response):
+        requests = self.parse_page(create_spider(), load_response)
+        assert all(request.callback.__name__ == "parse_flat" for request in requests)
+
+    def test_follows_next_page_with_only_new_flats(self, load_response):
+        spider = create_spider()
+        spider._max_pages = 3
+
+        requests = self.parse_page(spider, load_response, page=1)
+
+        next_page = requests[-1]
+        assert len(requests) == 4
+        assert "wohnungen-in-Koeln.73.1+2.1.2.html" in next_page.url
+        assert next_page.cb_kwargs["page"] == 2
+
+    def test_stops_at_max_pages(self, load_response):
+        spider = create_spider()
+        spider._max_pages = 2
+
+        requests = self.parse_page(spider, load_response, page=1)
+
+        assert len(requests) == 3
+
+    def test_stops_at_stored_flat(self, load_response):
+        spider = create_spider()
+        spider._max_pages = 3
+        spider.seen_flat_ids = SeenFlatIds(["10139921"])
+
+        requests = self.parse_page(spider, load_response)
+
+        assert len(requests) == 2
+        assert all(request.callback.__name__ == "parse_flat" for request in requests)
+
+    def test_stops_at_max_listing_age(self, load_response):
+        spider = create_spider()
+        spider._max_pages = 3
+        spider._max_listing_age = timedelta(hours=12)
+
+        requests = self.parse_page(spider, load_response)
+
+        assert [request.url.rsplit(".", 2)[-2] for request in requests] == [
+            "10139965",
+            "10139970",
+        ]
+
+
+DETAIL_URL = "https://www.wg-gesucht.de/wohnungen-in-Koeln-Dellbrueck.10139965.html"
+
+
+class TestParseFlat:
+    def parse(self, load_response, file_name, url=DETAIL_URL) -> dict:
+        response = load_response(file_name, url)
+        item = next(WgGesuchtSpider().parse_flat(response, SEARCH_SETTINGS))
+        flat = dict(item)
+        assert flat["meta"].pop("found_at")
+        return flat
+
+    def test_detail_page(self, load_response):
+        assert self.parse(load_response, "detail_page.html") == {
+            "id": "10139965",
+            "url": DETAIL_URL,
+            "title": (
+                "Shöne 3-zimmer wohnung mit grandiosen ausblick"
+                " - wohnung in köln-dellbrück"
+            ),
+            "rooms": 3.0,
+            "size": {"amount": 88.0, "unit": "m2"},
+            "rent_costs": {"value": 900.0, "currency": "EUR"},
+            "utilities_costs": {"value": 250.0, "currency": "EUR"},
+            "deposit": {"value": 1700.0, "currency": "EUR"},
+            "other_costs": {"value": 2000.0, "currency": "EUR"},
+            "street": "Grafenmühlenweg 145",
+            "postal_code": "51069",
+            "city_name": "Köln dellbrück",
+            "move_in_date": "01.09.2023",
+            "meta": {"search_city_name": "Köln"},
+        }
+
+    def test_detail_page_with_missing_values(self, load_response):
+        url = "https://www.wg-gesucht.de/wohnungen-in-Zuerich.9981234.html"
+        assert self.parse(load_response, "detail_page_chf.html", url) == {
+            "id": "9981234",
+            "url": url,
+            "title": "Helle 2,5-zimmer-wohnung am see - wohnung in zürich-wiedikon",
+            "rooms": 2.5,
+            "size": {"amount": 65.0, "unit": "m2"},
+            "rent_costs": {"value": 1850.5, "currency": "CHF"},
+            "additional_flat_costs": {"value": 120.0, "currency": "CHF"},
+            "deposit": {"value": 3700.0, "currency": "CHF"},
+            "street": "Birmensdorferstrasse 12",
+            "postal_code": "8003",
+            "city_name": "Zürich wiedikon",
+            "meta": {"search_city_name": "Köln"},
+        }
@@ -0,0 +1,187 @@
+import base64
+import gzip
+import json
+import logging
+import os
+import zlib
+from collections import deque
+from concurrent.futures import Executor, Future
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from scrapy.http import Headers, Request, Response
+from scrapy.responsetypes import responsetypes
+
+logger = logging.getLogger()
+
+
+class ResponseArchive:
+    """Append-only archive of raw responses, as gzip compressed json lines.
+
+    Every line holds the url, status, headers, base64 body and the time a
+    response was recorded, plus the callback it was meant for and the city
+    of its search, so it can be parsed again later without the network.
+    """
+
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+        self._file = None
+
+    @classmethod
+    def in_directory(cls, archive_dir: str | Path) -> "ResponseArchive":
+        """Returns: Archive in a new file of the directory, one per crawl."""
+        name: str = (
+            f"responses-{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.jsonl.gz"
+        )
+        return cls(Path(archive_dir) / name)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def record(self, response: Response, recorded_at: Optional[datetime] = None):
+        request: Optional[Request] = response.request
+        search_settings = request.cb_kwargs.get("search_settings") if request else None
+        record: dict[str, Any] = {
+            "url": response.url,
+            "status": response.status,
+            "headers": {
+                key: value
+                for key, value in response.headers.to_unicode_dict().items()
+                if key.lower() != "set-cookie"
+            },
+            "body": base64.b64encode(response.body).decode(),
+            "recorded_at": (recorded_at or datetime.utcnow()).isoformat(),
+            "callback": getattr(request.callback, "__name__", None)
+            if request
+            else None,
+            "search_city_name": getattr(search_settings, "city_name", None),
+        }
+        if self._file is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = gzip.open(self._path, "ab")
+        self._file.write(json.dumps(record).encode() + b"\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def archive_paths(paths: Iterable[str | Path]) -> list[Path]:
+    """Returns: The given archive files and the archives in the given
+    directories, oldest first."""
+    files: list[Path] = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob("*.jsonl.gz")) if path.is_dir() else [path])
+    return files
+
+
+def read_archive(paths: Iterable[str | Path]) -> Iterator[dict[str, Any]]:
+    """Reads the records of the archives one by one. An archive cut off by
+    a crash is read up to the last complete record."""
+    for path in archive_paths(paths):
+        try:
+            with gzip.open(path, "rb") as archive_file:
+                for line in archive_file:
+                    if line.endswith(b"\n"):
+                        yield json.loads(line)
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            logger.warning(f"Archive {path} ends early: {e}")
+
+
+def to_response(record: dict[str, Any]) -> Response:
+    """Returns: The recorded response, as the spider got it."""
+    headers = Headers(record["headers"])
+    body: bytes = base64.b64decode(record["body"])
+    response_class = responsetypes.from_args(
+        headers=headers, url=record["url"], body=body
+    )
+    return response_class(
+        url=record["url"],
+        status=record["status"],
+        headers=headers,
+        body=body,
+        request=Request(record["url"]),
+    )
+
+
+_spider = None
+
+
+def parse_flat_records(records: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Parses the recorded flat detail pages with parse_flat.
+    Runs in the worker processes of replay_archive.
+
+    Returns: Flats as dicts, found at the time their page was recorded.
+    """
+    global _spider
+    # imported here, so reading archives does not load the spider
+    from wg_gesucht.search_settings import SearchSettings
+    from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+    if _spider is None:
+        _spider = WgGesuchtSpider()
+
+    flats: list[dict[str, Any]] = []
+    for record in records:
+        try:
+            for item in _spider.parse_flat(
+                to_response(record),
+                search_settings=SearchSettings(city_name=record["search_city_name"]),
+            ):
+                flat: dict[str, Any] = dict(item)
+                flat["meta"]["found_at"] = datetime.fromisoformat(record["recorded_at"])
+                flats.append(flat)
+        except Exception as e:
+            logger.warning(f"Failed to parse recorded {record['url']}: {e}")
+    return flats
+
+
+def _batches(
+    records: Iterable[dict[str, Any]], batch_size: int
+) -> Iterator[list[dict[str, Any]]]:
+    batch: list[dict[str, Any]] = []
+    for record in records:
+        if record.get("callback") == "parse_flat" and record.get("status") == 200:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def replay_archive(
+    paths: Iterable[str | Path],
+    executor: Executor,
+    process_flat: Callable[[dict[str, Any]], Any],
+    batch_size: int = 50,
+    max_pending_batches: int = 8,
+) -> int:
+    """Parses the recorded flat detail pages of the archives on the executor
+    and hands the flats to process_flat in the order they were recorded,
+    so a later recording of a flat wins.
+
+    At most max_pending_batches batches are read ahead,
+    so the memory use does not grow with the archive.
+
+    Returns: Amount of replayed flats.
+    """
+    count: int = 0
+    pending: deque[Future] = deque()
+
+    def process_oldest() -> int:
+        flats: list[dict[str, Any]] = pending.popleft().result()
+        for flat in flats:
+            process_flat(flat)
+        return len(flats)
+
+    for batch in _batches(read_archive(paths), batch_size):
+        pending.append(executor.submit(parse_flat_records, batch))
+        if len(pending) >= max_pending_batches:
+            count += process_oldest()
+    while pending:
+        count += process_oldest()
+    return count
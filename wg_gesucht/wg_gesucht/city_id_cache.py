@@ -0,0 +1,62 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger()
+
+
+class CityIdCache:
+    """Persistent mapping of city names to the city ids used by wg-gesucht.
+
+    The ids are stored in a local json file and expire after the given ttl,
+    so the city lookup request is only needed on a miss.
+    """
+
+    def __init__(self, path: str | Path, ttl: float):
+        """
+        Args:
+            path: Path of the json file the ids are stored in.
+            ttl: Seconds after which a cached city id is looked up again.
+        """
+        self._path = Path(path)
+        self._ttl = ttl
+        self._entries: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self._path, encoding="utf-8") as cache_file:
+                entries = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable city id cache {self._path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _key(self, city_name: str) -> str:
+        return city_name.strip().lower()
+
+    def get(self, city_name: str) -> Optional[str]:
+        """Returns: Cached city id or None if it is missing or expired."""
+        entry: Optional[dict] = self._entries.get(self._key(city_name))
+        if not entry or time.time() - entry.get("cached_at", 0) > self._ttl:
+            return None
+        return entry.get("city_id")
+
+    def set(self, city_name: str, city_id: str):
+        """Caches the city id and writes the cache file."""
+        self._entries[self._key(city_name)] = {
+            "city_id": city_id,
+            "cached_at": time.time(),
+        }
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path: Path = self._path.with_suffix(self._path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(self._entries, cache_file)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.warning(f"Failed to write city id cache {self._path}: {e}")
@@ -0,0 +1,34 @@
+import os
+
+from scrapy.commands import ScrapyCommand
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+
+
+class Command(ScrapyCommand):
+    """Checks the database connection and creates the indexes of the flats
+    and of the rent stats, see RENT_STATS_COLLECTION.
+
+    Crawls can then skip both on start with DB_ENSURE_INDEXES = False.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Check the database connection and create missing indexes"
+
+    def run(self, args, opts):
+        # imported here, so the other commands start without pymongo
+        from wg_gesucht.pipelines import WgGesuchtPipeline
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        pipeline = WgGesuchtPipeline(
+            connection_uri=db_settings.connection_uri,
+            db_name=db_settings.db_name,
+            ensure_indexes=False,
+            rent_stats_collection_name=self.settings.get("RENT_STATS_COLLECTION"),
+        )
+        created: list[str] = pipeline.bootstrap_database()
+        print(f"Created indexes: {', '.join(created)}" if created else "Up to date")
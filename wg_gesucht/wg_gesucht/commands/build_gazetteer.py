@@ -0,0 +1,72 @@
+import os
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+from wg_gesucht.gazetteer import (
+    PostalCodeGazetteer,
+    centroids_from_geonames,
+    locate_stored_flats,
+    read_geonames_lines,
+    write_gazetteer,
+)
+
+
+class Command(ScrapyCommand):
+    """Builds the postal code table the pipeline locates flats with,
+    see GAZETTEER_PATH, from the postal codes of GeoNames
+    (DE.zip of https://download.geonames.org/export/zip/, CC BY 4.0).
+
+    The centroid of a postal code is the mean of the coordinates of its places.
+    With --locate-flats the stored flats without location are located after.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <GeoNames DE.zip or DE.txt>"
+
+    def short_desc(self):
+        return "Build the postal code table used to locate flats"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--output", help="path of the table (default: GAZETTEER_PATH)"
+        )
+        parser.add_argument(
+            "--locate-flats",
+            action="store_true",
+            help="add the location to the stored flats without one",
+        )
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        output: str = opts.output or self.settings.get("GAZETTEER_PATH")
+        if not output:
+            raise UsageError("Give --output or set GAZETTEER_PATH")
+
+        count: int = write_gazetteer(
+            output, centroids_from_geonames(read_geonames_lines(args[0]))
+        )
+        print(f"Wrote {count} postal codes to {output}")
+        if not opts.locate_flats:
+            return
+
+        # imported here, so building the table works without a database
+        from pymongo import MongoClient
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        client = MongoClient(db_settings.connection_uri)
+        try:
+            with PostalCodeGazetteer(output) as gazetteer:
+                located: int = locate_stored_flats(
+                    client[db_settings.db_name]["flats"], gazetteer
+                )
+        finally:
+            client.close()
+        print(f"Located {located} stored flats")
@@ -0,0 +1,142 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Optional
+
+from scrapy.commands import ScrapyCommand
+from scrapy.crawler import Crawler
+from scrapy.exceptions import UsageError
+from twisted.internet import defer, task
+from wg_gesucht.db_settings import load_db_settings_from_env
+from wg_gesucht.gazetteer import PostalCodeGazetteer
+from wg_gesucht.polling import AdaptivePollingSchedule
+from wg_gesucht.queries import FlatQueryService, listen
+from wg_gesucht.search_settings import SearchSettings, load_search_profiles
+from wg_gesucht.signals import flats_inserted
+from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
+
+logger = logging.getLogger()
+
+
+class Command(ScrapyCommand):
+    """Runs the spider again and again in one process.
+
+    The Mongo client, the prepared database and the stored flat ids are kept
+    between the crawls. Each city is searched on its own interval,
+    see AdaptivePollingSchedule.
+
+    With QUERY_PORT set, the stored flats are served like by the serve_flats
+    command, and the flats inserted by the crawls drop the cached results.
+    """
+
+    requires_project = True
+    default_settings = {"DB_REUSE_CLIENT": True}
+
+    def short_desc(self):
+        return "Crawl continuously, polling each city on an adaptive interval"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            help="shortest seconds between runs of a city (DAEMON_MIN_INTERVAL)",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=float,
+            help="longest seconds between runs of a city (DAEMON_MAX_INTERVAL)",
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        if opts.min_interval:
+            self.settings.set("DAEMON_MIN_INTERVAL", opts.min_interval, "cmdline")
+        if opts.max_interval:
+            self.settings.set("DAEMON_MAX_INTERVAL", opts.max_interval, "cmdline")
+
+    def run(self, args, opts):
+        profiles_by_city: dict[str, list[SearchSettings]] = defaultdict(list)
+        for search_settings in self.settings.getlist(
+            "SEARCH_PROFILES"
+        ) or load_search_profiles(os.environ):
+            profiles_by_city[search_settings.city_name].append(search_settings)
+        if not profiles_by_city:
+            raise UsageError("No search profiles configured")
+
+        schedule = AdaptivePollingSchedule(
+            city_names=profiles_by_city,
+            min_interval=self.settings.getfloat("DAEMON_MIN_INTERVAL", 300),
+            max_interval=self.settings.getfloat("DAEMON_MAX_INTERVAL", 3600),
+            target_new_flats=self.settings.getfloat("DAEMON_TARGET_NEW_FLATS", 1),
+            smoothing=self.settings.getfloat("DAEMON_RATE_SMOOTHING", 0.3),
+        )
+        self._poll(schedule, profiles_by_city, self._build_query_service())
+        self.crawler_process.start(stop_after_crawl=False)
+
+    def _build_query_service(self) -> Optional[FlatQueryService]:
+        if not self.settings.getint("QUERY_PORT"):
+            return None
+        from pymongo import MongoClient
+
+        db_settings = self.settings.get("DB_SETTINGS") or load_db_settings_from_env(
+            os.environ
+        )
+        return FlatQueryService(
+            MongoClient(db_settings.connection_uri)[db_settings.db_name]["flats"],
+            cache_ttl=self.settings.getfloat("QUERY_CACHE_TTL", 30),
+            gazetteer=PostalCodeGazetteer.open_if_exists(
+                self.settings.get("GAZETTEER_PATH")
+            ),
+        )
+
+    @defer.inlineCallbacks
+    def _poll(
+        self,
+        schedule: AdaptivePollingSchedule,
+        profiles_by_city: dict[str, list[SearchSettings]],
+        query_service: Optional[FlatQueryService] = None,
+    ):
+        listening_port = None
+        while True:
+            due_cities: list[str] = schedule.due_cities()
+            if due_cities:
+                crawler: Crawler = self.crawler_process.create_crawler(WgGesuchtSpider)
+                if query_service:
+                    crawler.signals.connect(
+                        query_service.flats_inserted, signal=flats_inserted
+                    )
+                    if not listening_port:
+                        # the reactor is installed by the first crawler
+                        listening_port = listen(
+                            query_service, self.settings.getint("QUERY_PORT")
+                        )
+                try:
+                    yield self.crawler_process.crawl(
+                        crawler,
+                        search_profiles=[
+                            search_settings
+                            for city_name in due_cities
+                            for search_settings in profiles_by_city[city_name]
+                        ],
+                    )
+                except Exception:
+                    logger.exception(f"Crawl of {', '.join(due_cities)} failed")
+
+                for city_name in due_cities:
+                    new_flats: int = crawler.stats.get_value(
+                        f"flats/inserted/{city_name}", 0
+                    )
+                    schedule.record_run(city_name, new_flats)
+                    state = schedule.cities[city_name]
+                    logger.info(
+                        f"{city_name}: {new_flats} new flats,"
+                        f" next run in {state.interval:.0f}s"
+                    )
+
+            # only imported once the first crawler installed the configured reactor
+            from twisted.internet import reactor
+
+            yield task.deferLater(
+                reactor, schedule.seconds_until_next_run(), lambda: None
+            )
@@ -0,0 +1,95 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+
+
+class Command(ScrapyCommand):
+    """Exports the stored flats to a JSONL, Parquet or Arrow IPC file.
+
+    The flats are streamed from the database in chunks of EXPORT_CHUNK_SIZE,
+    so the memory use does not grow with the collection. With --incremental
+    only flats inserted or changed after the last incremental export are written.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <output file>"
+
+    def short_desc(self):
+        return "Export the stored flats to a JSONL, Parquet or Arrow file"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--format",
+            dest="file_format",
+            choices=["jsonl", "parquet", "arrow"],
+            help="output format, by default the one of the file extension",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only export flats written after the last incremental export",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="flats per round trip and written chunk (EXPORT_CHUNK_SIZE)",
+        )
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+
+        # imported here, so the other commands start without pymongo
+        from pymongo import MongoClient
+        from wg_gesucht.export import (
+            ExportSummary,
+            ExportWatermark,
+            build_writer,
+            export_flats,
+        )
+
+        try:
+            writer = build_writer(args[0], opts.file_format)
+        except ValueError as e:
+            raise UsageError(str(e))
+        except ImportError:
+            raise UsageError("Parquet and Arrow exports need pyarrow installed")
+
+        watermark: Optional[ExportWatermark] = (
+            ExportWatermark(self.settings.get("EXPORT_WATERMARK_PATH"))
+            if opts.incremental
+            else None
+        )
+        since: Optional[datetime] = watermark.load() if watermark else None
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        client = MongoClient(db_settings.connection_uri)
+        try:
+            summary: ExportSummary = export_flats(
+                client[db_settings.db_name]["flats"],
+                writer,
+                since=since,
+                # writes still in flight can have an older write time
+                until=datetime.utcnow()
+                - timedelta(
+                    seconds=self.settings.getfloat("EXPORT_SETTLE_SECONDS", 60)
+                ),
+                chunk_size=opts.chunk_size
+                or self.settings.getint("EXPORT_CHUNK_SIZE", 1000),
+            )
+        finally:
+            client.close()
+
+        if watermark and summary.watermark:
+            watermark.save(summary.watermark)
+        print(f"Exported {summary.count} flats to {args[0]}")
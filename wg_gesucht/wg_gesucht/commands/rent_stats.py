@@ -0,0 +1,72 @@
+import os
+from typing import Any
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+
+
+class Command(ScrapyCommand):
+    """Prints the rent per m² stats kept by the pipeline for a city,
+    see RENT_STATS_COLLECTION.
+
+    With --recompute the stats are first rebuilt from all stored flats.
+    """
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <city name> [<postal code>]"
+
+    def short_desc(self):
+        return "Print rent per m² percentiles per postal code of a city"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--recompute",
+            action="store_true",
+            help="rebuild the stats from all stored flats first",
+        )
+
+    def run(self, args, opts):
+        if not 1 <= len(args) <= 2:
+            raise UsageError()
+        collection_name: str = self.settings.get("RENT_STATS_COLLECTION")
+        if not collection_name:
+            raise UsageError("RENT_STATS_COLLECTION is not set")
+
+        # imported here, so the other commands start without pymongo
+        from pymongo import MongoClient
+        from wg_gesucht.rent_stats import read_rent_stats, recompute_rent_stats
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        client = MongoClient(db_settings.connection_uri)
+        try:
+            database = client[db_settings.db_name]
+            if opts.recompute:
+                count: int = recompute_rent_stats(
+                    database["flats"], database[collection_name]
+                )
+                print(f"Recomputed the stats of {count} postal codes")
+            rows: list[dict[str, Any]] = read_rent_stats(
+                database[collection_name], *args
+            )
+        finally:
+            client.close()
+
+        print(
+            f"{'postal code':<12} {'currency':<9} {'flats':>6} {'mean':>7}"
+            f" {'p25':>7} {'median':>7} {'p75':>7} {'p90':>7}"
+        )
+        for row in rows:
+            print(
+                f"{row['postal_code']:<12} {row['currency']:<9} {row['count']:>6}"
+                + "".join(
+                    f" {row[column]:>7.2f}"
+                    for column in ["mean", "p25", "p50", "p75", "p90"]
+                )
+            )
@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.commands import ScrapyCommand
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+from wg_gesucht.items import FlatItem
+
+
+class Command(ScrapyCommand):
+    """Parses the flat detail pages recorded with ARCHIVE_ENABLED again
+    and writes the flats with the WgGesuchtPipeline, without the network.
+
+    The pages are parsed in a pool of processes, the flats are written
+    in the order they were recorded. Stored flats are only updated
+    if their content changed and they were written before the recording,
+    unless --force is given.
+    """
+
+    requires_project = True
+
+    def syntax(self):
+        return "[options] [<archive file or directory> ...]"
+
+    def short_desc(self):
+        return "Parse recorded responses again and store the flats"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="amount of parsing processes (default: amount of cpus)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="recorded pages per task of a process (default: 50)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="also update flats written after their recording",
+        )
+
+    def run(self, args, opts):
+        # imported here, so the other commands start without pymongo
+        from wg_gesucht.archive import replay_archive
+        from wg_gesucht.pipelines import WgGesuchtPipeline
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        pipeline = WgGesuchtPipeline(
+            connection_uri=db_settings.connection_uri,
+            db_name=db_settings.db_name,
+            batch_size=self.settings.getint("DB_WRITE_BATCH_SIZE", 1),
+            ensure_indexes=self.settings.getbool("DB_ENSURE_INDEXES", True),
+            rent_stats_collection_name=self.settings.get("RENT_STATS_COLLECTION"),
+            gazetteer_path=self.settings.get("GAZETTEER_PATH"),
+            keep_newer_stored=not opts.force,
+        )
+        with ProcessPoolExecutor(max_workers=max(opts.processes, 1)) as executor:
+            count: int = replay_archive(
+                args or [self.settings.get("ARCHIVE_DIR", ".cache/archive")],
+                executor,
+                process_flat=lambda flat: pipeline.process_item(FlatItem(flat), None),
+                batch_size=max(opts.batch_size, 1),
+                max_pending_batches=2 * max(opts.processes, 1),
+            )
+        # writes the remaining flats and closes the postal code table
+        pipeline.close_spider(None)
+        print(
+            f"Replayed {count} flats: {pipeline.inserted_count} new,"
+            f" {pipeline.updated_count} changed,"
+            f" {pipeline.duplicate_count} unchanged"
+        )
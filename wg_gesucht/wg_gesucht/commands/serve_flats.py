@@ -0,0 +1,51 @@
+import os
+
+from scrapy.commands import ScrapyCommand
+from scrapy.utils.reactor import install_reactor
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+
+
+class Command(ScrapyCommand):
+    """Serves queries for the stored flats as json on /flats.
+
+    Results are cached for QUERY_CACHE_TTL seconds. Run by the daemon
+    command with QUERY_PORT set, new flats drop the cached results at once.
+    """
+
+    requires_project = True
+
+    def short_desc(self):
+        return "Serve queries for the stored flats over http"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--port", type=int, help="port to listen on (QUERY_PORT)")
+        parser.add_argument(
+            "--interface",
+            default="127.0.0.1",
+            help="interface to listen on, 0.0.0.0 for all (default: 127.0.0.1)",
+        )
+
+    def run(self, args, opts):
+        install_reactor(self.settings.get("TWISTED_REACTOR"))
+        from pymongo import MongoClient
+        from twisted.internet import reactor
+        from wg_gesucht.gazetteer import PostalCodeGazetteer
+        from wg_gesucht.queries import FlatQueryService, listen
+
+        db_settings: DatabaseSettings = self.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
+        client = MongoClient(db_settings.connection_uri)
+        service = FlatQueryService(
+            client[db_settings.db_name]["flats"],
+            cache_ttl=self.settings.getfloat("QUERY_CACHE_TTL", 30),
+            gazetteer=PostalCodeGazetteer.open_if_exists(
+                self.settings.get("GAZETTEER_PATH")
+            ),
+        )
+        port: int = opts.port or self.settings.getint("QUERY_PORT") or 8080
+        listen(service, port, interface=opts.interface)
+        print(f"Serving flats on http://{opts.interface}:{port}/flats")
+        reactor.run()
+        client.close()
@@ -1,5 +1,6 @@
 import logging
 from dataclasses import dataclass
+from typing import Mapping
 
 logger = logging.getLogger()
 
@@ -52,3 +53,11 @@ def load_db_settings(
         logger.error("Failed to load database settings. Please check input.")
         logger.error(f"Error: {e}")
         raise e
+
+
+def load_db_settings_from_env(environ: Mapping[str, str]) -> DatabaseSettings:
+    """Loads the database settings from DB_URI and DB_NAME."""
+    return load_db_settings(
+        connection_uri=environ.get("DB_URI"),
+        db_name=environ.get("DB_NAME"),
+    )
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final, Iterator, Optional
+
+from wg_gesucht.records import FlatRecord
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+logger = logging.getLogger()
+
+EXPORT_FORMATS: Final[dict[str, str]] = {
+    ".jsonl": "jsonl",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+
+# column name -> (path in the document, type)
+EXPORT_COLUMNS: Final[dict[str, tuple[tuple[str, ...], type]]] = {
+    "id": (("id",), str),
+    "url": (("url",), str),
+    "title": (("title",), str),
+    "rooms": (("rooms",), float),
+    "size_amount": (("size", "amount"), float),
+    "size_unit": (("size", "unit"), str),
+    **{
+        column: (path, column_type)
+        for field in FlatRecord.COST_FIELDS
+        for column, path, column_type in [
+            (f"{field}_value", (field, "value"), float),
+            (f"{field}_currency", (field, "currency"), str),
+        ]
+    },
+    "street": (("street",), str),
+    "postal_code": (("postal_code",), str),
+    "city_name": (("city_name",), str),
+    "move_in_date": (("move_in_date",), str),
+    "found_at": (("meta", "found_at"), datetime),
+    "written_at": (("meta", "written_at"), datetime),
+    "search_city_name": (("meta", "search_city_name"), str),
+}
+# only the exported fields are sent by the database
+EXPORT_PROJECTION: Final[dict[str, int]] = {
+    ".".join(path): 1 for path, _ in EXPORT_COLUMNS.values()
+} | {"_id": 0}
+
+
+def flatten_flat(document: dict[str, Any]) -> dict[str, Any]:
+    """Returns: Row of the export columns, with the nested costs and sizes
+    in own columns. ({"size_amount": 88.0, "size_unit": "m2", ...})"""
+    row: dict[str, Any] = {}
+    for column, (path, column_type) in EXPORT_COLUMNS.items():
+        value: Any = document
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is not None and column_type is float:
+            value = float(value)
+        row[column] = value
+    return row
+
+
+@dataclass
+class ExportSummary:
+    count: int = 0
+    # written_at of the last written exported flat, the start of the next export
+    watermark: Optional[datetime] = None
+
+
+class ExportWriter:
+    """Writes chunks of rows to a file.
+
+    The rows go to a temporary file, which replaces the output file
+    on close, so a failed export leaves no partial file behind.
+    """
+
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path: Path = self._path.with_suffix(self._path.suffix + ".tmp")
+
+    def write(self, rows: list[dict[str, Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        os.replace(self._tmp_path, self._path)
+
+    def abort(self):
+        """Removes the temporary file, the output file is not touched."""
+        self._tmp_path.unlink(missing_ok=True)
+
+
+class JsonLinesWriter(ExportWriter):
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+
+    def write(self, rows: list[dict[str, Any]]):
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False, default=_to_json))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    def abort(self):
+        self._file.close()
+        super().abort()
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can not export {type(value).__name__}")
+
+
+class ArrowWriter(ExportWriter):
+    """Writes every chunk as one record batch to a Parquet
+    or an Arrow IPC file. Needs pyarrow."""
+
+    def __init__(self, path: str | Path, file_format: str):
+        super().__init__(path)
+        # imported here, so pyarrow is only needed for columnar exports
+        import pyarrow
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [
+                (column, _ARROW_TYPES[column_type](pyarrow))
+                for column, (_, column_type) in EXPORT_COLUMNS.items()
+            ]
+        )
+        if file_format == "parquet":
+            import pyarrow.parquet
+
+            self._writer = pyarrow.parquet.ParquetWriter(self._tmp_path, self._schema)
+        else:
+            import pyarrow.ipc
+
+            self._writer = pyarrow.ipc.new_file(str(self._tmp_path), self._schema)
+
+    def write(self, rows: list[dict[str, Any]]):
+        if rows:
+            self._writer.write_batch(
+                self._pyarrow.RecordBatch.from_pylist(rows, schema=self._schema)
+            )
+
+    def close(self):
+        self._writer.close()
+        super().close()
+
+    def abort(self):
+        self._writer.close()
+        super().abort()
+
+
+_ARROW_TYPES: Final[dict[type, Any]] = {
+    str: lambda pyarrow: pyarrow.string(),
+    float: lambda pyarrow: pyarrow.float64(),
+    datetime: lambda pyarrow: pyarrow.timestamp("ms"),
+}
+
+
+def build_writer(path: str | Path, file_format: Optional[str] = None) -> ExportWriter:
+    """Returns: Writer for the format ("jsonl", "parquet" or "arrow"),
+    by default the one of the file extension."""
+    file_format = file_format or EXPORT_FORMATS.get(Path(path).suffix.lower())
+    if file_format == "jsonl":
+        return JsonLinesWriter(path)
+    if file_format in ("parquet", "arrow"):
+        return ArrowWriter(path, file_format)
+    raise ValueError(f"Unknown export format of {path}, use one of {EXPORT_FORMATS}")
+
+
+def iter_flat_chunks(
+    collection: "Collection",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_size: int = 1000,
+) -> Iterator[list[dict[str, Any]]]:
+    """Streams the flats written after since and up to until, inserted or
+    changed, in the order they were written, as chunks of rows. The write time
+    is set by the pipeline, so flats written late, e.g. by other workers or
+    a replay, are not missed like with their found_at.
+    The write time is taken before the write is committed, so until has to be
+    far enough in the past that no write of an older time is still in flight.
+    The cursor fetches one chunk per round trip, so only one chunk
+    is held in memory."""
+    query: dict = _written_between(since, until)
+    cursor = collection.find(
+        query,
+        EXPORT_PROJECTION,
+        sort=[("meta.written_at", 1)],
+        batch_size=chunk_size,
+    )
+    chunk: list[dict[str, Any]] = []
+    for document in cursor:
+        chunk.append(flatten_flat(document))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _written_between(since: Optional[datetime], until: Optional[datetime]) -> dict:
+    """Returns: Query of the flats written after since and up to until.
+    Without since also the flats stored before meta.written_at was set."""
+    written_at: dict[str, datetime] = {}
+    if since:
+        written_at["$gt"] = since
+    if until:
+        written_at["$lte"] = until
+    if not written_at:
+        return {}
+    if since:
+        return {"meta.written_at": written_at}
+    return {"$or": [{"meta.written_at": written_at}, {"meta.written_at": None}]}
+
+
+def export_flats(
+    collection: "Collection",
+    writer: ExportWriter,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_size: int = 1000,
+) -> ExportSummary:
+    """Writes the flats written after since and up to until, see
+    iter_flat_chunks, and closes the writer.
+    On a failure the temporary file of the writer is removed.
+
+    Returns: Count of the exported flats and the new watermark.
+    """
+    summary = ExportSummary(watermark=since)
+    try:
+        for chunk in iter_flat_chunks(
+            collection, since=since, until=until, chunk_size=chunk_size
+        ):
+            writer.write(chunk)
+            summary.count += len(chunk)
+            summary.watermark = chunk[-1]["written_at"] or summary.watermark
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return summary
+
+
+class ExportWatermark:
+    """written_at of the last exported flat, stored in a json file,
+    so incremental exports continue where the last one stopped."""
+
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+
+    def load(self) -> Optional[datetime]:
+        """Returns: The stored watermark or None before the first export."""
+        try:
+            with open(self._path, encoding="utf-8") as watermark_file:
+                return datetime.fromisoformat(json.load(watermark_file)["written_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable export watermark {self._path}: {e}")
+            return None
+
+    def save(self, watermark: datetime):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path: Path = self._path.with_suffix(self._path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as watermark_file:
+            json.dump({"written_at": watermark.isoformat()}, watermark_file)
+        os.replace(tmp_path, self._path)
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from typing import Final, Optional
+
+from lxml import etree
+
+
+def _xpath(expression: str) -> etree.XPath:
+    """Compiles the expression. Results are plain str, smart strings
+    would keep a reference to their element."""
+    return etree.XPath(expression, smart_strings=False)
+
+
+class FlatDetailExtractor:
+    """Extracts the raw values of a flat from its detail page.
+
+    All XPath expressions are compiled once at class load. The document is
+    walked a single time to find the elements holding the values of a flat,
+    the values themselves are read relative to those elements.
+
+    The raw values are meant to be loaded with the FlatItemLoader,
+    see WgGesuchtSpider.parse_flat.
+    """
+
+    # One walk over the document for all elements a value is read from
+    _VALUE_ELEMENTS: Final = _xpath(
+        "//*["
+        "self::title"
+        " or self::i[@data-ad_id and parent::div]"
+        ' or self::div[@id="rent_wrapper" and parent::div[@id="basic_facts_wrapper"]]'
+        ' or self::div[@id="rent" or @id="utilities_costs" or @id="misc_costs"]'
+        ' or self::div[@class="provision-equipment"]'
+        ' or self::a[@href="#mapContainer"]'
+        ' or self::div[@class="col-sm-3"]'
+        "]"
+    )
+    _TEXT: Final = _xpath("text()")
+    _ROOMS: Final = _xpath(
+        './/div[@class="basic_facts_bottom_part"]/label[@class="amount"]/text()'
+    )
+    _SIZE: Final = _xpath(
+        './/div[@class="basic_facts_top_part"]/label[@class="amount"]/text()'
+    )
+    _GRAPH_AMOUNT: Final = _xpath('label[@class="graph_amount"]/text()')
+    _PROVISION_POSITION: Final = _xpath(
+        'count(preceding-sibling::div[@class="provision-equipment"])'
+    )
+    _PROVISION_AMOUNT: Final = _xpath('label[@class="amount"]/text()')
+    _PROVISION_DESCRIPTION: Final = _xpath('label[@class="description"]/text()')
+    _MOVE_IN_DATE: Final = _xpath("p/b/text()")
+
+    _COST_FIELDS: Final[dict[str, str]] = {
+        "rent": "rent_costs",
+        "utilities_costs": "utilities_costs",
+        "misc_costs": "additional_flat_costs",
+    }
+    # field and expected description of the first and second provision box
+    _PROVISION_FIELDS: Final[tuple[tuple[str, str], ...]] = (
+        ("deposit", "kaution"),
+        ("other_costs", "ablösevereinbarung"),
+    )
+
+    @classmethod
+    def extract(cls, root: etree._Element) -> dict[str, list[str]]:
+        """Extracts the raw values from the parsed detail page.
+
+        Returns: dict with the raw values per FlatItem field,
+        plus the address lines under "address".
+        """
+        values: defaultdict[str, list[str]] = defaultdict(list)
+        provision_descriptions: defaultdict[str, list[str]] = defaultdict(list)
+
+        for element in cls._VALUE_ELEMENTS(root):
+            tag: str = element.tag
+            if tag == "title":
+                values["title"].extend(cls._TEXT(element))
+            elif tag == "i":
+                values["id"].append(element.get("data-ad_id"))
+            elif tag == "a":
+                values["address"].extend(cls._TEXT(element))
+            elif element.get("id") == "rent_wrapper":
+                values["rooms"].extend(cls._ROOMS(element))
+                values["size"].extend(cls._SIZE(element))
+            elif element.get("id") in cls._COST_FIELDS:
+                values[cls._COST_FIELDS[element.get("id")]].extend(
+                    cls._GRAPH_AMOUNT(element)
+                )
+            elif element.get("class") == "provision-equipment":
+                position: int = int(cls._PROVISION_POSITION(element))
+                if position < len(cls._PROVISION_FIELDS):
+                    field: str = cls._PROVISION_FIELDS[position][0]
+                    values[field].extend(cls._PROVISION_AMOUNT(element))
+                    provision_descriptions[field].extend(
+                        cls._PROVISION_DESCRIPTION(element)
+                    )
+            else:
+                values["move_in_date"].extend(cls._MOVE_IN_DATE(element))
+
+        for field, expected_description in cls._PROVISION_FIELDS:
+            description: Optional[str] = next(
+                (text for text in provision_descriptions[field] if text), None
+            )
+            assert expected_description in (description or "").lower()
+
+        return values
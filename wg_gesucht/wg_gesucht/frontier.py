@@ -0,0 +1,342 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from scrapy import Request, Spider, signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.crawler import Crawler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.misc import create_instance, load_object
+from scrapy.utils.request import request_from_dict
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.signals import frontier_request_failed
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+logger = logging.getLogger()
+
+QUEUE_INDEXES: list[IndexModel] = [
+    # claims take the queued request of the highest priority, oldest first:
+    # the sort fields come before the range on claimed_until (equality, sort,
+    # range), so the index walks in claim order and sorts nothing in memory
+    IndexModel(
+        [("priority", DESCENDING), ("_id", ASCENDING), ("claimed_until", ASCENDING)],
+        name="frontier_claim",
+    ),
+    # a request is only queued once at a time, see queue_key
+    IndexModel("queue_key", name="frontier_queue_key", unique=True),
+]
+
+
+def fingerprint_indexes(ttl: float) -> list[IndexModel]:
+    """Returns: Indexes of the seen fingerprints, which are deleted
+    by the database once expired."""
+    return [IndexModel("seen_at", name="frontier_seen_at", expireAfterSeconds=int(ttl))]
+
+
+def frontier_database(crawler: Crawler):
+    """Returns: Database of the flats, which also holds the frontier."""
+    db_settings: DatabaseSettings = crawler.settings.get(
+        "DB_SETTINGS"
+    ) or load_db_settings_from_env(os.environ)
+    return MongoClient(db_settings.connection_uri, timeoutMS=10000)[db_settings.db_name]
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def queue_key(fingerprint: str, request_document: dict) -> str:
+    """Returns: Key a request is queued under once at a time. For filtered
+    requests their fingerprint, so they are not queued twice even after
+    the fingerprint expired. Requests with dont_filter, e.g. the start
+    requests every worker sends, also by their cb_kwargs: the same request
+    of one search profile is queued once for all workers, the same city
+    of two profiles twice."""
+    if not request_document["dont_filter"]:
+        return fingerprint
+    cb_kwargs: str = json.dumps(
+        request_document["cb_kwargs"], sort_keys=True, default=str
+    )
+    digest: str = hashlib.blake2b(cb_kwargs.encode(), digest_size=16).hexdigest()
+    return f"{fingerprint}-{digest}"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, SearchSettings):
+        return {"_type": "SearchSettings", "value": value.to_document()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and value.get("_type") == "SearchSettings":
+        return SearchSettings.from_document(value["value"])
+    return value
+
+
+def request_to_document(request: Request, spider: Optional[Spider]) -> dict:
+    """Returns: The request as BSON document, with its callbacks as method
+    names of the spider. The headers are stored as list, as their names are
+    bytes, SearchSettings in meta and cb_kwargs as dict. Other values of meta
+    and cb_kwargs have to be BSON types already. Nothing is pickled, so a
+    document written by anyone else can not run code on the workers."""
+    document: dict[str, Any] = request.to_dict(spider=spider)
+    document["headers"] = [[name, values] for name, values in request.headers.items()]
+    for key in ("meta", "cb_kwargs"):
+        document[key] = {
+            name: _encode_value(value) for name, value in document[key].items()
+        }
+    return document
+
+
+def request_from_document(document: dict, spider: Optional[Spider]) -> Request:
+    """Returns: The request of a document of request_to_document."""
+    document = dict(document)
+    document["headers"] = [
+        (name, value) for name, values in document["headers"] for value in values
+    ]
+    for key in ("meta", "cb_kwargs"):
+        document[key] = {
+            name: _decode_value(value) for name, value in document[key].items()
+        }
+    return request_from_dict(document, spider=spider)
+
+
+class MongoDupeFilter(BaseDupeFilter):
+    """Dupefilter shared by all workers of a distributed crawl.
+
+    The fingerprints of the seen requests are stored in a collection.
+    A fingerprint counts as seen for ttl seconds, so detail pages are not
+    requested twice by different workers, but later crawls can request
+    them again. Expired fingerprints are deleted by a TTL index.
+    """
+
+    def __init__(
+        self,
+        collection: "Collection",
+        fingerprint: Callable[[Request], bytes],
+        ttl: float = 86400.0,
+        clock: Callable[[], datetime] = datetime.utcnow,
+        debug: bool = False,
+    ):
+        self._collection = collection
+        self._fingerprint = fingerprint
+        self._ttl = timedelta(seconds=ttl)
+        self._clock = clock
+        self._debug = debug
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "MongoDupeFilter":
+        return cls(
+            frontier_database(crawler)[
+                crawler.settings.get(
+                    "FRONTIER_FINGERPRINT_COLLECTION", "frontier_fingerprints"
+                )
+            ],
+            fingerprint=crawler.request_fingerprinter.fingerprint,
+            ttl=crawler.settings.getfloat("FRONTIER_FINGERPRINT_TTL", 86400),
+            debug=crawler.settings.getbool("DUPEFILTER_DEBUG"),
+        )
+
+    def open(self):
+        self._collection.create_indexes(fingerprint_indexes(self._ttl.total_seconds()))
+
+    def request_seen(self, request: Request) -> bool:
+        """Marks the request as seen, atomically across all workers.
+
+        Returns: True if a worker saw the request within the ttl.
+        """
+        now: datetime = self._clock()
+        try:
+            # matches an expired fingerprint, inserts a missing one and
+            # fails with a duplicate key for a fingerprint seen recently
+            self._collection.update_one(
+                {
+                    "_id": self._fingerprint(request).hex(),
+                    "seen_at": {"$lt": now - self._ttl},
+                },
+                {"$set": {"seen_at": now}},
+                upsert=True,
+            )
+            return False
+        except DuplicateKeyError:
+            return True
+
+    def log(self, request: Request, spider: Spider):
+        if self._debug:
+            logger.debug(f"Filtered duplicate request: {request}")
+        spider.crawler.stats.inc_value("dupefilter/filtered", spider=spider)
+
+
+class MongoScheduler(BaseScheduler):
+    """Scheduler of a crawl spread over several workers, each running
+    the WgGesuchtSpider with this scheduler on the same database.
+
+    All workers share one queue of requests in a collection. A worker claims
+    the queued request of the highest priority with one atomic update.
+    The claim is a lease: it is released when the request left the
+    downloader or failed before, see FrontierFailureMiddleware. Otherwise
+    (e.g. the worker died) another worker claims the request again
+    once the lease ran out, up to max_claims times.
+
+    Requests are stored as BSON documents with the names of their callbacks,
+    see request_to_document, so all workers have to run the same version
+    of the spider.
+    """
+
+    def __init__(
+        self,
+        queue: "Collection",
+        dupefilter: BaseDupeFilter,
+        fingerprint: Callable[[Request], bytes],
+        stats: Optional[StatsCollector] = None,
+        lease: float = 300.0,
+        max_claims: int = 3,
+        worker: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            queue: Collection of the queued requests.
+            dupefilter: Filters requests seen before, see MongoDupeFilter.
+            fingerprint: Fingerprint of a request, e.g. of the crawler.
+            lease: Seconds a claimed request is kept from the other workers.
+            max_claims: Claims of a request before it is dropped.
+            worker: Name of this worker, stored with its claims.
+            clock: Current unix time.
+        """
+        self._queue = queue
+        self.df = dupefilter
+        self._fingerprint = fingerprint
+        self._stats = stats
+        self._lease = lease
+        self._max_claims = max_claims
+        self._worker = worker or worker_name()
+        self._clock = clock
+        self.spider: Optional[Spider] = None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "MongoScheduler":
+        scheduler = cls(
+            frontier_database(crawler)[
+                crawler.settings.get("FRONTIER_QUEUE_COLLECTION", "frontier_requests")
+            ],
+            dupefilter=create_instance(
+                load_object(crawler.settings["DUPEFILTER_CLASS"]),
+                crawler.settings,
+                crawler,
+            ),
+            fingerprint=crawler.request_fingerprinter.fingerprint,
+            stats=crawler.stats,
+            lease=crawler.settings.getfloat("FRONTIER_LEASE_SECONDS", 300),
+            max_claims=crawler.settings.getint("FRONTIER_MAX_CLAIMS", 3),
+        )
+        crawler.signals.connect(
+            scheduler.request_done, signal=signals.request_left_downloader
+        )
+        # responses of downloader middlewares do not reach the downloader
+        crawler.signals.connect(
+            scheduler.request_done, signal=signals.response_received
+        )
+        # neither do failures of downloader middlewares and requests
+        # rejected when they are scheduled, e.g. a copy of a claimed request
+        crawler.signals.connect(scheduler.request_done, signal=frontier_request_failed)
+        crawler.signals.connect(scheduler.request_done, signal=signals.request_dropped)
+        return scheduler
+
+    def open(self, spider: Spider):
+        self.spider = spider
+        self._queue.create_indexes(QUEUE_INDEXES)
+        return self.df.open()
+
+    def close(self, reason: str):
+        # queued requests are left for the other workers
+        return self.df.close(reason)
+
+    def has_pending_requests(self) -> bool:
+        """Requests claimed by other workers count as pending,
+        as their responses can lead to new requests."""
+        return self._queue.find_one({}, projection={"_id": True}) is not None
+
+    def __len__(self) -> int:
+        return self._queue.count_documents({})
+
+    def enqueue_request(self, request: Request) -> bool:
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+        fingerprint: str = self._fingerprint(request).hex()
+        request_document: dict = request_to_document(request, spider=self.spider)
+        document: dict[str, Any] = {
+            "fingerprint": fingerprint,
+            "queue_key": queue_key(fingerprint, request_document),
+            "priority": request.priority,
+            # 0 makes the request claimable right away
+            "claimed_until": 0,
+            "claims": 0,
+            "request": request_document,
+        }
+        try:
+            self._queue.insert_one(document)
+        except DuplicateKeyError:
+            self._inc_stat("frontier/already_queued")
+            return False
+        self._inc_stat("scheduler/enqueued")
+        return True
+
+    def next_request(self) -> Optional[Request]:
+        """Claims the queued request of the highest priority.
+
+        Returns: The request or None if all requests are claimed.
+        """
+        while True:
+            now: float = self._clock()
+            document: Optional[dict[str, Any]] = self._queue.find_one_and_update(
+                {"claimed_until": {"$lte": now}},
+                {
+                    "$set": {
+                        "claimed_until": now + self._lease,
+                        "worker": self._worker,
+                    },
+                    "$inc": {"claims": 1},
+                },
+                sort=[("priority", DESCENDING), ("_id", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if document is None:
+                return None
+            if document["claims"] > self._max_claims:
+                logger.warning(
+                    f"Dropping request claimed {self._max_claims} times"
+                    f" without finishing: {document['fingerprint']}"
+                )
+                self._queue.delete_one({"_id": document["_id"]})
+                self._inc_stat("frontier/dropped")
+                continue
+
+            request: Request = request_from_document(
+                document["request"], spider=self.spider
+            )
+            request.meta["frontier_id"] = document["_id"]
+            self._inc_stat("scheduler/dequeued")
+            return request
+
+    def request_done(self, request: Request, spider: Spider, **kwargs):
+        """Removes the claimed request from the queue."""
+        frontier_id = request.meta.pop("frontier_id", None)
+        if frontier_id is not None:
+            self._queue.delete_one({"_id": frontier_id, "worker": self._worker})
+
+    def _inc_stat(self, key: str):
+        if self._stats:
+            self._stats.inc_value(key, spider=self.spider)
@@ -0,0 +1,196 @@
+import io
+import logging
+import mmap
+import os
+import struct
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, Iterable, Iterator, Mapping, Optional
+
+from wg_gesucht.records import GeoPoint
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+logger = logging.getLogger()
+
+# magic, amount of postal codes
+_HEADER: Final = struct.Struct("<8sI4x")
+# postal code as number, latitude and longitude in millionths of a degree
+_RECORD: Final = struct.Struct("<Iii")
+MAGIC: Final[bytes] = b"WGPLZ\x00\x00\x01"
+POSTAL_CODE_DIGITS: Final[int] = 5
+_SCALE: Final[int] = 1_000_000
+
+
+class PostalCodeGazetteer:
+    """Centroids of the German postal codes, read from a binary table.
+
+    The table holds one fixed size record per postal code, sorted by postal
+    code, and is memory-mapped, so the pages are shared between processes
+    and only the ones a lookup touches are read. A lookup is a binary search,
+    no external geocoding service is called. Build the table with
+    `scrapy build_gazetteer`, see write_gazetteer.
+    """
+
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+        with open(self._path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._map)
+        if (
+            magic != MAGIC
+            or len(self._map) != _HEADER.size + self._count * _RECORD.size
+        ):
+            self._map.close()
+            raise ValueError(f"{self._path} is not a postal code table")
+
+    @classmethod
+    def open_if_exists(
+        cls, path: Optional[str | Path]
+    ) -> Optional["PostalCodeGazetteer"]:
+        """Returns: The gazetteer or None if the path is not set
+        or the table is missing or broken, which is logged."""
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Flats are not located, no postal code table: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def centroid(self, postal_code: Optional[str]) -> Optional[tuple[float, float]]:
+        """Returns: Longitude and latitude of the centroid of the postal code
+        or None if it is unknown."""
+        if (
+            not postal_code
+            or len(postal_code) != POSTAL_CODE_DIGITS
+            or not postal_code.isdigit()
+        ):
+            return None
+        key: int = int(postal_code)
+        low, high = 0, self._count
+        while low < high:
+            middle: int = (low + high) // 2
+            code, latitude, longitude = _RECORD.unpack_from(
+                self._map, _HEADER.size + middle * _RECORD.size
+            )
+            if code < key:
+                low = middle + 1
+            elif code > key:
+                high = middle
+            else:
+                return longitude / _SCALE, latitude / _SCALE
+        return None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self) -> "PostalCodeGazetteer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def geo_point(longitude: float, latitude: float) -> dict:
+    """Returns: GeoJSON point, as indexed by a 2dsphere index."""
+    return GeoPoint(longitude=longitude, latitude=latitude).to_document()
+
+
+def write_gazetteer(
+    path: str | Path, centroids: Mapping[str, tuple[float, float]]
+) -> int:
+    """Writes the postal code table read by the PostalCodeGazetteer.
+    The table is replaced at once, so running crawls keep the old one.
+
+    Args:
+        centroids: Longitude and latitude per five digit postal code.
+
+    Returns: Amount of postal codes written.
+    """
+    records: list[tuple[int, int, int]] = sorted(
+        (int(code), round(latitude * _SCALE), round(longitude * _SCALE))
+        for code, (longitude, latitude) in centroids.items()
+        if len(code) == POSTAL_CODE_DIGITS and code.isdigit()
+    )
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path: Path = path.with_suffix(path.suffix + ".tmp")
+    with open(temporary_path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, len(records)))
+        for record in records:
+            file.write(_RECORD.pack(*record))
+    os.replace(temporary_path, path)
+    return len(records)
+
+
+def read_geonames_lines(path: str | Path) -> Iterator[str]:
+    """Reads a postal code dump of GeoNames (e.g. DE.zip or DE.txt of
+    https://download.geonames.org/export/zip/), zipped or not."""
+    path = Path(path)
+    if not zipfile.is_zipfile(path):
+        with open(path, encoding="utf-8") as file:
+            yield from file
+        return
+    with zipfile.ZipFile(path) as archive:
+        name: str = f"{path.stem}.txt"
+        if name not in archive.namelist():
+            raise ValueError(f"{path} holds no {name}")
+        with archive.open(name) as file:
+            yield from io.TextIOWrapper(file, encoding="utf-8")
+
+
+def centroids_from_geonames(
+    lines: Iterable[str], country_code: str = "DE"
+) -> dict[str, tuple[float, float]]:
+    """Averages the coordinates of all places of a postal code. The lines are
+    tab separated: country code, postal code, place names and admin codes,
+    then latitude and longitude in the 10th and 11th column.
+
+    Returns: Longitude and latitude per postal code of the country.
+    """
+    sums: defaultdict[str, list[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+    for line in lines:
+        columns: list[str] = line.rstrip("\n").split("\t")
+        if len(columns) < 11 or columns[0] != country_code:
+            continue
+        try:
+            latitude, longitude = float(columns[9]), float(columns[10])
+        except ValueError:
+            continue
+        place_sums: list[float] = sums[columns[1]]
+        place_sums[0] += longitude
+        place_sums[1] += latitude
+        place_sums[2] += 1
+    return {
+        code: (longitude / count, latitude / count)
+        for code, (longitude, latitude, count) in sums.items()
+    }
+
+
+def locate_stored_flats(
+    collection: "Collection", gazetteer: PostalCodeGazetteer
+) -> int:
+    """Adds the location to the stored flats without one,
+    e.g. flats stored before the gazetteer was built.
+
+    Returns: Amount of located flats.
+    """
+    located: int = 0
+    postal_codes: list[str] = collection.distinct(
+        "postal_code", {"location": {"$exists": False}}
+    )
+    for postal_code in postal_codes:
+        centroid: Optional[tuple[float, float]] = gazetteer.centroid(postal_code)
+        if centroid is None:
+            continue
+        located += collection.update_many(
+            {"postal_code": postal_code, "location": {"$exists": False}},
+            {"$set": {"location": geo_point(*centroid)}},
+        ).modified_count
+    return located
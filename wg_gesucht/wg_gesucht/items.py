@@ -22,3 +22,5 @@ class FlatItem(scrapy.Item):
     postal_code = scrapy.Field()
     city_name = scrapy.Field()
     move_in_date = scrapy.Field()
+    # GeoJSON point of the postal code, added by the pipeline
+    location = scrapy.Field()
@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Final, Optional
+
+from scrapy import Selector
+from wg_gesucht.normalizers import (
+    parse_cost_str,
+    parse_room_amount_str_to_float,
+    parse_size,
+    remove_whitespace_and_returns,
+)
+
+ONLINE_SINCE_UNITS: Final[dict[str, str]] = {
+    "sekunde": "seconds",
+    "minute": "minutes",
+    "stunde": "hours",
+    "tag": "days",
+}
+
+
+def parse_online_since_str(
+    value: Optional[str], now: Optional[datetime] = None
+) -> Optional[timedelta]:
+    """Parses how long a listing is online from the hint on its card.
+    ("Online: 19 Minuten", "Online: 1 Tag", "Online: 12.06.2023")
+
+    Returns: Time the listing is online or None if the hint is unknown.
+    """
+    if not value or not isinstance(value, str):
+        return None
+
+    value = value.replace("Online:", "").strip().lower()
+    date_match: Optional[re.Match] = re.search(r"\d{2}\.\d{2}\.\d{4}", value)
+    if date_match:
+        online_since: datetime = datetime.strptime(date_match.group(0), "%d.%m.%Y")
+        return max((now or datetime.now()) - online_since, timedelta(0))
+
+    duration_match: Optional[re.Match] = re.match(r"(\d+)\s*([a-z]+)", value)
+    if not duration_match:
+        return None
+    amount, unit = duration_match.groups()
+    for unit_prefix, timedelta_unit in ONLINE_SINCE_UNITS.items():
+        if unit.startswith(unit_prefix):
+            return timedelta(**{timedelta_unit: int(amount)})
+    return None
+
+
+def _parse_or_none(parse: Callable[[str], Any], value: Optional[str]) -> Any:
+    """Card values are only hints, unparsable ones are treated as missing."""
+    try:
+        return parse(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_card_info_str(value: Optional[str]) -> tuple[Optional[float], Optional[str]]:
+    """Parses the rooms and the district from the info line of a card.
+    ("3-Zimmer-Wohnung | Köln Dellbrück | Grafenmühlenweg 145")
+
+    Returns: Amount of rooms and district, None if missing.
+    """
+    parts: list[str] = [
+        remove_whitespace_and_returns(part) or "" for part in (value or "").split("|")
+    ]
+    rooms_match: Optional[re.Match] = re.match(r"([\d,.]+)-Zimmer", parts[0])
+    rooms: Optional[float] = (
+        _parse_or_none(parse_room_amount_str_to_float, rooms_match.group(1))
+        if rooms_match
+        else None
+    )
+    district: Optional[str] = parts[1] if len(parts) > 1 and parts[1] else None
+    return rooms, district
+
+
+@dataclass
+class ListingCard:
+    """Data of a flat that is already shown on its card on the results page."""
+
+    flat_id: Optional[str]
+    detail_link: Optional[str]
+    online_since: Optional[timedelta]
+    # total rent with currency ({"value": 1150.0, "currency": "EUR"})
+    rent: Optional[dict] = None
+    size: Optional[float] = None
+    rooms: Optional[float] = None
+    district: Optional[str] = None
+
+    @classmethod
+    def from_selector(cls, card: Selector) -> "ListingCard":
+        detail_link: Optional[str] = card.xpath(".//div/div/div/div/h3/a/@href").get()
+        rooms, district = parse_card_info_str(
+            card.xpath('.//div[contains(@class, "col-xs-11")]/span/text()').get()
+        )
+        # "88 m²" on the card, "88m²" on the detail page
+        size: Optional[dict] = _parse_or_none(
+            lambda value: parse_size(value.replace(" ", "")),
+            card.xpath(
+                './/div[contains(@class, "middle")]'
+                '/div[contains(@class, "text-right")]/b/text()'
+            ).get(),
+        )
+        return cls(
+            flat_id=cls._get_flat_id(card=card, detail_link=detail_link),
+            detail_link=detail_link,
+            online_since=parse_online_since_str(
+                card.xpath('.//span[contains(text(), "Online:")]/text()').get()
+            ),
+            rent=_parse_or_none(
+                parse_cost_str,
+                card.xpath('.//div[contains(@class, "middle")]/div[1]/b/text()').get(),
+            ),
+            size=size["amount"] if size else None,
+            rooms=rooms,
+            district=district,
+        )
+
+    @staticmethod
+    def _get_flat_id(card: Selector, detail_link: Optional[str]) -> Optional[str]:
+        """Gets the ad id of a flat from its card on the results page.
+        Falls back to the id in the detail link. ("...Dellbrueck.10139965.html")
+
+        Returns: Flat id as string or None if no id was found.
+        """
+        flat_id: Optional[str] = card.xpath("@data-id").get()
+        if not flat_id and detail_link:
+            match: Optional[re.Match] = re.search(r"\.(\d+)\.html", detail_link)
+            flat_id = match.group(1) if match else None
+        return flat_id.strip() if flat_id else None
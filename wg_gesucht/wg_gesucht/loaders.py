@@ -1,86 +1,50 @@
-import re
-from datetime import datetime
-from typing import Optional
-
 from itemloaders.processors import Identity, MapCompose, TakeFirst
 from scrapy.loader import ItemLoader
+from wg_gesucht.normalizers import (  # noqa: F401
+    FIELD_NORMALIZERS,
+    parse_cost_str,
+    parse_move_in_date_str_to_date,
+    parse_room_amount_str_to_float,
+    parse_size,
+    remove_whitespace_and_returns,
+)
 
 
-def parse_room_amount_str_to_float(value: str) -> Optional[float]:
-    if value and isinstance(value, str):
-        return round(float(value.replace(",", ".")), 1)
-
-
-def remove_whitespace_and_returns(value: str) -> Optional[str]:
-    if value and isinstance(value, str):
-        result = value.replace("\r", " ").replace("\n", " ").strip()
-        return re.sub(" +", " ", result)
-
-
-def parse_cost_str(value: str) -> Optional[dict[str, float | str]]:
-    """Extracts the currency and value from the cost string
-    and parses the value to a float.
+class FlatItemLoader(ItemLoader):
+    """Loads a FlatItem, with the processors of the normalizers module.
 
-    Currently only implemented for EUR and CHF.
+    The spider normalizes values with normalize_flat directly,
+    which gives the same values without the overhead of the loader.
     """
-    if value and isinstance(value, str) and "n.a." not in value.lower():
-        if "€" in value:
-            split_char: str = "€"
-            currency: str = "EUR"
-        elif "CHF" in value:
-            split_char: str = "CHF"
-            currency: str = "CHF"
-        else:
-            return None
-        return {
-            "value": round(float(value.split(split_char, 1)[0].replace(",", ".")), 2),
-            "currency": currency,
-        }
 
-
-def parse_move_in_date_str_to_date(value: str) -> Optional[str]:
-    if value and isinstance(value, str):
-        return datetime.strptime(value, "%d.%m.%Y").date().strftime("%d.%m.%Y")
-
-
-def parse_size(value: str) -> Optional[dict[str, float | str]]:
-    if value and isinstance(value, str):
-        size_amount = value.split("m", 1)[0]
-        if size_amount.isdigit() and "m²" in value:
-            return {"amount": float(size_amount), "unit": "m2"}
-
-
-class FlatItemLoader(ItemLoader):
     default_input_processor = Identity()
     default_output_processor = TakeFirst()
 
-    id_in = MapCompose(str.strip)
+    id_in = MapCompose(FIELD_NORMALIZERS["id"])
 
     # meta
     # url
 
-    title_in = MapCompose(remove_whitespace_and_returns, str.capitalize)
+    title_in = MapCompose(FIELD_NORMALIZERS["title"])
 
-    rooms_in = MapCompose(remove_whitespace_and_returns, parse_room_amount_str_to_float)
+    rooms_in = MapCompose(FIELD_NORMALIZERS["rooms"])
 
-    size_in = MapCompose(remove_whitespace_and_returns, parse_size)
+    size_in = MapCompose(FIELD_NORMALIZERS["size"])
 
-    rent_costs_in = MapCompose(parse_cost_str)
+    rent_costs_in = MapCompose(FIELD_NORMALIZERS["rent_costs"])
 
-    utilities_costs_in = MapCompose(parse_cost_str)
+    utilities_costs_in = MapCompose(FIELD_NORMALIZERS["utilities_costs"])
 
-    additional_flat_costs_in = MapCompose(parse_cost_str)
+    additional_flat_costs_in = MapCompose(FIELD_NORMALIZERS["additional_flat_costs"])
 
-    other_costs_in = MapCompose(parse_cost_str)
+    other_costs_in = MapCompose(FIELD_NORMALIZERS["other_costs"])
 
-    deposit_in = MapCompose(parse_cost_str)
+    deposit_in = MapCompose(FIELD_NORMALIZERS["deposit"])
 
-    street_in = MapCompose(remove_whitespace_and_returns, str.capitalize)
+    street_in = MapCompose(FIELD_NORMALIZERS["street"])
 
-    postal_code_in = MapCompose(remove_whitespace_and_returns)
+    postal_code_in = MapCompose(FIELD_NORMALIZERS["postal_code"])
 
-    city_name_in = MapCompose(remove_whitespace_and_returns, str.capitalize)
+    city_name_in = MapCompose(FIELD_NORMALIZERS["city_name"])
 
-    move_in_date_in = MapCompose(
-        remove_whitespace_and_returns, parse_move_in_date_str_to_date
-    )
+    move_in_date_in = MapCompose(FIELD_NORMALIZERS["move_in_date"])
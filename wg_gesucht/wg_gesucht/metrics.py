@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Final, Iterable, Optional
+
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.spiders import Spider
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+logger = logging.getLogger()
+
+# Upper bounds of the latency buckets in seconds, from 1 ms doubling up to 32 s
+LATENCY_BUCKETS: Final[tuple[float, ...]] = tuple(0.001 * 2**i for i in range(16))
+
+
+class LatencyHistogram:
+    """Counts latencies in fixed buckets. Recording is a binary search
+    and an increment, so it can stay on for every response."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # last bucket holds the latencies above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns: Upper bound of the bucket holding the quantile,
+        None without observations or above the highest bound."""
+        if not self.count:
+            return None
+        rank: float = q * self.count
+        seen: int = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): count for bound, count in zip(self.bounds, self.counts)
+            }
+            | {"+Inf": self.counts[-1]},
+        }
+
+
+class CrawlMetrics:
+    """Extension collecting where a crawl spends its time.
+
+    Latencies of the spider callbacks are recorded by the
+    CallbackTimingMiddleware, write latencies by the pipeline.
+    Counters are read from the crawl stats when a snapshot is taken.
+
+    The metrics are served in the Prometheus text format on
+    http://127.0.0.1:<METRICS_PORT>/metrics while the spider runs and
+    written as json to METRICS_DUMP_PATH when it closes.
+    """
+
+    def __init__(
+        self,
+        crawler: Crawler,
+        port: Optional[int] = None,
+        dump_path: Optional[str] = None,
+    ):
+        self._crawler = crawler
+        self._port = port
+        self._dump_path = dump_path
+        self._listening_port = None
+        self._started_at: Optional[float] = None
+        self.latencies: dict[str, LatencyHistogram] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "CrawlMetrics":
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            port=crawler.settings.getint("METRICS_PORT") or None,
+            dump_path=crawler.settings.get("METRICS_DUMP_PATH"),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    @classmethod
+    def of_crawler(cls, crawler: Crawler) -> Optional["CrawlMetrics"]:
+        """Returns: The enabled metrics extension of the crawler, if any."""
+        extensions = getattr(crawler, "extensions", None)
+        return next(
+            (
+                extension
+                for extension in getattr(extensions, "middlewares", ())
+                if isinstance(extension, cls)
+            ),
+            None,
+        )
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """Returns: Histogram of the given name, created on first use.
+        ("callback/parse_flat", "pipeline/write")"""
+        histogram: Optional[LatencyHistogram] = self.latencies.get(name)
+        if histogram is None:
+            histogram = self.latencies[name] = LatencyHistogram()
+        return histogram
+
+    def spider_opened(self, spider: Spider):
+        self._started_at = time.monotonic()
+        if self._port:
+            self._listen()
+
+    def _listen(self):
+        from twisted.internet import reactor
+
+        root = Resource()
+        root.putChild(b"metrics", MetricsResource(self))
+        try:
+            self._listening_port = reactor.listenTCP(
+                self._port, Site(root), interface="127.0.0.1"
+            )
+        except Exception as e:
+            logger.warning(f"Failed to serve metrics on port {self._port}: {e}")
+
+    def spider_closed(self, spider: Spider):
+        if self._listening_port:
+            self._listening_port.stopListening()
+            self._listening_port = None
+        if self._dump_path:
+            self._dump()
+
+    def _dump(self):
+        path = Path(self._dump_path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path: Path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as dump_file:
+                json.dump(self.snapshot(), dump_file, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics to {path}: {e}")
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns: Counters and latency histograms of the crawl so far."""
+        stats: dict[str, Any] = self._crawler.stats.get_stats()
+        elapsed: float = (
+            time.monotonic() - self._started_at if self._started_at else 0.0
+        )
+        items: int = stats.get("item_scraped_count", 0)
+        return {
+            "elapsed_seconds": elapsed,
+            "items": items,
+            "items_per_second": items / elapsed if elapsed else 0.0,
+            "flats_inserted": stats.get("flats/inserted", 0),
+            "duplicates_skipped": stats.get("flats/skipped_seen", 0)
+            + stats.get("flats/duplicates", 0),
+            # per callback, see CallbackTimingMiddleware
+            "parse_failures": sum(
+                count
+                for key, count in stats.items()
+                if key.startswith("parse_failures/")
+            ),
+            "bytes_downloaded": stats.get("downloader/response_bytes", 0),
+            "latencies": {
+                name: histogram.to_dict()
+                for name, histogram in sorted(self.latencies.items())
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """Returns: The snapshot in the Prometheus text exposition format."""
+        snapshot: dict[str, Any] = self.snapshot()
+        lines: list[str] = []
+        for name, kind in [
+            ("items", "counter"),
+            ("items_per_second", "gauge"),
+            ("flats_inserted", "counter"),
+            ("duplicates_skipped", "counter"),
+            ("parse_failures", "counter"),
+            ("bytes_downloaded", "counter"),
+        ]:
+            lines.append(f"# TYPE wg_gesucht_{name} {kind}")
+            lines.append(f"wg_gesucht_{name} {snapshot[name]}")
+
+        lines.append("# TYPE wg_gesucht_latency_seconds histogram")
+        for name, histogram in sorted(self.latencies.items()):
+            labels: str = f'name="{name}"'
+            cumulative: int = 0
+            for bound, count in zip(
+                (*(str(bound) for bound in histogram.bounds), "+Inf"),
+                histogram.counts,
+            ):
+                cumulative += count
+                lines.append(
+                    f'wg_gesucht_latency_seconds_bucket{{{labels},le="{bound}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(f"wg_gesucht_latency_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(
+                f"wg_gesucht_latency_seconds_count{{{labels}}} {histogram.count}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, metrics: CrawlMetrics):
+        super().__init__()
+        self._metrics = metrics
+
+    def render_GET(self, request) -> bytes:
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4")
+        return self._metrics.to_prometheus().encode()
+
+
+class CallbackTimingMiddleware:
+    """Spider middleware recording the time spent in each spider callback,
+    including the iteration of its results, and the failures per callback.
+
+    Should be the closest spider middleware to the spider, so only the
+    callback itself is timed.
+    """
+
+    def __init__(self, metrics: CrawlMetrics):
+        self._metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "CallbackTimingMiddleware":
+        metrics: Optional[CrawlMetrics] = CrawlMetrics.of_crawler(crawler)
+        if not metrics:
+            raise NotConfigured
+        return cls(metrics)
+
+    def process_spider_output(
+        self, response: Response, result: Iterable, spider: Spider
+    ) -> Iterable:
+        callback = response.request.callback if response.request else None
+        name: str = getattr(callback, "__name__", "parse")
+        return self._timed(result, name, spider)
+
+    def _timed(self, result: Iterable, name: str, spider: Spider) -> Iterable:
+        elapsed: float = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                start: float = time.perf_counter()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield output
+        except Exception:
+            spider.crawler.stats.inc_value(f"parse_failures/{name}")
+            raise
+        finally:
+            self._metrics.histogram(f"callback/{name}").observe(elapsed)
@@ -3,8 +3,24 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import gzip
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
 # useful for handling different item types with a single interface
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers, HtmlResponse, Request, Response
+from scrapy.responsetypes import responsetypes
+from wg_gesucht.archive import ResponseArchive
+from wg_gesucht.pages import strip_page
+from wg_gesucht.signals import frontier_request_failed
+
+logger = logging.getLogger()
 
 
 class WgGesuchtSpiderMiddleware:
@@ -99,3 +115,333 @@ class WgGesuchtDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class ConditionalRequestCacheStorage:
+    """On disk store of the validators and gzip compressed bodies of responses.
+
+    Every response is stored under the fingerprint of its request as
+    a json file with the metadata and a gzip file with the body.
+    Responses stored longer than max_age seconds are not used anymore
+    and are deleted by prune.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_age: float = 604800.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._cache_dir = Path(cache_dir)
+        self._max_age = max_age
+        self._clock = clock
+
+    def _path(self, fingerprint: str, suffix: str) -> Path:
+        return self._cache_dir / fingerprint[:2] / f"{fingerprint}{suffix}"
+
+    def load_metadata(self, fingerprint: str) -> Optional[dict]:
+        """Returns: Metadata of the stored response or None if it is missing
+        or older than max_age."""
+        try:
+            with open(self._path(fingerprint, ".json"), encoding="utf-8") as file:
+                metadata: dict = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("stored_at", 0) < self._clock() - self._max_age:
+            return None
+        return metadata
+
+    def load_body(self, fingerprint: str) -> Optional[bytes]:
+        try:
+            with gzip.open(self._path(fingerprint, ".gz"), "rb") as file:
+                return file.read()
+        except (OSError, EOFError):
+            return None
+
+    def store(self, fingerprint: str, response: Response):
+        metadata: dict = {
+            "url": response.url,
+            "headers": {
+                key: value
+                for key, value in response.headers.to_unicode_dict().items()
+                if key.lower() != "set-cookie"
+            },
+            "stored_at": self._clock(),
+        }
+        body_path: Path = self._path(fingerprint, ".gz")
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        # body first, metadata last, so metadata never points to a partial body
+        with gzip.open(self._path(fingerprint, ".gz.tmp"), "wb") as file:
+            file.write(response.body)
+        os.replace(self._path(fingerprint, ".gz.tmp"), body_path)
+
+        with open(self._path(fingerprint, ".json.tmp"), "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(
+            self._path(fingerprint, ".json.tmp"), self._path(fingerprint, ".json")
+        )
+
+    def refresh(self, fingerprint: str, metadata: dict):
+        """Marks the stored response as revalidated now,
+        so it is neither expired nor pruned."""
+        metadata = {**metadata, "stored_at": self._clock()}
+        with open(self._path(fingerprint, ".json.tmp"), "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(
+            self._path(fingerprint, ".json.tmp"), self._path(fingerprint, ".json")
+        )
+        os.utime(self._path(fingerprint, ".gz"))
+
+    def prune(self) -> int:
+        """Deletes the responses, and leftover temporary files,
+        written longer than max_age ago.
+
+        Returns: Amount of deleted files.
+        """
+        expired_before: float = self._clock() - self._max_age
+        deleted: int = 0
+        for path in self._cache_dir.glob("*/*"):
+            try:
+                if path.stat().st_mtime < expired_before:
+                    path.unlink()
+                    deleted += 1
+            except OSError as e:
+                logger.warning(f"Failed to prune {path}: {e}")
+        return deleted
+
+
+class ConditionalRequestCacheMiddleware:
+    """Revalidates already downloaded pages with conditional requests.
+
+    Responses with an ETag or Last-Modified header are stored. Later requests
+    for the same page send If-None-Match / If-Modified-Since, and a 304
+    response is replaced by the stored page, so unchanged pages are neither
+    downloaded again nor parsed from a different source.
+
+    Its order has to be below the one of HttpCompressionMiddleware (590),
+    so responses reach it already decompressed.
+
+    Pages stored or last revalidated longer than CONDITIONAL_CACHE_MAX_AGE
+    seconds ago are downloaded in full again and deleted when the spider
+    closes, so the store does not grow without bound. A 304 for a page that
+    expired or was deleted in the meantime is not passed to the spider,
+    the page is requested again without validators instead.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("CONDITIONAL_CACHE_ENABLED"):
+            raise NotConfigured
+        middleware = cls(
+            cache_dir=crawler.settings.get("CONDITIONAL_CACHE_DIR", ".cache/pages"),
+            request_fingerprinter=crawler.request_fingerprinter,
+            stats=crawler.stats,
+            max_age=crawler.settings.getfloat("CONDITIONAL_CACHE_MAX_AGE", 604800),
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        request_fingerprinter,
+        stats=None,
+        max_age: float = 604800.0,
+    ):
+        self._storage = ConditionalRequestCacheStorage(
+            cache_dir=cache_dir, max_age=max_age
+        )
+        self._request_fingerprinter = request_fingerprinter
+        self._stats = stats
+
+    def _fingerprint(self, request: Request) -> str:
+        return self._request_fingerprinter.fingerprint(request).hex()
+
+    def _is_cacheable(self, request: Request) -> bool:
+        return request.method == "GET" and not request.meta.get("dont_cache")
+
+    def process_request(self, request: Request, spider) -> None:
+        if not self._is_cacheable(request) or request.meta.get(
+            "conditional_cache_refetch"
+        ):
+            return None
+
+        metadata: Optional[dict] = self._storage.load_metadata(
+            self._fingerprint(request)
+        )
+        if not metadata:
+            return None
+
+        headers: Headers = Headers(metadata["headers"])
+        if b"ETag" in headers:
+            request.headers.setdefault(b"If-None-Match", headers[b"ETag"])
+        if b"Last-Modified" in headers:
+            request.headers.setdefault(b"If-Modified-Since", headers[b"Last-Modified"])
+        return None
+
+    def process_response(self, request: Request, response: Response, spider):
+        if not self._is_cacheable(request):
+            return response
+
+        fingerprint: str = self._fingerprint(request)
+        if response.status == 304:
+            cached_response: Optional[Response] = self._load_response(
+                fingerprint=fingerprint, request=request
+            )
+            if cached_response:
+                self._inc_stats("conditional_cache/hit")
+                return cached_response
+            self._inc_stats("conditional_cache/miss")
+            if request.meta.get("conditional_cache_refetch"):
+                return response
+            return self._refetch_request(request)
+
+        if response.status == 200 and (
+            b"ETag" in response.headers or b"Last-Modified" in response.headers
+        ):
+            try:
+                self._storage.store(fingerprint=fingerprint, response=response)
+                self._inc_stats("conditional_cache/store")
+            except OSError as e:
+                logger.warning(f"Failed to cache {response.url}: {e}")
+        return response
+
+    @staticmethod
+    def _refetch_request(request: Request) -> Request:
+        """Returns: The request without validators, so the page is sent."""
+        refetch_request: Request = request.replace(
+            meta={**request.meta, "conditional_cache_refetch": True},
+            dont_filter=True,
+        )
+        for header in (b"If-None-Match", b"If-Modified-Since"):
+            refetch_request.headers.pop(header, None)
+        return refetch_request
+
+    def _load_response(self, fingerprint: str, request: Request) -> Optional[Response]:
+        """Returns: The stored response, marked as revalidated,
+        or None if it is missing or expired."""
+        metadata: Optional[dict] = self._storage.load_metadata(fingerprint)
+        body: Optional[bytes] = self._storage.load_body(fingerprint)
+        if not metadata or body is None:
+            return None
+        try:
+            self._storage.refresh(fingerprint, metadata)
+        except OSError as e:
+            logger.warning(f"Failed to refresh the cached {metadata['url']}: {e}")
+
+        headers: Headers = Headers(metadata["headers"])
+        response_class = responsetypes.from_args(
+            headers=headers, url=metadata["url"], body=body
+        )
+        return response_class(
+            url=metadata["url"],
+            status=200,
+            headers=headers,
+            body=body,
+            flags=["cached"],
+            request=request,
+        )
+
+    def spider_closed(self, spider):
+        deleted: int = self._storage.prune()
+        if deleted:
+            self._inc_stats("conditional_cache/pruned", deleted)
+
+    def _inc_stats(self, key: str, count: int = 1):
+        if self._stats:
+            self._stats.inc_value(key, count)
+
+
+class ResponseArchiveMiddleware:
+    """Records every downloaded response in a ResponseArchive,
+    one new archive file in ARCHIVE_DIR per crawl.
+    The archives can be parsed again with the replay command.
+
+    Its order has to be below the one of the ConditionalRequestCacheMiddleware,
+    so pages revalidated with a 304 response are recorded in full.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ARCHIVE_ENABLED"):
+            raise NotConfigured
+        middleware = cls(
+            ResponseArchive.in_directory(
+                crawler.settings.get("ARCHIVE_DIR", ".cache/archive")
+            ),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def __init__(self, archive: ResponseArchive, stats=None):
+        self._archive = archive
+        self._stats = stats
+
+    def process_response(self, request: Request, response: Response, spider):
+        try:
+            self._archive.record(response)
+            if self._stats:
+                self._stats.inc_value("archive/responses")
+        except OSError as e:
+            logger.warning(f"Failed to archive {response.url}: {e}")
+        return response
+
+    def spider_closed(self, spider):
+        self._archive.close()
+
+
+class StripPageMiddleware:
+    """Removes scripts, styles, comments and ad cards from the pages
+    of requests with the strip_page meta key, see strip_page.
+    The spider then builds a smaller tree from them, and the smaller
+    bodies count less against SCRAPER_SLOT_MAX_ACTIVE_SIZE.
+
+    Its order has to be below the ones of the ResponseArchiveMiddleware and
+    ConditionalRequestCacheMiddleware, so those store the pages in full.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("STRIP_PAGES_ENABLED"):
+            raise NotConfigured
+        return cls(stats=crawler.stats)
+
+    def __init__(self, stats=None):
+        self._stats = stats
+
+    def process_response(self, request: Request, response: Response, spider):
+        if not request.meta.get("strip_page") or not isinstance(response, HtmlResponse):
+            return response
+
+        body: bytes = strip_page(response.body)
+        if self._stats:
+            self._stats.inc_value("strip_page/pages")
+            self._stats.inc_value(
+                "strip_page/removed_bytes", len(response.body) - len(body)
+            )
+        return response.replace(body=body)
+
+
+class FrontierFailureMiddleware:
+    """Reports requests of the shared queue that failed in a downloader
+    middleware, e.g. with an IgnoreRequest of the robots.txt, with the
+    frontier_request_failed signal. Those never reach the downloader, so
+    without the MongoScheduler would only remove them after their leases.
+
+    Its order has to be above the ones of the middlewares that can handle
+    such a failure, as process_exception is called from the highest order down.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(signals=crawler.signals)
+
+    def __init__(self, signals):
+        self._signals = signals
+
+    def process_exception(self, request: Request, exception: Exception, spider):
+        if "frontier_id" in request.meta:
+            self._signals.send_catch_log(
+                signal=frontier_request_failed, request=request, spider=spider
+            )
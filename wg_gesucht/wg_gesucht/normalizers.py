@@ -0,0 +1,143 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Final, Iterable, Optional
+
+_SPACES: Final[re.Pattern] = re.compile(" +")
+_RETURNS: Final[dict[int, str]] = str.maketrans({"\r": " ", "\n": " "})
+# Currencies found in the cost strings, with the marker the value ends at
+_CURRENCY_MARKERS: Final[tuple[tuple[str, str], ...]] = (("€", "EUR"), ("CHF", "CHF"))
+
+
+def parse_room_amount_str_to_float(value: str) -> Optional[float]:
+    if value and isinstance(value, str):
+        return round(float(value.replace(",", ".")), 1)
+
+
+def remove_whitespace_and_returns(value: str) -> Optional[str]:
+    if value and isinstance(value, str):
+        return _SPACES.sub(" ", value.translate(_RETURNS).strip())
+
+
+def parse_cost_str(value: str) -> Optional[dict[str, float | str]]:
+    """Extracts the currency and value from the cost string
+    and parses the value to a float.
+
+    Currently only implemented for EUR and CHF.
+    """
+    if value and isinstance(value, str) and "n.a." not in value.lower():
+        for marker, currency in _CURRENCY_MARKERS:
+            amount, found, _ = value.partition(marker)
+            if found:
+                return {
+                    "value": round(float(amount.replace(",", ".")), 2),
+                    "currency": currency,
+                }
+
+
+def parse_move_in_date_str_to_date(value: str) -> Optional[str]:
+    if value and isinstance(value, str):
+        return datetime.strptime(value, "%d.%m.%Y").date().strftime("%d.%m.%Y")
+
+
+def parse_size(value: str) -> Optional[dict[str, float | str]]:
+    if value and isinstance(value, str):
+        size_amount = value.split("m", 1)[0]
+        if size_amount.isdigit() and "m²" in value:
+            return {"amount": float(size_amount), "unit": "m2"}
+
+
+@dataclass(frozen=True)
+class FieldNormalizer:
+    """Processors a raw value of a field runs through, in order.
+
+    Like itemloaders' MapCompose, a processor returning None drops the value.
+    If cached, the results for the most recent distinct raw strings are kept,
+    for fields whose values repeat across many flats.
+    """
+
+    processors: tuple[Callable[[Any], Any], ...]
+    cached: bool = False
+    cache_size: int = 1024
+
+    def __post_init__(self):
+        if self.cached:
+            # bypasses the frozen dataclass, the cache belongs to this instance
+            object.__setattr__(
+                self, "_cached_apply", lru_cache(maxsize=self.cache_size)(self._apply)
+            )
+
+    def _apply(self, value: Any) -> Any:
+        for processor in self.processors:
+            value = processor(value)
+            if value is None:
+                return None
+        return value
+
+    def __call__(self, value: Any) -> Any:
+        """Returns: Normalized value or None if the value is dropped."""
+        if not self.cached or not isinstance(value, str):
+            return self._apply(value)
+        result: Any = self._cached_apply(value)
+        # cached dicts are shared, every caller gets its own copy
+        return dict(result) if isinstance(result, dict) else result
+
+
+FIELD_NORMALIZERS: Final[dict[str, FieldNormalizer]] = {
+    "id": FieldNormalizer((str.strip,)),
+    "title": FieldNormalizer((remove_whitespace_and_returns, str.capitalize)),
+    "rooms": FieldNormalizer(
+        (remove_whitespace_and_returns, parse_room_amount_str_to_float), cached=True
+    ),
+    "size": FieldNormalizer((remove_whitespace_and_returns, parse_size), cached=True),
+    "rent_costs": FieldNormalizer((parse_cost_str,), cached=True),
+    "utilities_costs": FieldNormalizer((parse_cost_str,), cached=True),
+    "additional_flat_costs": FieldNormalizer((parse_cost_str,), cached=True),
+    "other_costs": FieldNormalizer((parse_cost_str,), cached=True),
+    "deposit": FieldNormalizer((parse_cost_str,), cached=True),
+    "street": FieldNormalizer((remove_whitespace_and_returns, str.capitalize)),
+    "postal_code": FieldNormalizer((remove_whitespace_and_returns,), cached=True),
+    "city_name": FieldNormalizer(
+        (remove_whitespace_and_returns, str.capitalize), cached=True
+    ),
+    "move_in_date": FieldNormalizer(
+        (remove_whitespace_and_returns, parse_move_in_date_str_to_date), cached=True
+    ),
+}
+
+
+def _to_values(raw: Any) -> Iterable[Any]:
+    if raw is None:
+        return ()
+    if isinstance(raw, (list, tuple)):
+        return raw
+    return (raw,)
+
+
+def normalize_values(field: str, raw: Any) -> list[Any]:
+    """Normalizes all raw values of a field, dropping values without result.
+    Fields without normalizer keep their values."""
+    normalizer: Optional[FieldNormalizer] = FIELD_NORMALIZERS.get(field)
+    values: Iterable[Any] = _to_values(raw)
+    if not normalizer:
+        return [value for value in values if value is not None]
+    return [result for result in map(normalizer, values) if result is not None]
+
+
+def normalize_flat(raw_values: dict[str, Any]) -> dict[str, Any]:
+    """Normalizes the raw values of all fields of a flat at once.
+
+    Produces the same values as loading them with the FlatItemLoader:
+    the first normalized value per field that is neither None nor empty.
+
+    Returns: dict of the normalized values, fields without value are left out.
+    """
+    flat: dict[str, Any] = {}
+    for field, raw in raw_values.items():
+        value: Any = next(
+            (value for value in normalize_values(field, raw) if value != ""), None
+        )
+        if value is not None:
+            flat[field] = value
+    return flat
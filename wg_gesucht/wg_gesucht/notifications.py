@@ -0,0 +1,282 @@
+import json
+import logging
+import sys
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Final, Optional, TextIO
+
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.statscollectors import StatsCollector
+from twisted.internet import defer, task
+from twisted.python.failure import Failure
+from wg_gesucht.metrics import CrawlMetrics
+from wg_gesucht.signals import flats_inserted
+
+logger = logging.getLogger()
+
+# fields of a flat that are part of its notification
+MESSAGE_FIELDS: Final[tuple[str, ...]] = (
+    "id",
+    "url",
+    "title",
+    "rooms",
+    "size",
+    "rent_costs",
+    "postal_code",
+    "city_name",
+    "move_in_date",
+)
+
+
+def to_message(flats: list[dict]) -> dict[str, Any]:
+    """Returns: Message about the given new flats."""
+    return {
+        "count": len(flats),
+        "flats": [
+            {field: flat[field] for field in MESSAGE_FIELDS if field in flat}
+            for flat in flats
+        ],
+    }
+
+
+def format_flat(flat: dict) -> str:
+    """Returns: One line about the flat. ("Schöne wohnung | 3.0 rooms | ...")"""
+    parts: list[str] = [flat.get("title") or flat.get("id", "")]
+    if flat.get("rooms"):
+        parts.append(f"{flat['rooms']} rooms")
+    if flat.get("size"):
+        parts.append(f"{flat['size']['amount']:g} m²")
+    if flat.get("rent_costs"):
+        parts.append(
+            f"{flat['rent_costs']['value']:g} {flat['rent_costs']['currency']}"
+        )
+    if flat.get("url"):
+        parts.append(flat["url"])
+    return " | ".join(parts)
+
+
+class NotificationSink:
+    """Delivers messages about new flats.
+
+    send is called in a thread, so it may block. Raising an error
+    makes the notifier retry the message.
+    """
+
+    def send(self, message: dict[str, Any]):
+        raise NotImplementedError
+
+
+class StdoutSink(NotificationSink):
+    def __init__(self, stream: Optional[TextIO] = None):
+        self._stream = stream
+
+    def send(self, message: dict[str, Any]):
+        stream: TextIO = self._stream or sys.stdout
+        for flat in message["flats"]:
+            print(f"New flat: {format_flat(flat)}", file=stream, flush=True)
+
+
+class FileSink(NotificationSink):
+    """Appends every message as one json line to the file."""
+
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+
+    def send(self, message: dict[str, Any]):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._path, "a", encoding="utf-8") as notification_file:
+            notification_file.write(json.dumps(message, default=str) + "\n")
+
+
+class WebhookSink(NotificationSink):
+    """Posts every message as json to the url."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self._url = url
+        self._timeout = timeout
+
+    def send(self, message: dict[str, Any]):
+        request = urllib.request.Request(
+            self._url,
+            data=json.dumps(message, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # raises on error status codes
+        with urllib.request.urlopen(request, timeout=self._timeout):
+            pass
+
+
+def build_sink(spec: str, timeout: float = 10.0) -> NotificationSink:
+    """Returns: Sink for "stdout", an http(s) url or a file path
+    (optionally prefixed with "file:")."""
+    if spec == "stdout":
+        return StdoutSink()
+    if spec.startswith(("http://", "https://")):
+        return WebhookSink(spec, timeout=timeout)
+    return FileSink(spec.removeprefix("file:"))
+
+
+class FlatNotifier:
+    """Extension notifying about new flats, as soon as they are stored.
+
+    Listens to the flats_inserted signal of the pipeline, so only flats
+    that were not stored before are notified. Flats inserted within the
+    coalesce window are sent as one message. Messages are delivered in a
+    thread and retried with exponential backoff, up to max_retries times.
+
+    The time from parsing a detail page (meta.found_at) to the delivery
+    of its notification is recorded as notification/latency in the metrics.
+    """
+
+    def __init__(
+        self,
+        sink: NotificationSink,
+        coalesce_window: float = 5.0,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        clock=None,
+        run_in_thread: Optional[Callable[..., defer.Deferred]] = None,
+        now: Callable[[], datetime] = datetime.utcnow,
+        stats: Optional[StatsCollector] = None,
+        metrics: Optional[CrawlMetrics] = None,
+    ):
+        """
+        Args:
+            sink: Delivers the messages.
+            coalesce_window: Seconds new flats are collected for one message.
+            max_retries: Retries of a failed message before it is dropped.
+            retry_delay: Seconds before the first retry, doubled per retry.
+            clock: Schedules the delayed calls, the reactor by default.
+            run_in_thread: Runs the sink, deferToThread by default.
+            now: Current UTC time, for the latency.
+        """
+        self._sink = sink
+        self._coalesce_window = coalesce_window
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._clock = clock
+        self._run_in_thread = run_in_thread
+        self._now = now
+        self._stats = stats
+        self._metrics = metrics
+        self._pending: list[dict] = []
+        self._flush_call = None
+        self._deliveries: set[defer.Deferred] = set()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> "FlatNotifier":
+        sink_spec: Optional[str] = crawler.settings.get("NOTIFICATION_SINK")
+        if not sink_spec:
+            raise NotConfigured
+        notifier = cls(
+            sink=build_sink(
+                sink_spec, timeout=crawler.settings.getfloat("NOTIFICATION_TIMEOUT", 10)
+            ),
+            coalesce_window=crawler.settings.getfloat(
+                "NOTIFICATION_COALESCE_SECONDS", 5
+            ),
+            max_retries=crawler.settings.getint("NOTIFICATION_MAX_RETRIES", 3),
+            retry_delay=crawler.settings.getfloat("NOTIFICATION_RETRY_DELAY", 1),
+            stats=crawler.stats,
+            metrics=CrawlMetrics.of_crawler(crawler),
+        )
+        crawler.signals.connect(notifier.flats_inserted, signal=flats_inserted)
+        crawler.signals.connect(notifier.spider_closed, signal=signals.spider_closed)
+        return notifier
+
+    def _get_clock(self):
+        if self._clock is None:
+            from twisted.internet import reactor
+
+            self._clock = reactor
+        return self._clock
+
+    def flats_inserted(self, flats: list[dict]):
+        self._pending.extend(flats)
+        if not self._flush_call:
+            self._flush_call = self._get_clock().callLater(
+                self._coalesce_window, self.flush
+            )
+
+    def spider_closed(self) -> defer.Deferred:
+        """Returns: Deferred firing once all notifications are delivered."""
+        self.flush()
+        return defer.DeferredList(list(self._deliveries))
+
+    def flush(self) -> Optional[defer.Deferred]:
+        """Sends the collected flats right away.
+
+        Returns: Deferred firing after the delivery, None without new flats.
+        """
+        if self._flush_call and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+
+        flats: list[dict] = self._pending
+        self._pending = []
+        if not flats:
+            return None
+
+        delivery: defer.Deferred = self._deliver(flats, attempt=0)
+        self._deliveries.add(delivery)
+        delivery.addBoth(self._delivery_done, delivery)
+        return delivery
+
+    def _delivery_done(self, result: Any, delivery: defer.Deferred) -> Any:
+        self._deliveries.discard(delivery)
+        return result
+
+    def _deliver(self, flats: list[dict], attempt: int) -> defer.Deferred:
+        run_in_thread = self._run_in_thread
+        if run_in_thread is None:
+            from twisted.internet.threads import deferToThread
+
+            run_in_thread = deferToThread
+        sent: defer.Deferred = run_in_thread(self._sink.send, to_message(flats))
+        sent.addCallbacks(
+            self._delivered,
+            self._failed,
+            callbackArgs=(flats,),
+            errbackArgs=(flats, attempt),
+        )
+        return sent
+
+    def _delivered(self, _: Any, flats: list[dict]):
+        self._inc_stat("notifications/sent")
+        self._inc_stat("notifications/flats", len(flats))
+        if self._metrics:
+            histogram = self._metrics.histogram("notification/latency")
+            now: datetime = self._now()
+            for flat in flats:
+                found_at: Optional[datetime] = flat.get("meta", {}).get("found_at")
+                if found_at:
+                    histogram.observe((now - found_at).total_seconds())
+
+    def _failed(
+        self, failure: Failure, flats: list[dict], attempt: int
+    ) -> Optional[defer.Deferred]:
+        if attempt < self._max_retries:
+            delay: float = self._retry_delay * 2**attempt
+            logger.warning(
+                f"Failed to send notification about {len(flats)} flats,"
+                f" retrying in {delay:g}s: {failure.getErrorMessage()}"
+            )
+            self._inc_stat("notifications/retries")
+            return task.deferLater(
+                self._get_clock(), delay, self._deliver, flats, attempt + 1
+            )
+
+        logger.error(
+            f"Dropped notification about {len(flats)} flats after"
+            f" {attempt + 1} attempts: {failure.getErrorMessage()}"
+        )
+        self._inc_stat("notifications/failed")
+        return None
+
+    def _inc_stat(self, key: str, count: int = 1):
+        if self._stats:
+            self._stats.inc_value(key, count)
@@ -0,0 +1,71 @@
+import re
+from typing import Final
+
+import scrapy
+from scrapy.http import TextResponse
+
+# Elements whose content is never read by the spider, removed with their content
+_UNUSED_ELEMENTS: Final = re.compile(
+    rb"<(script|style|noscript)\b[^>]*>.*?</\1\s*>|<!--.*?-->", re.S | re.I
+)
+# Cards of other flats and ads, shown below the flat on its detail page. Only
+# cards of list items: other wgg_card divs can hold the content of the flat
+_AD_START: Final = re.compile(
+    rb"""<div\b[^>]*\bclass=["'](?=[^"']*\bwgg_card\b)[^"']*\boffer_list_item\b"""
+    rb"""[^>]*>""",
+    re.I,
+)
+_DIV_TAG: Final = re.compile(rb"<(/?)div\b[^>]*>", re.I)
+
+
+def _end_of_div(body: bytes, start: int) -> int:
+    """Returns: Position after the closing tag of the div opened before start,
+    or the end of the body if it is not closed."""
+    depth: int = 1
+    for tag in _DIV_TAG.finditer(body, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return tag.end()
+    return len(body)
+
+
+def strip_page(body: bytes) -> bytes:
+    """Removes scripts, styles, comments and ad cards from a detail page,
+    so the tree built from it is smaller. Works on the raw bytes, before a
+    tree is built. Only meant for pages in an ascii compatible encoding.
+
+    Returns: The page without those elements.
+    """
+    body = _UNUSED_ELEMENTS.sub(b"", body)
+
+    parts: list[bytes] = []
+    position: int = 0
+    for ad in _AD_START.finditer(body):
+        if ad.start() < position:
+            # nested in an ad card that is already removed
+            continue
+        parts.append(body[position : ad.start()])
+        position = _end_of_div(body, ad.end())
+    parts.append(body[position:])
+    return b"".join(parts)
+
+
+# Private attributes TextResponse caches its tree and decoded text in, only
+# reset on the Scrapy versions they were checked with (requirements.txt)
+_CACHE_ATTRIBUTES: Final = ("_cached_selector", "_cached_ubody")
+_RELEASE_SUPPORTED: Final[bool] = scrapy.version_info[:2] == (2, 9)
+
+
+def release_parsed_page(response: TextResponse):
+    """Drops the tree and the decoded text cached on the response,
+    so they are freed while the response itself is still referenced
+    by scrapy. Both are built again if accessed later.
+
+    Relies on internals of Scrapy, so it does nothing on other versions
+    of Scrapy than the pinned one or if the attributes are missing.
+    """
+    if not _RELEASE_SUPPORTED:
+        return
+    for attribute in _CACHE_ATTRIBUTES:
+        if attribute in vars(response):
+            setattr(response, attribute, None)
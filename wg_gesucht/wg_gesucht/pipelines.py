@@ -2,37 +2,127 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Optional
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Union
 
-from itemadapter import ItemAdapter
-from pymongo import MongoClient
+from pymongo import GEOSPHERE, IndexModel, InsertOne, MongoClient, UpdateOne
 from pymongo.collection import Collection
 from pymongo.database import Database
-from pymongo.errors import ServerSelectionTimeoutError, WriteError
-from wg_gesucht.db_settings import DatabaseSettings
+from pymongo.errors import (
+    BulkWriteError,
+    PyMongoError,
+    ServerSelectionTimeoutError,
+    WriteError,
+)
+from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import task
+from twisted.internet.defer import Deferred
+from wg_gesucht.db_settings import DatabaseSettings, load_db_settings_from_env
+from wg_gesucht.gazetteer import PostalCodeGazetteer, geo_point
 from wg_gesucht.items import FlatItem
+from wg_gesucht.metrics import CrawlMetrics
+from wg_gesucht.records import FlatRecord
+from wg_gesucht.rent_stats import RENT_STATS_INDEXES, rent_stats_updates
+from wg_gesucht.seen_flats import SeenFlatIds
+from wg_gesucht.signals import flats_inserted
 from wg_gesucht.spiders.wg_gesucht import WgGesuchtSpider
 
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+FLAT_INDEXES: list[IndexModel] = [
+    IndexModel("id", name="flat_id", unique=True),
+    # incremental exports read the flats in the order they were written
+    IndexModel("meta.written_at", name="flat_written_at"),
+    # queries of queries.py: the city, then the sort, then the ranges
+    IndexModel(
+        [
+            ("meta.search_city_name", 1),
+            ("meta.found_at", -1),
+            ("rent_costs.value", 1),
+            ("rooms", 1),
+        ],
+        name="flat_city_newest",
+    ),
+    IndexModel(
+        [("meta.search_city_name", 1), ("rent_costs.value", 1), ("rooms", 1)],
+        name="flat_city_rent",
+    ),
+    # radius queries, flats without location are left out of the index
+    IndexModel([("location", GEOSPHERE)], name="flat_location"),
+]
+
 
 class WgGesuchtPipeline:
     _client: MongoClient
     _database: Database
     _collection: Collection
+    _buffer: list[FlatRecord]
+    _flush_task: Optional[task.LoopingCall] = None
+    _stats: Optional[StatsCollector] = None
+    _metrics: Optional[CrawlMetrics] = None
+    _signals: Optional[SignalManager] = None
+    _seen_flat_ids: Optional[SeenFlatIds] = None
+    _rent_stats: Optional[Collection] = None
+    _gazetteer: Optional[PostalCodeGazetteer] = None
+
+    # kept across crawls of one process, see DB_REUSE_CLIENT
+    _shared_clients: dict[str, MongoClient] = {}
+    _prepared_collections: set[tuple[str, str, str]] = set()
+    _shared_seen_flat_ids: dict[tuple[str, str, str], SeenFlatIds] = {}
+    _shared_seen_flat_ids_loaded_at: dict[tuple[str, str, str], datetime] = {}
 
     @classmethod
     def from_crawler(cls, crawler):
         """Creates a new instance of the pipeline with the given crawler settings."""
-        db_settings: Optional[DatabaseSettings] = crawler.settings.get("DB_SETTINGS")
-        if not db_settings:
-            raise ValueError("DB_SETTINGS must be set in settings.py")
+        db_settings: DatabaseSettings = crawler.settings.get(
+            "DB_SETTINGS"
+        ) or load_db_settings_from_env(os.environ)
 
-        return cls(
-            connection_uri=db_settings.connection_uri, db_name=db_settings.db_name
+        pipeline = cls(
+            connection_uri=db_settings.connection_uri,
+            db_name=db_settings.db_name,
+            **cls._init_kwargs_from_settings(crawler.settings),
         )
+        pipeline._stats = crawler.stats
+        pipeline._metrics = CrawlMetrics.of_crawler(crawler)
+        pipeline._signals = crawler.signals
+        return pipeline
+
+    @classmethod
+    def _init_kwargs_from_settings(cls, settings: Settings) -> dict[str, Any]:
+        return {
+            "batch_size": settings.getint("DB_WRITE_BATCH_SIZE", 1),
+            "flush_interval": settings.getfloat("DB_WRITE_FLUSH_INTERVAL", 10.0),
+            "reuse_client": settings.getbool("DB_REUSE_CLIENT"),
+            "ensure_indexes": settings.getbool("DB_ENSURE_INDEXES", True),
+            "rent_stats_collection_name": settings.get("RENT_STATS_COLLECTION"),
+            "gazetteer_path": settings.get("GAZETTEER_PATH"),
+        }
 
     def __init__(
-        self, connection_uri: str, db_name: str, collection_name: str = "flats"
+        self,
+        connection_uri: str,
+        db_name: str,
+        collection_name: str = "flats",
+        batch_size: int = 1,
+        flush_interval: float = 10.0,
+        reuse_client: bool = False,
+        ensure_indexes: bool = True,
+        rent_stats_collection_name: Optional[str] = None,
+        gazetteer_path: Optional[str] = None,
+        keep_newer_stored: bool = False,
     ):
         """
         Initializes the pipeline with the given connection parameters.
@@ -41,13 +131,73 @@ class WgGesuchtPipeline:
             connection_uri: The connection URI to the MongoDB database.
             db_name: The name of the database to use.
             collection_name: The name of the collection to use.
+            batch_size: Amount of flats buffered before they are written
+                with one unordered bulk insert. 1 writes every flat directly.
+            flush_interval: Seconds after which buffered flats are written,
+                even if the batch is not full yet.
+            reuse_client: Keep the client, the prepared database and the
+                stored flat ids for later crawls in the same process.
+            ensure_indexes: Check the connection and create missing indexes
+                on start. Without, the connection is first used by the crawl.
+            rent_stats_collection_name: Collection the rent per m² stats
+                of the new flats are added to, see rent_stats.py.
+                None to not keep them.
+            gazetteer_path: Postal code table the flats are located with,
+                see gazetteer.py. None or a missing table to not locate them.
+            keep_newer_stored: Leave stored flats written at or after the flat
+                was found (meta.found_at) as they are, counted as duplicates.
+                So a replay of older recordings does not overwrite newer data.
         """
-        self._client = MongoClient(connection_uri, timeoutMS=10000)
-        self._check_database_connection(client=self._client)
-
+        self._reuse_client = reuse_client
+        self._ensure_indexes = ensure_indexes
+        self._collection_key = (connection_uri, db_name, collection_name)
+        self._client = self._get_client(connection_uri)
         self._database = self._client[db_name]
         self._collection = self._database[collection_name]
-        self._collection.create_index("id", name="flat_id", unique=True)
+        if rent_stats_collection_name:
+            self._rent_stats = self._database[rent_stats_collection_name]
+        self._gazetteer = PostalCodeGazetteer.open_if_exists(gazetteer_path)
+        self._keep_newer_stored = keep_newer_stored
+        self._prepare_database()
+
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self.inserted_count = 0
+        self.updated_count = 0
+        self.duplicate_count = 0
+
+    def _get_client(self, connection_uri: str) -> MongoClient:
+        if not self._reuse_client:
+            return MongoClient(connection_uri, timeoutMS=10000)
+        if connection_uri not in self._shared_clients:
+            self._shared_clients[connection_uri] = MongoClient(
+                connection_uri, timeoutMS=10000
+            )
+        return self._shared_clients[connection_uri]
+
+    def _prepare_database(self):
+        """Checks the connection and creates missing indexes, see ensure_indexes.
+        With a reused client only done once per process."""
+        if not self._ensure_indexes or (
+            self._reuse_client and self._collection_key in self._prepared_collections
+        ):
+            return
+        self.bootstrap_database()
+        if self._reuse_client:
+            self._prepared_collections.add(self._collection_key)
+
+    def bootstrap_database(self) -> list[str]:
+        """Checks the connection and creates missing indexes.
+
+        Returns: Names of the created indexes.
+        """
+        self._check_database_connection(client=self._client)
+        created: list[str] = ensure_indexes(self._collection)
+        if self._rent_stats is not None:
+            created += ensure_indexes(self._rent_stats, RENT_STATS_INDEXES)
+        return created
 
     def _check_database_connection(self, client: MongoClient):
         """Pings the database and raises an error if the connection fails."""
@@ -60,16 +210,490 @@ class WgGesuchtPipeline:
                 "Please check given connection parameters."
             )
 
+    def open_spider(self, spider: WgGesuchtSpider):
+        """Hands the ids of the already stored flats to the spider, so it can
+        skip their detail pages.
+
+        Starts flushing the buffer periodically, so flats do not wait
+        for a full batch when only a few are found.
+        """
+        self._load_seen_flat_ids(spider)
+        self._start_flush_task()
+
+    def _load_seen_flat_ids(self, spider: WgGesuchtSpider):
+        """Flats not scraped within SEEN_FLATS_RECHECK_HOURS are left out,
+        so they are requested again and their changes are tracked.
+
+        With a reused client the ids are only loaded by the first crawl,
+        later crawls get the same ids plus the flats added since,
+        until the ids are older than SEEN_FLATS_RECHECK_HOURS.
+        """
+        if not spider.settings.getbool("SKIP_SEEN_FLATS"):
+            return
+
+        now: datetime = datetime.utcnow()
+        recheck_hours: float = spider.settings.getfloat("SEEN_FLATS_RECHECK_HOURS")
+        recheck_age: Optional[timedelta] = (
+            timedelta(hours=recheck_hours) if recheck_hours > 0 else None
+        )
+        seen_flat_ids: Optional[SeenFlatIds] = (
+            self._shared_seen_flat_ids.get(self._collection_key)
+            if self._reuse_client
+            else None
+        )
+        if seen_flat_ids is not None and recheck_age is not None:
+            loaded_at: datetime = self._shared_seen_flat_ids_loaded_at[
+                self._collection_key
+            ]
+            if now - loaded_at >= recheck_age:
+                seen_flat_ids = None
+        if seen_flat_ids is None:
+            seen_flat_ids = SeenFlatIds.from_collection(
+                self._collection,
+                bloom_threshold=spider.settings.getint(
+                    "SEEN_FLATS_BLOOM_THRESHOLD", 1_000_000
+                ),
+                seen_since=now - recheck_age if recheck_age else None,
+            )
+            logging.info("Loaded %d stored flat ids.", len(seen_flat_ids))
+            if self._reuse_client:
+                self._shared_seen_flat_ids[self._collection_key] = seen_flat_ids
+                self._shared_seen_flat_ids_loaded_at[self._collection_key] = now
+
+        self._seen_flat_ids = seen_flat_ids
+        spider.seen_flat_ids = seen_flat_ids
+
+    def _start_flush_task(self):
+        if self._batch_size > 1 and self._flush_interval > 0:
+            self._flush_task = task.LoopingCall(self._flush_if_due)
+            self._flush_task.start(self._flush_interval, now=False)
+
+    def _stop_flush_task(self):
+        if self._flush_task and self._flush_task.running:
+            self._flush_task.stop()
+
+    def close_spider(self, spider: WgGesuchtSpider):
+        """Writes the remaining buffered flats and logs the write summary."""
+        self._stop_flush_task()
+        self.flush()
+        self._close_gazetteer()
+        self._log_summary()
+
+    def _close_gazetteer(self):
+        if self._gazetteer is not None:
+            self._gazetteer.close()
+            self._gazetteer = None
+
+    def _log_summary(self):
+        logging.info(
+            "Persisted %d new flats, updated %d changed flats, "
+            "skipped %d unchanged duplicates.",
+            self.inserted_count,
+            self.updated_count,
+            self.duplicate_count,
+        )
+
     def process_item(self, item: FlatItem, spider: WgGesuchtSpider) -> FlatItem:
         """Processes the given item and persists it to the database.
-        Duplicate items are ignored. Other errors are logged.
+        Stored flats are only updated if their content changed,
+        unchanged duplicates are ignored. Other errors are logged.
+
+        With a batch size above 1 the item is only buffered and written
+        on the next flush.
+        """
+        self._buffer_item(item)
+        if self._is_flush_due():
+            self.flush()
+
+        return item
+
+    def _is_flush_due(self) -> bool:
+        return (
+            len(self._buffer) >= self._batch_size
+            or time.monotonic() - self._last_flush >= self._flush_interval
+        )
+
+    def _flush_if_due(self):
+        if self._is_flush_due():
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered flats."""
+        records: list[FlatRecord] = self._take_buffer()
+        if records:
+            start: float = time.perf_counter()
+            summary: WriteSummary = self._write_records(records)
+            self._observe_write_latency(time.perf_counter() - start)
+            self._count_written(summary)
+
+    def _take_buffer(self) -> list[FlatRecord]:
+        self._last_flush = time.monotonic()
+        records: list[FlatRecord] = self._buffer
+        self._buffer = []
+        return records
+
+    def _buffer_item(self, item: FlatItem):
+        if self._gazetteer is not None:
+            self._locate_item(item)
+        record: FlatRecord = FlatRecord.from_item(item)
+        self._buffer.append(record)
+        if self._seen_flat_ids is not None and record.id:
+            self._seen_flat_ids.add(record.id)
+
+    def _locate_item(self, item: FlatItem):
+        """Adds the centroid of the postal code of the flat as location."""
+        if item.get("location"):
+            return
+        centroid: Optional[tuple[float, float]] = self._gazetteer.centroid(
+            item.get("postal_code")
+        )
+        if centroid is None:
+            if self._stats:
+                self._stats.inc_value("flats/unknown_postal_code")
+            return
+        item["location"] = geo_point(*centroid)
+
+    def _observe_write_latency(self, seconds: float):
+        if self._metrics:
+            self._metrics.histogram("pipeline/write").observe(seconds)
+
+    def _count_written(self, summary: "WriteSummary"):
+        """Adds the summary to the counters and the crawl stats.
+        New flats per city are in the stats as flats/inserted/<city name>.
+
+        Sends the flats_inserted signal with the documents of the new flats.
+        """
+        self.inserted_count += summary.inserted
+        self.updated_count += summary.updated
+        self.duplicate_count += summary.duplicates
+        if self._stats:
+            self._stats.inc_value("flats/inserted", summary.inserted)
+            self._stats.inc_value("flats/updated", summary.updated)
+            self._stats.inc_value("flats/duplicates", summary.duplicates)
+            for city_name, amount in summary.inserted_per_city.items():
+                if city_name:
+                    self._stats.inc_value(f"flats/inserted/{city_name}", amount)
+        if self._signals and summary.inserted_documents:
+            self._signals.send_catch_log(
+                signal=flats_inserted, flats=summary.inserted_documents
+            )
+
+    def _write_records(self, records: list[FlatRecord]) -> "WriteSummary":
+        """Inserts new flats and updates stored flats whose content changed.
+
+        The documents are only built from the buffered records here.
+        The stored versions of all flats of the batch are read with one query.
+        Of flats with an unchanged content hash only meta.last_seen_at is set,
+        with one update for the whole batch. All other writes of the batch
+        go out with one unordered bulk write,
+        so one failing write does not stop the rest of the batch.
+        Duplicate key errors are only counted, other errors are logged.
+
+        Does not touch the state of the pipeline,
+        so it can run outside the reactor thread.
+
+        Returns: Amount of inserted, updated and duplicate flats.
         """
+        summary: WriteSummary = WriteSummary()
+        now: datetime = datetime.utcnow()
+        latest_documents: dict[Any, dict] = {}
+        for document in (record.to_document() for record in records):
+            meta: dict = document.setdefault("meta", {})
+            meta["content_hash"] = flat_content_hash(document)
+            meta["last_seen_at"] = meta["written_at"] = now
+            if document.get("id") in latest_documents:
+                summary.duplicates += 1
+            latest_documents[document.get("id")] = document
+
+        stored_documents: dict[Any, dict] = {
+            stored["id"]: stored
+            for stored in self._collection.find(
+                {"id": {"$in": list(latest_documents)}},
+                projection={"_id": False, "meta.changes": False},
+            )
+        }
+
+        operations: list[Union[InsertOne, UpdateOne]] = []
+        # position of the insert operations in the batch and their documents
+        new_documents: dict[int, dict] = {}
+        unchanged_flat_ids: list[Any] = []
+        for flat_id, document in latest_documents.items():
+            stored: Optional[dict] = stored_documents.get(flat_id)
+            if not stored:
+                new_documents[len(operations)] = document
+                operations.append(InsertOne(document))
+            elif self._keep_newer_stored and not written_before(
+                stored, document["meta"].get("found_at")
+            ):
+                summary.duplicates += 1
+            elif (
+                stored.get("meta", {}).get("content_hash") or flat_content_hash(stored)
+            ) == document["meta"]["content_hash"]:
+                summary.duplicates += 1
+                unchanged_flat_ids.append(flat_id)
+            else:
+                operations.append(
+                    self._build_update(stored=stored, document=document, now=now)
+                )
+
+        failed_positions: set[int] = set()
+        if len(operations) == 1 and new_documents:
+            if not self._insert_one(new_documents[0], summary):
+                failed_positions.add(0)
+        elif operations:
+            failed_positions = self._bulk_write(operations, summary)
+        if unchanged_flat_ids:
+            self._mark_seen(unchanged_flat_ids, now)
+
+        summary.inserted_documents = [
+            document
+            for position, document in new_documents.items()
+            if position not in failed_positions
+        ]
+        if self._rent_stats is not None and summary.inserted_documents:
+            self._update_rent_stats(summary.inserted_documents)
+        return summary
+
+    def _update_rent_stats(self, documents: list[dict]):
+        """Adds the new flats to the rent per m² stats of their postal codes.
+        A failure only loses the stats of these flats, see recompute_rent_stats."""
+        updates: list[UpdateOne] = rent_stats_updates(documents)
+        if not updates:
+            return
+        try:
+            self._rent_stats.bulk_write(updates, ordered=False)
+        except PyMongoError as e:
+            logging.error("Failed to update rent stats: %s", e)
+
+    def _mark_seen(self, flat_ids: list[Any], now: datetime):
+        """Sets meta.last_seen_at of stored flats that were scraped again
+        without a change. A failure only keeps the older time."""
+        try:
+            self._collection.update_many(
+                {"id": {"$in": flat_ids}}, {"$set": {"meta.last_seen_at": now}}
+            )
+        except PyMongoError as e:
+            logging.error("Failed to mark flats as seen: %s", e)
+
+    def _build_update(self, stored: dict, document: dict, now: datetime) -> UpdateOne:
+        """Returns: Update of the changed fields, recording when and what changed.
+        Only applied if the stored flat did not change in the meantime.
+        A stored location is kept if the flat was not located this time,
+        e.g. without postal code table."""
+        kept_fields: set[str] = {"_id", "meta"}
+        if "location" not in document:
+            kept_fields.add("location")
+        changed_fields: list[str] = sorted(
+            field
+            for field in (stored.keys() | document.keys()) - kept_fields
+            if stored.get(field) != document.get(field)
+        )
+        update: dict[str, dict] = {
+            "$set": {
+                **{
+                    field: document[field]
+                    for field in changed_fields
+                    if field in document
+                },
+                "meta.content_hash": document["meta"]["content_hash"],
+                "meta.last_seen_at": now,
+                "meta.written_at": now,
+            },
+            "$push": {"meta.changes": {"at": now, "fields": changed_fields}},
+        }
+        removed_fields: dict[str, str] = {
+            field: "" for field in changed_fields if field not in document
+        }
+        if removed_fields:
+            update["$unset"] = removed_fields
+
+        return UpdateOne(
+            {
+                "id": document["id"],
+                "meta.content_hash": stored.get("meta", {}).get("content_hash"),
+            },
+            update,
+        )
+
+    def _insert_one(self, document: dict, summary: "WriteSummary") -> bool:
+        """Returns: True if the document was inserted."""
         try:
-            self._collection.insert_one(ItemAdapter(item).asdict())
+            self._collection.insert_one(document)
+            summary.inserted += 1
+            return True
         except WriteError as e:
-            if e.code == 11000:
-                logging.info("Found duplicate flat id: %s", item["id"])
+            if e.code == DUPLICATE_KEY_ERROR_CODE:
+                logging.info("Found duplicate flat id: %s", document.get("id"))
+                summary.duplicates += 1
             else:
-                logging.error("Encountered unexpected error while persisting flat:", e)
+                logging.error(
+                    "Encountered unexpected error while persisting flat: %s", e
+                )
+            return False
+
+    def _bulk_write(
+        self, operations: list[Union[InsertOne, UpdateOne]], summary: "WriteSummary"
+    ) -> set[int]:
+        """Returns: Positions of the operations that failed."""
+        try:
+            result = self._collection.bulk_write(operations, ordered=False)
+            summary.inserted += result.inserted_count
+            summary.updated += result.modified_count
+            return set()
+        except BulkWriteError as e:
+            summary.inserted += e.details.get("nInserted", 0)
+            summary.updated += e.details.get("nModified", 0)
+            write_errors: list[dict] = e.details.get("writeErrors", [])
+            for error in write_errors:
+                if error.get("code") == DUPLICATE_KEY_ERROR_CODE:
+                    summary.duplicates += 1
+                else:
+                    logging.error(
+                        "Encountered unexpected error while persisting flat: %s",
+                        error.get("errmsg"),
+                    )
+            return {error.get("index") for error in write_errors}
+
+
+def ensure_indexes(
+    collection: Collection, indexes: Optional[list[IndexModel]] = None
+) -> list[str]:
+    """Creates the indexes that do not exist yet, FLAT_INDEXES by default.
+
+    Returns: Names of the created indexes.
+    """
+    existing: dict[str, dict] = collection.index_information()
+    missing: list[IndexModel] = [
+        index
+        for index in (FLAT_INDEXES if indexes is None else indexes)
+        if index.document["name"] not in existing
+    ]
+    if not missing:
+        return []
+    return collection.create_indexes(missing)
+
+
+@dataclass
+class WriteSummary:
+    inserted: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    inserted_documents: list[dict] = field(default_factory=list)
+
+    @property
+    def inserted_per_city(self) -> Counter:
+        """Returns: New flats per search city, see meta.search_city_name."""
+        return Counter(
+            document["meta"].get("search_city_name")
+            for document in self.inserted_documents
+        )
+
+
+def written_before(stored: dict, found_at: Optional[datetime]) -> bool:
+    """Returns: True if the stored flat was written before the given time.
+    Flats stored without meta.written_at count as written when found."""
+    stored_meta: dict = stored.get("meta", {})
+    written_at: Optional[datetime] = stored_meta.get("written_at") or stored_meta.get(
+        "found_at"
+    )
+    return found_at is None or written_at is None or written_at < found_at
+
+
+def flat_content_hash(document: dict) -> str:
+    """Hashes the content of a flat, without its meta data and its location,
+    which is derived from the postal code.
+
+    Stable across runs, so it can be compared with the stored hash.
+    """
+    content: dict = {
+        field: value
+        for field, value in document.items()
+        if field not in ("_id", "meta", "location")
+    }
+    serialized: bytes = json.dumps(
+        content, sort_keys=True, default=str, ensure_ascii=False
+    ).encode()
+    return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+
+
+class AsyncWgGesuchtPipeline(WgGesuchtPipeline):
+    """Variant of the WgGesuchtPipeline that does not block the reactor.
+
+    The blocking pymongo calls run on a small thread pool and are awaited on
+    the asyncio loop, so downloading and parsing go on while the database
+    answers. At most max_in_flight_writes calls run at the same time.
+    The connection check and index creation move from the constructor
+    to open_spider.
+
+    Needs the AsyncioSelectorReactor, see TWISTED_REACTOR.
+    """
+
+    @classmethod
+    def _init_kwargs_from_settings(cls, settings: Settings) -> dict[str, Any]:
+        return {
+            **super()._init_kwargs_from_settings(settings),
+            "max_in_flight_writes": settings.getint("DB_MAX_IN_FLIGHT_WRITES", 4),
+        }
+
+    def __init__(self, *args, max_in_flight_writes: int = 4, **kwargs):
+        """
+        Args:
+            max_in_flight_writes: Amount of database calls running at once.
+
+        See WgGesuchtPipeline for the other arguments.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(max_in_flight_writes, 1), thread_name_prefix="mongo"
+        )
+        self._write_slots = asyncio.Semaphore(max(max_in_flight_writes, 1))
+        super().__init__(*args, **kwargs)
+
+    def _prepare_database(self):
+        """Deferred to open_spider, see _open_spider."""
+
+    async def _run(self, function: Callable, *args) -> Any:
+        """Runs the blocking function on the thread pool and awaits it."""
+        async with self._write_slots:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, function, *args
+            )
+
+    def open_spider(self, spider: WgGesuchtSpider) -> Deferred:
+        return deferred_from_coro(self._open_spider(spider))
+
+    async def _open_spider(self, spider: WgGesuchtSpider):
+        await self._run(super()._prepare_database)
+        await self._run(self._load_seen_flat_ids, spider)
+        self._start_flush_task()
+
+    def close_spider(self, spider: WgGesuchtSpider) -> Deferred:
+        return deferred_from_coro(self._close_spider())
+
+    async def _close_spider(self):
+        self._stop_flush_task()
+        await self.flush_async()
+        self._executor.shutdown(wait=False)
+        self._close_gazetteer()
+        self._log_summary()
+
+    async def process_item(self, item: FlatItem, spider: WgGesuchtSpider) -> FlatItem:
+        """Buffers the item and awaits the write if a flush is due.
+        See WgGesuchtPipeline.process_item."""
+        self._buffer_item(item)
+        if self._is_flush_due():
+            await self.flush_async()
 
         return item
+
+    def _flush_if_due(self) -> Optional[Deferred]:
+        if self._is_flush_due():
+            return deferred_from_coro(self.flush_async())
+
+    async def flush_async(self):
+        """Writes all buffered flats without blocking the loop."""
+        records: list[FlatRecord] = self._take_buffer()
+        if records:
+            start: float = time.perf_counter()
+            summary: WriteSummary = await self._run(self._write_records, records)
+            self._observe_write_latency(time.perf_counter() - start)
+            self._count_written(summary)
@@ -0,0 +1,101 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+
+@dataclass
+class CityPollingState:
+    interval: float
+    next_run_at: float
+    last_run_at: Optional[float] = None
+    # smoothed rate of new flats, None until two runs are done
+    new_flats_per_hour: Optional[float] = None
+
+
+class AdaptivePollingSchedule:
+    """Decides when the search of a city is run again.
+
+    The rate of new flats per city is smoothed over the runs
+    (exponentially weighted moving average). The interval is chosen so that
+    about target_new_flats new flats are found per run: busy cities are polled
+    often, quiet cities and quiet hours are polled rarely.
+    Intervals stay between min_interval and max_interval.
+    """
+
+    def __init__(
+        self,
+        city_names: Iterable[str],
+        min_interval: float,
+        max_interval: float,
+        target_new_flats: float = 1.0,
+        smoothing: float = 0.3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            city_names: Cities to poll, all are due right away.
+            min_interval: Shortest interval between runs in seconds.
+            max_interval: Longest interval between runs in seconds.
+            target_new_flats: New flats that should be found per run.
+            smoothing: Weight of the latest run in the rate, between 0 and 1.
+            clock: Returns the current time in seconds.
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Intervals must be positive with min <= max")
+        if not 0 < smoothing <= 1:
+            raise ValueError("Smoothing must be between 0 and 1")
+
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._target_new_flats = target_new_flats
+        self._smoothing = smoothing
+        self._clock = clock
+        now: float = clock()
+        self.cities: dict[str, CityPollingState] = {
+            city_name: CityPollingState(interval=min_interval, next_run_at=now)
+            for city_name in city_names
+        }
+
+    def due_cities(self) -> list[str]:
+        """Returns: Names of the cities whose next run is due."""
+        now: float = self._clock()
+        return [
+            city_name
+            for city_name, state in self.cities.items()
+            if state.next_run_at <= now
+        ]
+
+    def seconds_until_next_run(self) -> float:
+        """Returns: Seconds until the next city is due, 0 if one is due."""
+        if not self.cities:
+            return self._max_interval
+        next_run_at: float = min(state.next_run_at for state in self.cities.values())
+        return max(next_run_at - self._clock(), 0.0)
+
+    def record_run(self, city_name: str, new_flats: int):
+        """Updates the rate of new flats of the city after a finished run
+        and schedules its next run.
+
+        The first run only marks the start, the flats it finds
+        were not collected in a known time window.
+        """
+        state: CityPollingState = self.cities[city_name]
+        now: float = self._clock()
+        if state.last_run_at is not None and now > state.last_run_at:
+            rate: float = new_flats / ((now - state.last_run_at) / 3600)
+            state.new_flats_per_hour = (
+                rate
+                if state.new_flats_per_hour is None
+                else self._smoothing * rate
+                + (1 - self._smoothing) * state.new_flats_per_hour
+            )
+            state.interval = self._interval_for(state.new_flats_per_hour)
+
+        state.last_run_at = now
+        state.next_run_at = now + state.interval
+
+    def _interval_for(self, new_flats_per_hour: float) -> float:
+        if new_flats_per_hour <= 0:
+            return self._max_interval
+        interval: float = self._target_new_flats / new_flats_per_hour * 3600
+        return min(max(interval, self._min_interval), self._max_interval)
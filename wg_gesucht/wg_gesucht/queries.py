@@ -0,0 +1,319 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Final, Mapping, Optional
+
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+from wg_gesucht.records import FlatRecord
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+    from wg_gesucht.gazetteer import PostalCodeGazetteer
+
+logger = logging.getLogger()
+
+# fields a query can return besides the fields of the flats
+META_FIELDS: Final[tuple[str, ...]] = ("meta.found_at", "meta.search_city_name")
+DEFAULT_FIELDS: Final[tuple[str, ...]] = (
+    "id",
+    "url",
+    "title",
+    "rooms",
+    "size",
+    "rent_costs",
+    "postal_code",
+    "city_name",
+    "move_in_date",
+    "meta.found_at",
+)
+# sort name -> sort of the query, each backed by one of the FLAT_INDEXES
+SORTS: Final[dict[str, list[tuple[str, int]]]] = {
+    "newest": [("meta.found_at", -1)],
+    "rent": [("rent_costs.value", 1)],
+}
+MAX_LIMIT: Final[int] = 200
+MAX_RADIUS_KM: Final[float] = 100.0
+# radius of the earth used by $centerSphere
+EARTH_RADIUS_KM: Final[float] = 6378.1
+
+
+@dataclass(frozen=True)
+class FlatQuery:
+    """Filter, sort and fields of a query for stored flats.
+
+    Frozen, so equal queries share one entry in the result cache.
+    """
+
+    city_name: Optional[str] = None
+    postal_code: Optional[str] = None
+    max_rent: Optional[float] = None
+    min_rooms: Optional[float] = None
+    min_size: Optional[float] = None
+    # longitude and latitude, flats within radius_km around it
+    near: Optional[tuple[float, float]] = None
+    radius_km: Optional[float] = None
+    sort: str = "newest"
+    limit: int = 50
+    fields: tuple[str, ...] = DEFAULT_FIELDS
+
+    def __post_init__(self):
+        if self.sort not in SORTS:
+            raise ValueError(f"Unknown sort '{self.sort}', use one of {list(SORTS)}")
+        if not 0 < self.limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        unknown: list[str] = [
+            name
+            for name in self.fields
+            if name not in FlatRecord.FIELDS and name not in META_FIELDS
+        ]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if (self.near is None) != (self.radius_km is None):
+            raise ValueError("near and radius_km must be given together")
+        if self.near is not None:
+            longitude, latitude = self.near
+            if not (-180 <= longitude <= 180 and -90 <= latitude <= 90):
+                raise ValueError("near must be a longitude and a latitude")
+            if not 0 < self.radius_km <= MAX_RADIUS_KM:
+                raise ValueError(f"radius_km must be between 0 and {MAX_RADIUS_KM}")
+
+    @classmethod
+    def from_args(
+        cls,
+        args: Mapping[str, str],
+        gazetteer: Optional["PostalCodeGazetteer"] = None,
+    ) -> "FlatQuery":
+        """Creates the query from the arguments of a request.
+        (?city=Köln&max_rent=900&min_rooms=2&sort=newest&fields=id,url)
+
+        near is a longitude and latitude (near=6.96,50.94&radius_km=3),
+        or a postal code located with the gazetteer (near=50667&radius_km=3).
+        """
+        values: dict[str, Any] = {}
+        if args.get("near"):
+            values["near"] = _parse_near(args["near"], gazetteer)
+        if args.get("radius_km"):
+            values["radius_km"] = float(args["radius_km"])
+        for name, convert in [
+            ("city", str),
+            ("postal_code", str),
+            ("max_rent", float),
+            ("min_rooms", float),
+            ("min_size", float),
+            ("sort", str),
+            ("limit", int),
+        ]:
+            if args.get(name):
+                values["city_name" if name == "city" else name] = convert(args[name])
+        if args.get("fields"):
+            values["fields"] = tuple(args["fields"].split(","))
+        return cls(**values)
+
+    def to_filter(self) -> dict[str, Any]:
+        query_filter: dict[str, Any] = {}
+        if self.city_name:
+            query_filter["meta.search_city_name"] = self.city_name
+        if self.postal_code:
+            query_filter["postal_code"] = self.postal_code
+        if self.max_rent is not None:
+            query_filter["rent_costs.value"] = {"$lte": self.max_rent}
+        if self.min_rooms is not None:
+            query_filter["rooms"] = {"$gte": self.min_rooms}
+        if self.min_size is not None:
+            query_filter["size.amount"] = {"$gte": self.min_size}
+        if self.near is not None:
+            # answered by the 2dsphere index flat_location
+            query_filter["location"] = {
+                "$geoWithin": {
+                    "$centerSphere": [list(self.near), self.radius_km / EARTH_RADIUS_KM]
+                }
+            }
+        return query_filter
+
+    def to_projection(self) -> dict[str, int]:
+        return {name: 1 for name in self.fields} | {"_id": 0}
+
+
+def _parse_near(
+    near: str, gazetteer: Optional["PostalCodeGazetteer"]
+) -> tuple[float, float]:
+    """Returns: Longitude and latitude of "<longitude>,<latitude>"
+    or of the centroid of a postal code."""
+    if "," in near:
+        longitude, latitude = near.split(",", 1)
+        return float(longitude), float(latitude)
+    centroid: Optional[tuple[float, float]] = (
+        gazetteer.centroid(near) if gazetteer is not None else None
+    )
+    if centroid is None:
+        raise ValueError(f"Unknown postal code '{near}' for near")
+    return centroid
+
+
+@dataclass
+class CachedResult:
+    expires_at: float
+    flats: list[dict] = field(default_factory=list)
+
+
+class FlatQueryService:
+    """Answers FlatQuery with the stored flats.
+
+    Results are cached for cache_ttl seconds. Connect flats_inserted
+    to the signal of the same name, so new flats drop the cached results
+    of their city right away.
+
+    The cache is not thread safe, only query_database may run in a thread.
+    With a gazetteer, radius queries can be around a postal code.
+    """
+
+    def __init__(
+        self,
+        collection: "Collection",
+        cache_ttl: float = 30.0,
+        max_cached_queries: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+        gazetteer: Optional["PostalCodeGazetteer"] = None,
+    ):
+        self._collection = collection
+        self.gazetteer = gazetteer
+        self._cache_ttl = cache_ttl
+        self._max_cached_queries = max_cached_queries
+        self._clock = clock
+        self._cache: OrderedDict[FlatQuery, CachedResult] = OrderedDict()
+        # counts the invalidations, results read before one are not cached
+        self.generation = 0
+
+    def cached(self, query: FlatQuery) -> Optional[list[dict]]:
+        """Returns: Cached flats of the query or None if not cached."""
+        cached: Optional[CachedResult] = self._cache.get(query)
+        if cached is None:
+            return None
+        if cached.expires_at <= self._clock():
+            del self._cache[query]
+            return None
+        self._cache.move_to_end(query)
+        return cached.flats
+
+    def find(self, query: FlatQuery) -> list[dict]:
+        """Returns: Flats matching the query, with only its fields.
+        Blocks on the database unless the result is cached."""
+        flats: Optional[list[dict]] = self.cached(query)
+        if flats is not None:
+            return flats
+
+        generation: int = self.generation
+        flats = self.query_database(query)
+        self.store(query, flats, generation)
+        return flats
+
+    def query_database(self, query: FlatQuery) -> list[dict]:
+        """Returns: Flats matching the query, read from the database."""
+        return list(
+            self._collection.find(
+                query.to_filter(),
+                query.to_projection(),
+                sort=SORTS[query.sort],
+                limit=query.limit,
+            )
+        )
+
+    def store(self, query: FlatQuery, flats: list[dict], generation: int):
+        """Caches the flats read for the query, unless flats were inserted
+        since the read started (generation)."""
+        if generation != self.generation:
+            return
+        self._cache[query] = CachedResult(
+            expires_at=self._clock() + self._cache_ttl, flats=flats
+        )
+        while len(self._cache) > self._max_cached_queries:
+            self._cache.popitem(last=False)
+
+    def flats_inserted(self, flats: list[dict]):
+        """Drops the cached results the new flats could be part of."""
+        city_names: set[Optional[str]] = {
+            flat.get("meta", {}).get("search_city_name") for flat in flats
+        }
+        self.generation += 1
+        for query in list(self._cache):
+            if query.city_name is None or query.city_name in city_names:
+                del self._cache[query]
+
+
+class FlatQueryResource(Resource):
+    """Serves the FlatQueryService as json on GET /flats?city=...
+
+    Database queries run in a thread, so the reactor is not blocked.
+    """
+
+    isLeaf = True
+
+    def __init__(self, service: FlatQueryService):
+        super().__init__()
+        self._service = service
+
+    def render_GET(self, request) -> bytes | int:
+        request.setHeader(b"Content-Type", b"application/json")
+        try:
+            query: FlatQuery = FlatQuery.from_args(
+                {
+                    name.decode(): values[0].decode()
+                    for name, values in request.args.items()
+                },
+                gazetteer=self._service.gazetteer,
+            )
+        except (TypeError, ValueError) as e:
+            request.setResponseCode(400)
+            return json.dumps({"error": str(e)}).encode()
+
+        flats: Optional[list[dict]] = self._service.cached(query)
+        if flats is not None:
+            return to_json(flats)
+
+        from twisted.internet.threads import deferToThread
+
+        generation: int = self._service.generation
+        found = deferToThread(self._service.query_database, query)
+        found.addCallback(self._found, request, query, generation)
+        found.addErrback(self._failed, request)
+        found.addBoth(lambda _: request.finish())
+        return NOT_DONE_YET
+
+    def _found(self, flats: list[dict], request, query: FlatQuery, generation: int):
+        self._service.store(query, flats, generation)
+        request.write(to_json(flats))
+
+    def _failed(self, failure, request):
+        logger.error(f"Flat query failed: {failure.getErrorMessage()}")
+        request.setResponseCode(500)
+        request.write(json.dumps({"error": "query failed"}).encode())
+
+
+def to_json(flats: list[dict]) -> bytes:
+    return json.dumps(
+        {"count": len(flats), "flats": flats}, default=_to_json, ensure_ascii=False
+    ).encode()
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def listen(service: FlatQueryService, port: int, interface: str = "127.0.0.1"):
+    """Serves the queries on http://<interface>:<port>/flats.
+    Only call after the reactor of the crawl is installed.
+
+    Returns: The listening port.
+    """
+    from twisted.internet import reactor
+    from twisted.web.server import Site
+
+    root = Resource()
+    root.putChild(b"flats", FlatQueryResource(service))
+    return reactor.listenTCP(port, Site(root), interface=interface)
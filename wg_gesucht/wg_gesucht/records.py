@@ -0,0 +1,224 @@
+import sys
+from datetime import datetime
+from enum import Enum
+from typing import Any, Final, Optional
+
+from itemadapter import ItemAdapter
+
+
+class Currency(str, Enum):
+    EUR = "EUR"
+    CHF = "CHF"
+
+
+class SizeUnit(str, Enum):
+    SQUARE_METERS = "m2"
+
+
+class Cost:
+    __slots__ = ("value", "currency")
+
+    def __init__(self, value: float, currency: Currency):
+        self.value = value
+        self.currency = currency
+
+    @classmethod
+    def from_value(cls, cost: Any) -> Optional["Cost"]:
+        """Returns: Cost of a parsed cost dict ({"value", "currency"})
+        or None if there is no cost."""
+        if cost is None or isinstance(cost, cls):
+            return cost
+        return cls(value=cost["value"], currency=Currency(cost["currency"]))
+
+    def to_document(self) -> dict[str, float | str]:
+        return {"value": self.value, "currency": self.currency.value}
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, Cost)
+            and self.value == other.value
+            and self.currency is other.currency
+        )
+
+    def __repr__(self) -> str:
+        return f"Cost({self.value!r}, {self.currency.value})"
+
+
+class Size:
+    __slots__ = ("amount", "unit")
+
+    def __init__(self, amount: float, unit: SizeUnit):
+        self.amount = amount
+        self.unit = unit
+
+    @classmethod
+    def from_value(cls, size: Any) -> Optional["Size"]:
+        """Returns: Size of a parsed size dict ({"amount", "unit"})
+        or None if there is no size."""
+        if size is None or isinstance(size, cls):
+            return size
+        return cls(amount=size["amount"], unit=SizeUnit(size["unit"]))
+
+    def to_document(self) -> dict[str, float | str]:
+        return {"amount": self.amount, "unit": self.unit.value}
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, Size)
+            and self.amount == other.amount
+            and self.unit is other.unit
+        )
+
+    def __repr__(self) -> str:
+        return f"Size({self.amount!r}, {self.unit.value})"
+
+
+class GeoPoint:
+    __slots__ = ("longitude", "latitude")
+
+    def __init__(self, longitude: float, latitude: float):
+        self.longitude = longitude
+        self.latitude = latitude
+
+    @classmethod
+    def from_value(cls, point: Any) -> Optional["GeoPoint"]:
+        """Returns: Point of a GeoJSON point dict ({"type", "coordinates"})
+        or None if there is no point."""
+        if point is None or isinstance(point, cls):
+            return point
+        longitude, latitude = point["coordinates"]
+        return cls(longitude=longitude, latitude=latitude)
+
+    def to_document(self) -> dict[str, str | list[float]]:
+        return {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, GeoPoint)
+            and self.longitude == other.longitude
+            and self.latitude == other.latitude
+        )
+
+    def __repr__(self) -> str:
+        return f"GeoPoint({self.longitude!r}, {self.latitude!r})"
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class FlatRecord:
+    """Compact form of a scraped flat, held by the pipeline until it is written.
+
+    Costs and sizes are kept as slotted objects with enum currencies and
+    units instead of dicts. Values that repeat across many flats, like
+    city names, are interned. The document for MongoDB is only built
+    right before writing, see to_document.
+    """
+
+    # fields in the order of FlatItem
+    FIELDS: Final[tuple[str, ...]] = (
+        "id",
+        "url",
+        "title",
+        "rooms",
+        "size",
+        "rent_costs",
+        "utilities_costs",
+        "additional_flat_costs",
+        "other_costs",
+        "deposit",
+        "street",
+        "postal_code",
+        "city_name",
+        "move_in_date",
+        "location",
+    )
+    COST_FIELDS: Final[tuple[str, ...]] = (
+        "rent_costs",
+        "utilities_costs",
+        "additional_flat_costs",
+        "other_costs",
+        "deposit",
+    )
+    _INTERNED_FIELDS: Final[tuple[str, ...]] = ("postal_code", "city_name")
+
+    __slots__ = (*FIELDS, "found_at", "search_city_name", "other_meta")
+
+    id: Optional[str]
+    url: Optional[str]
+    title: Optional[str]
+    rooms: Optional[float]
+    size: Optional[Size]
+    rent_costs: Optional[Cost]
+    utilities_costs: Optional[Cost]
+    additional_flat_costs: Optional[Cost]
+    other_costs: Optional[Cost]
+    deposit: Optional[Cost]
+    street: Optional[str]
+    postal_code: Optional[str]
+    city_name: Optional[str]
+    move_in_date: Optional[str]
+    location: Optional[GeoPoint]
+    found_at: Optional[datetime]
+    search_city_name: Optional[str]
+    # meta values besides found_at and search_city_name, usually None
+    other_meta: Optional[dict]
+
+    def __init__(self, **values: Any):
+        """
+        Args:
+            values: Field values, costs, sizes and locations
+                as Cost, Size and GeoPoint.
+                Missing fields are None.
+        """
+        for name in self.__slots__:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError(f"Unknown flat record fields: {', '.join(values)}")
+
+    @classmethod
+    def from_item(cls, item: Any) -> "FlatRecord":
+        """Creates the record from a loaded item, e.g. a FlatItem."""
+        adapter = ItemAdapter(item)
+        values: dict[str, Any] = {
+            field: adapter.get(field) for field in cls.FIELDS if field in adapter
+        }
+        for field in cls.COST_FIELDS:
+            values[field] = Cost.from_value(values.get(field))
+        values["size"] = Size.from_value(values.get("size"))
+        values["location"] = GeoPoint.from_value(values.get("location"))
+        for field in cls._INTERNED_FIELDS:
+            values[field] = _intern(values.get(field))
+
+        meta: dict = dict(adapter.get("meta") or {})
+        values["found_at"] = meta.pop("found_at", None)
+        values["search_city_name"] = _intern(meta.pop("search_city_name", None))
+        values["other_meta"] = meta or None
+        return cls(**values)
+
+    def to_document(self) -> dict[str, Any]:
+        """Returns: Document for MongoDB, in the same shape as the
+        dict of the FlatItem. Fields without a value are left out."""
+        document: dict[str, Any] = {}
+        for field in self.FIELDS:
+            value: Any = getattr(self, field)
+            if value is None:
+                continue
+            document[field] = (
+                value.to_document()
+                if isinstance(value, (Cost, Size, GeoPoint))
+                else value
+            )
+
+        meta: dict[str, Any] = dict(self.other_meta or {})
+        if self.found_at is not None:
+            meta["found_at"] = self.found_at
+        if self.search_city_name is not None:
+            meta["search_city_name"] = self.search_city_name
+        if meta:
+            document["meta"] = meta
+        return document
+
+    def __repr__(self) -> str:
+        return f"FlatRecord(id={self.id!r})"
@@ -0,0 +1,238 @@
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Final, Iterable, Optional
+
+from pymongo import IndexModel, ReplaceOne, UpdateOne
+from pymongo.collection import Collection
+
+logger = logging.getLogger()
+
+# Upper bounds of the rent per m² buckets, in 0.5 steps up to 60 per m²
+RENT_PER_SQM_BOUNDS: Final[tuple[float, ...]] = tuple(0.5 * i for i in range(1, 121))
+RENT_STATS_KEY: Final[tuple[str, ...]] = ("city_name", "postal_code", "currency")
+RENT_STATS_INDEXES: Final[list[IndexModel]] = [
+    IndexModel(
+        [(field, 1) for field in RENT_STATS_KEY], name="rent_stats_key", unique=True
+    )
+]
+# fields of the flats needed for their rent per m²
+RENT_PROJECTION: Final[dict[str, int]] = {
+    "meta.search_city_name": 1,
+    "postal_code": 1,
+    "rent_costs": 1,
+    "size": 1,
+    "_id": 0,
+}
+
+
+def rent_per_sqm(flat: dict) -> Optional[tuple[tuple[str, str, str], float]]:
+    """Returns: Key of the stats of the flat (search city, postal code, currency)
+    and its rent per m², None if the flat lacks one of them."""
+    rent_costs: Optional[dict] = flat.get("rent_costs")
+    size: Optional[dict] = flat.get("size")
+    city_name: Optional[str] = (flat.get("meta") or {}).get("search_city_name")
+    if not (rent_costs and size and city_name and flat.get("postal_code")):
+        return None
+    if not size.get("amount") or size.get("unit") != "m2":
+        return None
+    return (
+        (city_name, flat["postal_code"], rent_costs["currency"]),
+        rent_costs["value"] / size["amount"],
+    )
+
+
+class RentHistogram:
+    """Counts of the rents per m² in the buckets of RENT_PER_SQM_BOUNDS.
+
+    Histograms of the same bounds can be merged by adding the counts,
+    so the stored stats are kept up to date with one $inc per new flat.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        # last bucket holds the rents above the highest bound
+        self.counts = [0] * (len(RENT_PER_SQM_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    @classmethod
+    def from_document(cls, document: dict) -> "RentHistogram":
+        histogram = cls()
+        for bucket, count in (document.get("buckets") or {}).items():
+            histogram.counts[int(bucket)] += count
+        histogram.count = document.get("count", 0)
+        histogram.sum = document.get("sum", 0.0)
+        return histogram
+
+    def add(self, value: float):
+        self.counts[bisect_left(RENT_PER_SQM_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "RentHistogram"):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Returns: Estimate of the quantile q (0.5 for the median),
+        interpolated linearly within its bucket. None without values."""
+        if not self.count:
+            return None
+        rank: float = q * self.count
+        seen: int = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if bucket == len(RENT_PER_SQM_BOUNDS):
+                    return RENT_PER_SQM_BOUNDS[-1]
+                lower: float = RENT_PER_SQM_BOUNDS[bucket - 1] if bucket else 0.0
+                upper: float = RENT_PER_SQM_BOUNDS[bucket]
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return RENT_PER_SQM_BOUNDS[-1]
+
+    def to_document(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {
+                str(bucket): count for bucket, count in enumerate(self.counts) if count
+            },
+        }
+
+
+def rent_stats_updates(flats: Iterable[dict]) -> list[UpdateOne]:
+    """Returns: Upserts adding the new flats to their stats,
+    one per city, postal code and currency."""
+    histograms: dict[tuple, RentHistogram] = defaultdict(RentHistogram)
+    for flat in flats:
+        rent: Optional[tuple[tuple, float]] = rent_per_sqm(flat)
+        if rent:
+            histograms[rent[0]].add(rent[1])
+
+    updates: list[UpdateOne] = []
+    for key, histogram in histograms.items():
+        document: dict[str, Any] = histogram.to_document()
+        updates.append(
+            UpdateOne(
+                dict(zip(RENT_STATS_KEY, key)),
+                {
+                    "$inc": {
+                        "count": document["count"],
+                        "sum": document["sum"],
+                        **{
+                            f"buckets.{bucket}": count
+                            for bucket, count in document["buckets"].items()
+                        },
+                    }
+                },
+                upsert=True,
+            )
+        )
+    return updates
+
+
+def compute_rent_histograms(flats: Iterable[dict]) -> dict[tuple, RentHistogram]:
+    """Computes the stats of all given flats, vectorized with numpy
+    if it is installed.
+
+    Returns: Histogram per city, postal code and currency.
+    """
+    keys: dict[tuple, int] = {}
+    key_codes: list[int] = []
+    values: list[float] = []
+    for flat in flats:
+        rent: Optional[tuple[tuple, float]] = rent_per_sqm(flat)
+        if rent:
+            key_codes.append(keys.setdefault(rent[0], len(keys)))
+            values.append(rent[1])
+
+    try:
+        import numpy
+    except ImportError:
+        histograms: dict[tuple, RentHistogram] = {key: RentHistogram() for key in keys}
+        key_names: list[tuple] = list(keys)
+        for key_code, value in zip(key_codes, values):
+            histograms[key_names[key_code]].add(value)
+        return histograms
+
+    return _numpy_histograms(numpy, list(keys), key_codes, values)
+
+
+def _numpy_histograms(
+    numpy, key_names: list[tuple], key_codes: list[int], values: list[float]
+) -> dict[tuple, RentHistogram]:
+    bucket_count: int = len(RENT_PER_SQM_BOUNDS) + 1
+    codes = numpy.asarray(key_codes, dtype=numpy.int64)
+    rents = numpy.asarray(values, dtype=numpy.float64)
+    buckets = numpy.searchsorted(RENT_PER_SQM_BOUNDS, rents, side="left")
+    counts = numpy.bincount(
+        codes * bucket_count + buckets, minlength=len(key_names) * bucket_count
+    ).reshape(len(key_names), bucket_count)
+    sums = numpy.bincount(codes, weights=rents, minlength=len(key_names))
+
+    histograms: dict[tuple, RentHistogram] = {}
+    for key_code, key in enumerate(key_names):
+        histogram = RentHistogram()
+        histogram.counts = counts[key_code].tolist()
+        histogram.count = sum(histogram.counts)
+        histogram.sum = float(sums[key_code])
+        histograms[key] = histogram
+    return histograms
+
+
+def recompute_rent_stats(flats: Collection, rent_stats: Collection) -> int:
+    """Replaces the stats with ones computed from all stored flats,
+    e.g. to backfill the stats of flats stored before they were kept.
+    Should not run during a crawl, its new flats could be missed.
+
+    Returns: Amount of stored stats.
+    """
+    histograms: dict[tuple, RentHistogram] = compute_rent_histograms(
+        flats.find({}, RENT_PROJECTION, batch_size=10000)
+    )
+    if histograms:
+        rent_stats.bulk_write(
+            [
+                ReplaceOne(
+                    dict(zip(RENT_STATS_KEY, key)),
+                    {**dict(zip(RENT_STATS_KEY, key)), **histogram.to_document()},
+                    upsert=True,
+                )
+                for key, histogram in histograms.items()
+            ],
+            ordered=False,
+        )
+    for stored in rent_stats.find({}, {field: 1 for field in RENT_STATS_KEY}):
+        if tuple(stored.get(field) for field in RENT_STATS_KEY) not in histograms:
+            rent_stats.delete_one({"_id": stored["_id"]})
+    return len(histograms)
+
+
+def read_rent_stats(
+    rent_stats: Collection,
+    city_name: str,
+    postal_code: Optional[str] = None,
+    quantiles: tuple[float, ...] = (0.25, 0.5, 0.75, 0.9),
+) -> list[dict[str, Any]]:
+    """Returns: Count, mean and percentiles ("p50" is the median) of the rent
+    per m² for each postal code of the city, or only the given one."""
+    query: dict[str, str] = {"city_name": city_name}
+    if postal_code:
+        query["postal_code"] = postal_code
+
+    results: list[dict[str, Any]] = []
+    for document in rent_stats.find(query, sort=[("postal_code", 1)]):
+        histogram: RentHistogram = RentHistogram.from_document(document)
+        results.append(
+            {
+                **{field: document.get(field) for field in RENT_STATS_KEY},
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count if histogram.count else None,
+                **{f"p{round(q * 100)}": histogram.percentile(q) for q in quantiles},
+            }
+        )
+    return results
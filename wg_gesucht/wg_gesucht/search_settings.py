@@ -1,6 +1,10 @@
+import json
 import logging
+import re
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Mapping, Optional
+
+from wg_gesucht.listing_cards import ListingCard
 
 logger = logging.getLogger()
 
@@ -11,6 +15,10 @@ class SearchSettings:
     only_permanent_contracts: bool
     max_rent: Optional[int]
     min_rooms: Optional[int]
+    # only checked on the cards of the results page, see matches_card
+    min_size: Optional[float]
+    max_rent_per_sqm: Optional[float]
+    districts: list[str]
 
     def __init__(
         self,
@@ -18,6 +26,9 @@ class SearchSettings:
         only_permanent_contracts: Optional[str] = None,
         max_rent: Optional[str] = None,
         min_rooms: Optional[str] = None,
+        min_size: Optional[str] = None,
+        max_rent_per_sqm: Optional[str] = None,
+        districts: Optional[str] = None,
     ):
         self._validate_init_params(
             city_name=city_name,
@@ -25,6 +36,11 @@ class SearchSettings:
             max_rent=max_rent,
             min_rooms=min_rooms,
         )
+        self._validate_card_filter_params(
+            min_size=min_size,
+            max_rent_per_sqm=max_rent_per_sqm,
+            districts=districts,
+        )
 
         self.city_name = city_name
         self.max_rent = int(max_rent) if max_rent else None
@@ -32,6 +48,13 @@ class SearchSettings:
         self.only_permanent_contracts = bool(
             only_permanent_contracts and only_permanent_contracts.lower() == "true"
         )
+        self.min_size = float(min_size) if min_size else None
+        self.max_rent_per_sqm = float(max_rent_per_sqm) if max_rent_per_sqm else None
+        self.districts = [
+            district.strip().lower()
+            for district in (districts or "").split(",")
+            if district.strip()
+        ]
 
     def _validate_init_params(
         self,
@@ -78,13 +101,85 @@ class SearchSettings:
             if "." in min_rooms and float(min_rooms) % 0.5 != 0:
                 raise ValueError("min_rooms must be a multiple of 0.5")
 
+    def _validate_card_filter_params(
+        self,
+        min_size: Optional[str] = None,
+        max_rent_per_sqm: Optional[str] = None,
+        districts: Optional[str] = None,
+    ):
+        for name, value in [
+            ("min_size", min_size),
+            ("max_rent_per_sqm", max_rent_per_sqm),
+        ]:
+            if not value:
+                continue
+
+            if not isinstance(value, str):
+                raise TypeError(f"{name} must be of type str")
+
+            if not value.replace(".", "", 1).isnumeric():
+                raise ValueError(f"{name} must be a number")
+
+            if float(value) <= 0:
+                raise ValueError(f"{name} must be greater than 0")
+
+        if districts and not isinstance(districts, str):
+            raise TypeError("districts must be of type str")
+
+    def matches_card(self, card: ListingCard) -> bool:
+        """Checks the filters that wg-gesucht does not offer, and the rooms,
+        on the values shown on the card of a flat, before its detail page
+        is requested. Values missing on the card do not exclude the flat.
+
+        Returns: False if the flat can not match the filters.
+        """
+        if self.min_rooms and card.rooms and card.rooms < self.min_rooms:
+            return False
+        if self.min_size and card.size and card.size < self.min_size:
+            return False
+        if (
+            self.max_rent_per_sqm
+            and card.rent
+            and card.size
+            and card.rent["value"] / card.size > self.max_rent_per_sqm
+        ):
+            return False
+        if (
+            self.districts
+            and card.district
+            and not any(
+                district in card.district.lower() for district in self.districts
+            )
+        ):
+            return False
+        return True
+
+    def to_document(self) -> dict[str, Any]:
+        """Returns: The settings as dict of BSON types (str, int, float, bool,
+        list and None), e.g. to be stored with a queued request,
+        see from_document."""
+        return {key: getattr(self, key) for key in SEARCH_PROFILE_ENV_KEYS}
+
+    @classmethod
+    def from_document(cls, document: Mapping[str, Any]) -> "SearchSettings":
+        """Returns: The settings of a dict of to_document, validated again."""
+        return cls(
+            **{
+                key: _to_setting_str(document.get(key))
+                for key in SEARCH_PROFILE_ENV_KEYS
+            }
+        )
+
     def __repr__(self):
         return (
             "SearchSettings("
             f"city_name={self.city_name!r}, "
             f"only_permanent_contracts={self.only_permanent_contracts!r}, "
             f"max_rent={self.max_rent!r}, "
-            f"min_rooms={self.min_rooms!r}"
+            f"min_rooms={self.min_rooms!r}, "
+            f"min_size={self.min_size!r}, "
+            f"max_rent_per_sqm={self.max_rent_per_sqm!r}, "
+            f"districts={self.districts!r}"
             ")"
         )
 
@@ -94,6 +189,9 @@ def load_search_settings(
     only_permanent_contracts: Optional[bool],
     max_rent: Optional[int],
     min_rooms: Optional[float],
+    min_size: Optional[str] = None,
+    max_rent_per_sqm: Optional[str] = None,
+    districts: Optional[str] = None,
 ) -> SearchSettings:
     try:
         settings = SearchSettings(
@@ -101,6 +199,9 @@ def load_search_settings(
             only_permanent_contracts=only_permanent_contracts,
             max_rent=max_rent,
             min_rooms=min_rooms,
+            min_size=min_size,
+            max_rent_per_sqm=max_rent_per_sqm,
+            districts=districts,
         )
         logger.info("Starting with the following settings: ", settings)
         return settings
@@ -108,3 +209,93 @@ def load_search_settings(
         logger.error("Error while loading search settings. Please check the input.")
         logger.error(f"Error: {e}")
         raise
+
+
+SEARCH_PROFILE_ENV_KEYS: dict[str, str] = {
+    "city_name": "CITY_NAME",
+    "only_permanent_contracts": "ONLY_PERMANENT_CONTRACTS",
+    "max_rent": "MAX_RENT",
+    "min_rooms": "MIN_ROOMS",
+    "min_size": "MIN_SIZE",
+    "max_rent_per_sqm": "MAX_RENT_PER_SQM",
+    "districts": "DISTRICTS",
+}
+
+
+def _to_setting_str(value: Any) -> Optional[str]:
+    """Converts a value from a profile file to the str the settings expect."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, list):
+        return ",".join(str(item) for item in value)
+    return str(value)
+
+
+def _load_search_profiles_file(path: str) -> list[dict[str, Any]]:
+    """Loads the search profiles from a json file holding a list of objects
+    with the keys of SEARCH_PROFILE_ENV_KEYS.
+    """
+    with open(path, encoding="utf-8") as profiles_file:
+        profiles = json.load(profiles_file)
+
+    if not isinstance(profiles, list) or not all(
+        isinstance(profile, dict) for profile in profiles
+    ):
+        raise ValueError("search profiles file must contain a list of objects")
+
+    return [
+        {key: _to_setting_str(profile.get(key)) for key in SEARCH_PROFILE_ENV_KEYS}
+        for profile in profiles
+    ]
+
+
+def _load_search_profiles_env(environ: Mapping[str, str]) -> list[dict[str, Any]]:
+    """Loads the search profiles from the environment.
+
+    Numbered groups (CITY_NAME_1, MAX_RENT_1, ...) define one profile each.
+    Without numbered groups the unnumbered variables (CITY_NAME, ...) are used.
+    """
+    suffixes: list[str] = sorted(
+        {
+            match.group(1)
+            for key in environ
+            if (match := re.fullmatch(r"CITY_NAME_(\d+)", key))
+        },
+        key=int,
+    )
+    if not suffixes:
+        suffixes = [""]
+
+    return [
+        {
+            key: environ.get(f"{env_key}_{suffix}" if suffix else env_key)
+            for key, env_key in SEARCH_PROFILE_ENV_KEYS.items()
+        }
+        for suffix in suffixes
+    ]
+
+
+def load_search_profiles(environ: Mapping[str, str]) -> list[SearchSettings]:
+    """Loads all search profiles which are crawled together.
+
+    Profiles are read from the json file given by SEARCH_PROFILES_FILE,
+    otherwise from the environment. See _load_search_profiles_env.
+    """
+    profiles_file: Optional[str] = environ.get("SEARCH_PROFILES_FILE")
+    try:
+        profiles: list[dict[str, Any]] = (
+            _load_search_profiles_file(profiles_file)
+            if profiles_file
+            else _load_search_profiles_env(environ)
+        )
+    except (OSError, ValueError) as e:
+        logger.error("Error while loading search profiles. Please check the input.")
+        logger.error(f"Error: {e}")
+        raise
+
+    if not profiles:
+        raise ValueError("At least one search profile must be given")
+
+    return [load_search_settings(**profile) for profile in profiles]
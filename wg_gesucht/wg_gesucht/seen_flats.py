@@ -0,0 +1,102 @@
+import hashlib
+import math
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Union
+
+if TYPE_CHECKING:
+    # pymongo is only needed by the pipeline, spider and commands start without it
+    from pymongo.collection import Collection
+
+
+class BloomFilter:
+    """Probabilistic set of strings with a fixed memory footprint.
+
+    Membership checks can return false positives at about the given
+    error rate, but never false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self._size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._hash_count = max(round(self._size / capacity * math.log(2)), 1)
+        self._bits = bytearray(math.ceil(self._size / 8))
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest: bytes = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self._hash_count):
+            yield (first + i * second) % self._size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class SeenFlatIds:
+    """Ids of flats that are already stored in the database.
+
+    Numeric ids are kept as ints, which take about half the memory of
+    the equivalent strings. Above the bloom threshold a bloom filter is
+    used instead of a set.
+    """
+
+    _ids: Union[set[Union[int, str]], BloomFilter]
+
+    def __init__(
+        self,
+        flat_ids: Iterable[str] = (),
+        expected_amount: int = 0,
+        bloom_threshold: int = 1_000_000,
+    ):
+        self._use_bloom_filter = expected_amount > bloom_threshold
+        self._ids = (
+            BloomFilter(capacity=expected_amount) if self._use_bloom_filter else set()
+        )
+        self._amount = 0
+        for flat_id in flat_ids:
+            self.add(flat_id)
+
+    @classmethod
+    def from_collection(
+        cls,
+        collection: "Collection",
+        bloom_threshold: int = 1_000_000,
+        seen_since: Optional[datetime] = None,
+    ) -> "SeenFlatIds":
+        """Loads the ids of the flats stored in the given collection.
+        With seen_since only of the flats scraped since then (meta.last_seen_at),
+        so the others are requested again and their changes are tracked."""
+        query: dict[str, Any] = (
+            {"meta.last_seen_at": {"$gte": seen_since}} if seen_since else {}
+        )
+        documents = collection.find(query, projection={"id": True, "_id": False})
+        return cls(
+            flat_ids=(document["id"] for document in documents if "id" in document),
+            expected_amount=collection.estimated_document_count(),
+            bloom_threshold=bloom_threshold,
+        )
+
+    def _key(self, flat_id: Union[int, str]) -> Union[int, str]:
+        flat_id = str(flat_id).strip()
+        if self._use_bloom_filter:
+            return flat_id
+        return int(flat_id) if flat_id.isdigit() else flat_id
+
+    def add(self, flat_id: Union[int, str]):
+        key: Union[int, str] = self._key(flat_id)
+        if key not in self._ids:
+            self._ids.add(key)
+            self._amount += 1
+
+    def __contains__(self, flat_id: Union[int, str]) -> bool:
+        return self._key(flat_id) in self._ids
+
+    def __len__(self) -> int:
+        return self._amount
@@ -1,8 +1,4 @@
 import os
-from typing import Final
-
-from wg_gesucht.db_settings import DatabaseSettings, load_db_settings
-from wg_gesucht.search_settings import SearchSettings, load_search_settings
 
 # Scrapy settings for wg_gesucht project
 #
@@ -17,6 +13,7 @@ BOT_NAME = "wg_gesucht"
 
 SPIDER_MODULES = ["wg_gesucht.spiders"]
 NEWSPIDER_MODULE = "wg_gesucht.spiders"
+COMMANDS_MODULE = "wg_gesucht.commands"
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -51,28 +48,127 @@ DOWNLOAD_DELAY = 3
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-# SPIDER_MIDDLEWARES = {
-#    "wg_gesucht.middlewares.WgGesuchtSpiderMiddleware": 543,
-# }
+SPIDER_MIDDLEWARES = {
+    # closest to the spider, so only the callbacks are timed
+    "wg_gesucht.metrics.CallbackTimingMiddleware": 1000,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "wg_gesucht.middlewares.WgGesuchtDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    "wg_gesucht.middlewares.ResponseArchiveMiddleware": 540,
+    "wg_gesucht.middlewares.ConditionalRequestCacheMiddleware": 543,
+    "wg_gesucht.middlewares.StripPageMiddleware": 530,
+}
+
+# Memory per crawl is bounded, so the concurrency can be raised within the memory
+# limit of the container. No new requests are sent while the responses waiting for
+# or in their callback hold more than SCRAPER_SLOT_MAX_ACTIVE_SIZE bytes. Responses
+# above DOWNLOAD_MAXSIZE bytes are dropped. Scripts, styles and ad cards are
+# removed from detail pages before they are parsed (STRIP_PAGES_ENABLED).
+SCRAPER_SLOT_MAX_ACTIVE_SIZE = 2_000_000
+DOWNLOAD_MAXSIZE = 4 * 1024 * 1024
+STRIP_PAGES_ENABLED = True
+
+# Pages with an ETag or Last-Modified header are stored on disk and revalidated
+# with conditional requests. Unchanged pages (304) are served from the store.
+# Pages stored or revalidated longer than the max age (in seconds) ago are
+# downloaded in full again and deleted from the store at the end of a crawl.
+CONDITIONAL_CACHE_ENABLED = True
+CONDITIONAL_CACHE_DIR = ".cache/pages"
+CONDITIONAL_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Every response is recorded in a new gzip json lines file in ARCHIVE_DIR per crawl,
+# to parse the flats again later with `scrapy replay` (without the network).
+ARCHIVE_ENABLED = os.environ.get("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_DIR = ".cache/archive"
+
+# With DISTRIBUTED_CRAWL several workers crawl together: they share the queue of
+# requests and the seen request fingerprints in the flats database. A claimed
+# request is given to another worker if it is not done within the lease (in
+# seconds), up to FRONTIER_MAX_CLAIMS times. Seen fingerprints expire after the ttl.
+if os.environ.get("DISTRIBUTED_CRAWL", "false").lower() == "true":
+    SCHEDULER = "wg_gesucht.frontier.MongoScheduler"
+    DUPEFILTER_CLASS = "wg_gesucht.frontier.MongoDupeFilter"
+    DOWNLOADER_MIDDLEWARES["wg_gesucht.middlewares.FrontierFailureMiddleware"] = 950
+FRONTIER_QUEUE_COLLECTION = "frontier_requests"
+FRONTIER_FINGERPRINT_COLLECTION = "frontier_fingerprints"
+FRONTIER_LEASE_SECONDS = 300
+FRONTIER_MAX_CLAIMS = 3
+FRONTIER_FINGERPRINT_TTL = 24 * 60 * 60
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-# }
+EXTENSIONS = {
+    "wg_gesucht.metrics.CrawlMetrics": 500,
+    "wg_gesucht.notifications.FlatNotifier": 510,
+}
+
+# Latencies of the spider callbacks and database writes plus crawl counters.
+# Served in the Prometheus format on http://127.0.0.1:METRICS_PORT/metrics while
+# crawling (unset to disable) and written as json to METRICS_DUMP_PATH on close.
+METRICS_ENABLED = True
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_DUMP_PATH = ".cache/metrics.json"
+
+# Queries for the stored flats are served as json on http://127.0.0.1:QUERY_PORT/flats
+# by `scrapy serve_flats`, and by `scrapy daemon` if set. Results are cached for
+# QUERY_CACHE_TTL seconds, in the daemon new flats drop them right away.
+QUERY_PORT = os.environ.get("QUERY_PORT")
+QUERY_CACHE_TTL = 30
+
+# New flats are notified to "stdout", a file path or a webhook url (json POST).
+# Flats stored within the coalesce window (in seconds) are sent as one message,
+# failed messages are retried with a doubling delay.
+NOTIFICATION_SINK = os.environ.get("NOTIFICATION_SINK")
+NOTIFICATION_COALESCE_SECONDS = 5
+NOTIFICATION_MAX_RETRIES = 3
+NOTIFICATION_RETRY_DELAY = 1
+NOTIFICATION_TIMEOUT = 10
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+# AsyncWgGesuchtPipeline writes without blocking the reactor,
+# WgGesuchtPipeline is the blocking variant.
 ITEM_PIPELINES = {
-    "wg_gesucht.pipelines.WgGesuchtPipeline": 300,
+    "wg_gesucht.pipelines.AsyncWgGesuchtPipeline": 300,
 }
 
+# Flats are buffered and written with unordered bulk inserts once the batch
+# is full or the flush interval (in seconds) has passed. 1 disables buffering.
+# Buffered flats are stored, and notified, up to the flush interval later,
+# so raise the batch size only for large crawls, e.g. to 50.
+DB_WRITE_BATCH_SIZE = 1
+DB_WRITE_FLUSH_INTERVAL = 10
+# Database calls of the AsyncWgGesuchtPipeline running at the same time.
+DB_MAX_IN_FLIGHT_WRITES = 4
+
+# Detail pages of flats that are already stored are not requested again.
+# Above the threshold the stored ids are kept in a bloom filter instead of a set.
+SKIP_SEEN_FLATS = True
+SEEN_FLATS_BLOOM_THRESHOLD = 1_000_000
+# Stored flats not scraped within these hours are requested again when listed,
+# so their changes are tracked, see meta.changes. Costs one detail request per
+# listed flat and period. 0 never requests stored flats again.
+SEEN_FLATS_RECHECK_HOURS = 24
+
+# City ids are cached in a local file, so the city lookup request is only sent
+# when the id is missing or older than the ttl (in seconds). Unset to disable.
+CITY_ID_CACHE_PATH = os.environ.get("CITY_ID_CACHE_PATH", ".cache/city_ids.json")
+CITY_ID_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Results are sorted new -> old. Further result pages are only requested until a
+# page holds an already stored flat or one online longer than the max age.
+MAX_PAGES = 5
+# MAX_LISTING_AGE_HOURS = 24
+
+# `scrapy daemon` polls each city on its own interval (in seconds), chosen so
+# about DAEMON_TARGET_NEW_FLATS new flats are found per run.
+DAEMON_MIN_INTERVAL = 300
+DAEMON_MAX_INTERVAL = 3600
+DAEMON_TARGET_NEW_FLATS = 1
+DAEMON_RATE_SMOOTHING = 0.3
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 # AUTOTHROTTLE_ENABLED = True
@@ -100,15 +196,30 @@ REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
-# Loading Search Settings from env
-SEARCH_SETTINGS: Final[SearchSettings] = load_search_settings(
-    city_name=os.environ.get("CITY_NAME"),
-    only_permanent_contracts=os.environ.get("ONLY_PERMANENT_CONTRACTS"),
-    max_rent=os.environ.get("MAX_RENT"),
-    min_rooms=os.environ.get("MIN_ROOMS"),
-)
-
-DB_SETTINGS: Final[DatabaseSettings] = load_db_settings(
-    connection_uri=os.environ.get("DB_URI"),
-    db_name=os.environ.get("DB_NAME"),
+# Search profiles (SEARCH_PROFILES) and database settings (DB_SETTINGS) are
+# loaded from the environment on first use, so commands that do not crawl
+# start without them. See load_search_profiles and load_db_settings_from_env.
+#
+# Creating the indexes needs a round trip to the database on every start.
+# Disable it after creating them once with `scrapy bootstrap_db`.
+DB_ENSURE_INDEXES = True
+
+# The pipeline adds the rent per m² of new flats to histograms per city and
+# postal code in this collection, read them with `scrapy rent_stats <city>`.
+# Unset to not keep them.
+RENT_STATS_COLLECTION = "rent_stats"
+
+# The pipeline adds the centroid of the postal code of a flat as GeoJSON point
+# (location) to it, read from this table. Build it from the GeoNames postal codes
+# with `scrapy build_gazetteer`. Without the table flats are stored without location.
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", "data/postal_codes_de.bin")
+
+# `scrapy export_flats` reads this many flats per round trip and writes them
+# as one chunk. `--incremental` continues after the flat stored in the watermark.
+EXPORT_CHUNK_SIZE = 1000
+# Flats written in the last seconds are left to the next export, as writes of
+# an older write time can still be in flight (async pipeline, other workers).
+EXPORT_SETTLE_SECONDS = 60
+EXPORT_WATERMARK_PATH = os.environ.get(
+    "EXPORT_WATERMARK_PATH", ".cache/export_watermark.json"
 )
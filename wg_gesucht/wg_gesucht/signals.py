@@ -0,0 +1,13 @@
+"""Signals of the project, in addition to the ones of Scrapy.
+
+See https://docs.scrapy.org/en/latest/topics/signals.html
+"""
+
+# Sent by the pipeline after new flats were written, not for updated or
+# duplicate flats. Args: flats (list of the inserted documents)
+flats_inserted = object()
+
+# Sent by the FrontierFailureMiddleware if a request claimed from the shared queue
+# failed before it reached the downloader, e.g. was ignored by a downloader
+# middleware, so the MongoScheduler removes it. Args: request, spider
+frontier_request_failed = object()
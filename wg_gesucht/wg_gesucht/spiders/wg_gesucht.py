@@ -1,40 +1,142 @@
 import json
 import logging
+import os
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Final, Optional
 from urllib.parse import urlencode
 
-from itemloaders.processors import TakeFirst
 from scrapy import Request, Selector, Spider
+from wg_gesucht.city_id_cache import CityIdCache
+from wg_gesucht.extractors import FlatDetailExtractor
 from wg_gesucht.items import FlatItem
-from wg_gesucht.loaders import FlatItemLoader
-from wg_gesucht.search_settings import SearchSettings
+from wg_gesucht.listing_cards import ListingCard
+from wg_gesucht.normalizers import normalize_flat
+from wg_gesucht.pages import release_parsed_page
+from wg_gesucht.search_settings import SearchSettings, load_search_profiles
+from wg_gesucht.seen_flats import SeenFlatIds
+
+# Scrapy downloads requests with a higher priority first. City and search
+# requests go first, so the newest flats of all profiles are known before
+# the download delay is spent on their detail pages.
+SEARCH_REQUEST_PRIORITY: Final[int] = 100
+# Detail requests are ordered by the age hint on the card in steps,
+# ties (and cards without hint) by their position in the results.
+DETAIL_REQUEST_PRIORITY: Final[int] = 0
+FRESHNESS_STEP: Final[timedelta] = timedelta(minutes=15)
+MAX_FRESHNESS_STEPS: Final[int] = 96
+MAX_RANK: Final[int] = 99
+
+
+def detail_request_priority(card: ListingCard, rank: int) -> int:
+    """Returns: Priority of the detail request for the card, higher for newer
+    flats. Rank is the position of the card in all results of its search."""
+    steps: int = (
+        int(card.online_since / FRESHNESS_STEP)
+        if card.online_since is not None
+        else MAX_FRESHNESS_STEPS
+    )
+    return (
+        DETAIL_REQUEST_PRIORITY
+        - min(steps, MAX_FRESHNESS_STEPS) * (MAX_RANK + 1)
+        - min(rank, MAX_RANK)
+    )
 
 
 class WgGesuchtSpider(Spider):
     name = "wg_gesucht"
-    _search_settings: SearchSettings
+    _search_profiles: list[SearchSettings]
+    _city_id_cache: Optional[CityIdCache] = None
+    _max_pages: int = 1
+    _max_listing_age: Optional[timedelta] = None
     _logger = logging.getLogger()
+    seen_flat_ids: SeenFlatIds
+
+    def __init__(
+        self,
+        *args,
+        search_profiles: Optional[list[SearchSettings]] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            search_profiles: Profiles to crawl instead of SEARCH_PROFILES,
+                e.g. the due cities of the daemon command.
+        """
+        super().__init__(*args, **kwargs)
+        # filled with the stored flat ids by the pipeline, see SKIP_SEEN_FLATS
+        self.seen_flat_ids = SeenFlatIds()
+        self._search_profile_override = search_profiles
 
     def start_requests(self):
-        """Starts the scraping process with getting the settings
+        """Starts the scraping process with getting the search profiles.
+        All profiles are crawled concurrently by this spider, so they share
+        the download delay and the database connection.
+
+        Returns: Per search profile a request for the flat search if the city id
+        is cached, otherwise a request for the city id which is needed
+        for further requests.
+        """
+        self._search_profiles = (
+            self._search_profile_override
+            or self.settings.getlist("SEARCH_PROFILES")
+            or load_search_profiles(os.environ)
+        )
+        self._city_id_cache = self._load_city_id_cache()
+        self._max_pages = self.settings.getint("MAX_PAGES", 1)
+        max_listing_age_hours: Optional[float] = self.settings.getfloat(
+            "MAX_LISTING_AGE_HOURS"
+        )
+        self._max_listing_age = (
+            timedelta(hours=max_listing_age_hours) if max_listing_age_hours else None
+        )
+
+        for search_settings in self._search_profiles:
+            yield self._build_city_request(search_settings=search_settings)
 
-        Returns: Request for the city id which is needed for further requests.
+    def _build_city_request(self, search_settings: SearchSettings) -> Request:
+        """Returns: Request for the flat search if the city id is cached,
+        otherwise request for the city id.
         """
-        self._search_settings: SearchSettings = self.settings.get("SEARCH_SETTINGS")
+        if self._city_id_cache:
+            city_id: Optional[str] = self._city_id_cache.get(search_settings.city_name)
+            if city_id:
+                self._logger.info(
+                    f"Using cached city id {city_id} for '{search_settings.city_name}'"
+                )
+                return self._build_search_request(
+                    search_settings=search_settings, city_id=city_id
+                )
 
         base_url: Final[str] = "https://www.wg-gesucht.de/ajax/getCities.php?"
         params: Final[dict[str, str]] = {
             "country_parameter:": "",
-            "query": self._search_settings.city_name[0],
+            "query": search_settings.city_name,
         }
         url: Final[str] = base_url + urlencode(params)
-        yield Request(url=url, callback=self.parse_city_response)
+        # profiles can share a city, so the lookup must not be filtered as duplicate
+        return Request(
+            url=url,
+            callback=self.parse_city_response,
+            cb_kwargs={"search_settings": search_settings},
+            dont_filter=True,
+            priority=SEARCH_REQUEST_PRIORITY,
+        )
+
+    def _load_city_id_cache(self) -> Optional[CityIdCache]:
+        """Returns: City id cache or None if CITY_ID_CACHE_PATH is not set."""
+        path: Optional[str] = self.settings.get("CITY_ID_CACHE_PATH")
+        if not path:
+            return None
+        return CityIdCache(
+            path=path, ttl=self.settings.getfloat("CITY_ID_CACHE_TTL", 604800)
+        )
 
-    def parse_city_response(self, response) -> Optional[Request]:
+    def parse_city_response(
+        self, response, search_settings: SearchSettings
+    ) -> Optional[Request]:
         """Parses the response from the city request. If the city id could
-        not be retrieved, the spider is stopped.
+        not be retrieved, the search profile is skipped.
 
         Returns: Request for the flat search with the extracted city id.
         """
@@ -45,37 +147,63 @@ class WgGesuchtSpider(Spider):
         city_data: Final[dict] = json.loads(response.body)
 
         city_id: Final[Optional[str]] = self._get_city_id_from_city_data(
-            city_data=city_data
+            city_data=city_data, city_name=search_settings.city_name
         )
         if not city_id:
-            self._logger.error(f"City '{self._search_settings.city_name}' not found")
+            self._logger.error(f"City '{search_settings.city_name}' not found")
             return
         else:
-            params: Final[dict] = self._load_search_request_params()
-            city_name: Final[str] = self._remove_umlaute(
-                self._search_settings.city_name
-            )
-            yield Request(
-                (
-                    "https://www.wg-gesucht.de/1-zimmer-wohnungen-und-wohnungen-in-"
-                    f"{city_name}.{city_id}.1+2.1.0.html?"
-                    f"{urlencode(params)}&city_id={city_id}"
-                ),
-                callback=self.parse_flat_detail_links,
+            if self._city_id_cache:
+                self._city_id_cache.set(search_settings.city_name, city_id)
+            yield self._build_search_request(
+                search_settings=search_settings, city_id=city_id
             )
 
-    def _get_city_id_from_city_data(self, city_data: dict) -> Optional[str]:
+    def _build_search_request(
+        self,
+        search_settings: SearchSettings,
+        city_id: str,
+        page: int = 0,
+        priority: int = SEARCH_REQUEST_PRIORITY,
+    ) -> Request:
+        """Returns: Request for the given page of the flat search in the city."""
+        params: Final[dict] = self._load_search_request_params(
+            search_settings=search_settings
+        )
+        city_name: Final[str] = self._remove_umlaute(search_settings.city_name)
+        return Request(
+            (
+                "https://www.wg-gesucht.de/1-zimmer-wohnungen-und-wohnungen-in-"
+                f"{city_name}.{city_id}.1+2.1.{page}.html?"
+                f"{urlencode(params)}&city_id={city_id}"
+            ),
+            callback=self.parse_flat_detail_links,
+            cb_kwargs={
+                "search_settings": search_settings,
+                "city_id": city_id,
+                "page": page,
+            },
+            # results change between crawls, a shared dupefilter must not drop them
+            dont_filter=True,
+            priority=priority,
+        )
+
+    def _get_city_id_from_city_data(
+        self, city_data: dict, city_name: str
+    ) -> Optional[str]:
         """Gets the city id from the city data. The city data is the json
         response from the city id request. See the start_requests method.
 
         Returns: City id as string or None if the city id was not found.
         """
-        city_name: str = self._search_settings.city_name.lower()
+        city_name = city_name.lower()
         for city_info in city_data:
             if city_name == city_info["city_name"].lower():
                 return city_info["city_id"]
 
-    def _load_search_request_params(self) -> dict[str, str]:
+    def _load_search_request_params(
+        self, search_settings: SearchSettings
+    ) -> dict[str, str]:
         """Loads the parameters for the flat search request.
 
         Does not check validity of the user search settings.
@@ -83,11 +211,9 @@ class WgGesuchtSpider(Spider):
 
         Returns: dict with the parameters for the flat search request
         """
-        min_rooms: Final[Optional[int]] = self._search_settings.min_rooms
-        max_rent: Final[Optional[int]] = self._search_settings.max_rent
-        only_permanent_contracts: Final[
-            bool
-        ] = self._search_settings.only_permanent_contracts
+        min_rooms: Final[Optional[int]] = search_settings.min_rooms
+        max_rent: Final[Optional[int]] = search_settings.max_rent
+        only_permanent_contracts: Final[bool] = search_settings.only_permanent_contracts
 
         params: Final[dict] = {
             "offer_filter": 1,
@@ -121,12 +247,25 @@ class WgGesuchtSpider(Spider):
         }
         return text.translate(str.maketrans(umlaut_replacements))
 
-    def parse_flat_detail_links(self, response) -> Optional[Request]:
-        """Parses the response from the flat search request.
-        We are at the first page of the flat search results.
+    def parse_flat_detail_links(
+        self,
+        response,
+        search_settings: SearchSettings,
+        city_id: Optional[str] = None,
+        page: int = 0,
+    ) -> Optional[Request]:
+        """Parses the response from a page of the flat search request.
         Extracts all the links to the flat detail pages.
+        Flats that are already stored, older than MAX_LISTING_AGE_HOURS
+        or not matching the card filters of the search settings are skipped.
+
+        Results are sorted new -> old, so the next page is only requested
+        while the page held neither a stored nor a too old flat,
+        up to MAX_PAGES pages. Newer flats get a higher request priority,
+        the next page is requested right after the oldest flat of this page.
 
-        Returns: Requests for the detail page of the flats.
+        Returns: Requests for the detail page of the flats
+        and the next page of the results.
         """
 
         # not containing onclick, because thats just an ad
@@ -135,89 +274,107 @@ class WgGesuchtSpider(Spider):
             and not(contains(@onclick, " "))]'
         )
 
-        for flat_container in flat_item_containers:
-            flat_detail_link: Final[Selector] = flat_container.xpath(
-                ".//div/div/div/div/h3/a/@href"
-            ).get()
-
+        reached_known_flats: bool = False
+        lowest_priority: int = SEARCH_REQUEST_PRIORITY
+        for position, flat_container in enumerate(flat_item_containers):
+            card: ListingCard = ListingCard.from_selector(flat_container)
+
+            if card.flat_id and card.flat_id in self.seen_flat_ids:
+                self._logger.debug(f"Skipping already stored flat {card.flat_id}")
+                self._inc_stat("flats/skipped_seen")
+                reached_known_flats = True
+                continue
+
+            if self._is_too_old(card):
+                self._logger.debug(f"Skipping flat {card.flat_id} online too long")
+                reached_known_flats = True
+                continue
+
+            if not search_settings.matches_card(card):
+                self._logger.debug(f"Skipping flat {card.flat_id} not matching")
+                self._inc_stat("flats/skipped_filtered")
+                continue
+
+            priority: int = detail_request_priority(
+                card, rank=page * len(flat_item_containers) + position
+            )
+            lowest_priority = min(lowest_priority, priority)
             yield response.follow(
-                flat_detail_link,
+                card.detail_link,
                 callback=self.parse_flat,
+                cb_kwargs={"search_settings": search_settings},
+                meta={"strip_page": True},
+                priority=priority,
             )
 
-    def parse_flat(self, response) -> FlatItem:
+        if (
+            flat_item_containers
+            and not reached_known_flats
+            and city_id
+            and page + 1 < self._max_pages
+        ):
+            # its flats are older than all flats of this page
+            yield self._build_search_request(
+                search_settings=search_settings,
+                city_id=city_id,
+                page=page + 1,
+                priority=lowest_priority - 1,
+            )
+
+    def _inc_stat(self, key: str):
+        crawler = getattr(self, "crawler", None)
+        if crawler and crawler.stats:
+            crawler.stats.inc_value(key)
+
+    def _is_too_old(self, card: ListingCard) -> bool:
+        return bool(
+            self._max_listing_age
+            and card.online_since
+            and card.online_since > self._max_listing_age
+        )
+
+    def parse_flat(self, response, search_settings: SearchSettings) -> FlatItem:
         """Parses the response from the flat detail page
         and extracts the flat data.
 
-        For item transformation see the FlatItemLoader class.
+        For value extraction see the FlatDetailExtractor class.
+        For value normalization see the normalizers module.
+        The parsed tree of the page is released before the item is built.
 
         Returns: FlatItem with the extracted data. (Flats go to the pipeline from here)
         """
-        flat_loader: Final[FlatItemLoader] = FlatItemLoader(
-            item=FlatItem(), response=response
+        values: Final[dict[str, list[str]]] = FlatDetailExtractor.extract(
+            response.selector.root
         )
-        flat_loader.add_xpath("id", "//div/i/@data-ad_id")
-        flat_loader.add_value("url", response.request.url)
+        # the values are plain strings, the tree is not needed for the item
+        release_parsed_page(response)
 
-        flat_loader.add_xpath("title", "//title/text()")
-        basic_facts: Final[FlatItemLoader] = flat_loader.nested_xpath(
-            '//div[@id="basic_facts_wrapper"]/div[@id="rent_wrapper"]'
-        )
-        basic_facts.add_xpath(
+        raw_values: Final[dict[str, object]] = {
+            "id": values["id"],
+            "url": response.request.url,
+        }
+        for field in (
+            "title",
             "rooms",
-            './/div[@class="basic_facts_bottom_part"]/label[@class="amount"]/text()',
-        )
-        basic_facts.add_xpath(
             "size",
-            './/div[@class="basic_facts_top_part"]/label[@class="amount"]/text()',
-        )
-
-        flat_loader.add_xpath(
-            "rent_costs", '//div[@id="rent"]/label[@class="graph_amount"]/text()'
-        )
-        flat_loader.add_xpath(
+            "rent_costs",
             "utilities_costs",
-            '//div[@id="utilities_costs"]/label[@class="graph_amount"]/text()',
-        )
-        flat_loader.add_xpath(
             "additional_flat_costs",
-            '//div[@id="misc_costs"]/label[@class="graph_amount"]/text()',
-        )
+            "deposit",
+            "other_costs",
+        ):
+            raw_values[field] = values[field]
 
-        provision_equipment_xpath: Final[str] = '//div[@class="provision-equipment"]'
-        description_path: Final[str] = '/label[@class="description"]/text()'
-        assert "kaution" in flat_loader.get_xpath(
-            f"{provision_equipment_xpath}[1]{description_path}", TakeFirst(), str.lower
-        )
-        assert "ablösevereinbarung" in flat_loader.get_xpath(
-            f"{provision_equipment_xpath}[2]{description_path}", TakeFirst(), str.lower
-        )
-        amount_path: Final[str] = '/label[@class="amount"]/text()'
-        flat_loader.add_xpath("deposit", f"{provision_equipment_xpath}[1]{amount_path}")
-        flat_loader.add_xpath(
-            "other_costs", f"{provision_equipment_xpath}[2]{amount_path}"
-        )
+        address_strings: Final[list[str]] = values["address"]
 
-        address_strings: Final[list[str] | None] = response.xpath(
-            '//a[@href="#mapContainer"]/text()'
-        ).getall()
-
-        flat_loader.add_value("street", address_strings[0])
+        raw_values["street"] = address_strings[0]
         postal_code, city_name = re.split(r"(?<=\d)\s", address_strings[1], maxsplit=1)
-        flat_loader.add_value("postal_code", postal_code)
-        flat_loader.add_value("city_name", city_name)
-
-        move_in_date_txt: Final[str] = response.xpath(
-            '//div[@class="col-sm-3"]/p/b/text()'
-        ).get()
-        flat_loader.add_value("move_in_date", move_in_date_txt)
-
-        flat_loader.add_value(
-            "meta",
-            {
-                "found_at": datetime.utcnow(),
-                "search_city_name": self._search_settings.city_name,
-            },
-        )
+        raw_values["postal_code"] = postal_code
+        raw_values["city_name"] = city_name
+        raw_values["move_in_date"] = next(iter(values["move_in_date"]), None)
+        raw_values["meta"] = {
+            "found_at": datetime.utcnow(),
+            "search_city_name": search_settings.city_name,
+        }
 
-        yield flat_loader.load_item()
+        yield FlatItem(normalize_flat(raw_values))